@@ -0,0 +1,18 @@
+"""Django application configuration of auth_backends."""
+from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+
+
+class AuthBackendsConfig(AppConfig):
+    """Connects the receivers invalidating the users cached by auth_backends."""
+    name = 'auth_backends'
+
+    def ready(self):
+        # Imported here, once the models are loaded. Importing user_cache connects its user_changed receiver, so that
+        # the snapshots are also invalidated by processes that never authenticate a user, e.g. management commands.
+        from auth_backends import signals, user_cache  # pylint: disable=import-outside-toplevel,unused-import
+
+        User = get_user_model()
+        post_save.connect(signals.send_saved_user_changed, sender=User, dispatch_uid='auth_backends.user_changed')
+        post_delete.connect(signals.send_saved_user_changed, sender=User, dispatch_uid='auth_backends.user_changed')
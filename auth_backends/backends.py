@@ -2,13 +2,27 @@
 
 For more information visit https://docs.djangoproject.com/en/dev/topics/auth/customizing/.
 """
+import asyncio
+import functools
 import logging
+import time
+from urllib.parse import urlsplit
+
 import jwt
-from django.contrib.auth import logout
+import requests
+from asgiref.sync import sync_to_async
+from django.contrib.auth import logout, user_logged_out
+from django.contrib.auth.models import AnonymousUser
 from django.dispatch import Signal
 from social_core.backends.oauth import BaseOAuth2
+from social_core.exceptions import AuthConnectionError, AuthTokenError, AuthUnreachableProvider
+from social_core.utils import module_member, user_agent, wrap_access_token_error
 from edx_django_utils.monitoring import set_custom_attribute
 
+from auth_backends import coalescing, dispatch, http, jwks, ratelimit, session_index, user_cache
+from auth_backends.claims import ClaimsMapping, decode_jwt_payload
+from auth_backends.instrumentation import record_access_token_request_duration
+
 logger = logging.getLogger(__name__)
 
 PROFILE_CLAIMS_TO_DETAILS_KEY_MAP = {
@@ -21,6 +35,27 @@ PROFILE_CLAIMS_TO_DETAILS_KEY_MAP = {
     'user_id': 'user_id',
 }
 
+# Values of the SESSION_CLEANUP_MODE setting, which controls how EdXOAuth2.start logs out a previously logged in user.
+SESSION_CLEANUP_LOGOUT = 'logout'
+SESSION_CLEANUP_ROTATE = 'rotate'
+
+# Event identifying the logout tokens of OpenID Connect Back-Channel Logout.
+BACKCHANNEL_LOGOUT_EVENT = 'http://schemas.openid.net/event/backchannel-logout'
+
+# Default maximum age, in seconds, of the logout tokens accepted by EdXOAuth2.verify_logout_token.
+DEFAULT_LOGOUT_TOKEN_MAX_AGE = 120
+
+# Provider URLs built by EdXOAuth2, keyed by (strategy class, backend class, URL name). Values are
+# (settings version, URL) pairs.
+_url_cache = {}
+
+
+class ProviderUnavailable(AuthUnreachableProvider):
+    """Raised, without contacting the provider, while the circuit breaker for the provider is open."""
+
+    def __str__(self):
+        return 'The authentication provider is unavailable'
+
 
 def _to_language(locale):
     """Convert locale name to language code if necessary.
@@ -59,21 +94,61 @@ class EdXOAuth2(BaseOAuth2):
     ]
 
     # local only (not part of social-auth)
+    # Subclasses can extend these declaratively; they are compiled into a single ClaimsMapping per class, see
+    # get_claims_mapping().
     CLAIMS_TO_DETAILS_KEY_MAP = PROFILE_CLAIMS_TO_DETAILS_KEY_MAP
+    ROLE_CLAIMS_TO_DETAILS_KEY_MAP = {
+        'administrator': 'is_staff',
+        'superuser': 'is_superuser',
+    }
+    # Limits the scope of languages we can use
+    CLAIM_TRANSFORMS = {
+        'locale': _to_language,
+    }
+    CLAIM_DEFAULTS = {
+        'administrator': False,
+        'superuser': False,
+    }
 
     # This signal is fired after the user has successfully logged in.
     # providing_args=['user']
     auth_complete_signal = Signal()
+    # This signal is fired with batches of logged in users, when the dispatch of auth_complete_signal is deferred.
+    # providing_args=['users']
+    auth_complete_batch_signal = Signal()
+
+    # Token response (or HTTP error) fetched by aprefetch_access_token(), consumed by request_access_token().
+    _prefetched_access_token = None
 
     @property
-    # pylint: disable= missing-function-docstring
     def logout_url(self):
+        return self._cached_url('logout_url', self._build_logout_url)
+
+    def _build_logout_url(self):
+        """Build the provider's logout URL, including the redirect URL if one is configured."""
         if self.setting('LOGOUT_REDIRECT_URL'):
             return f"{self.end_session_url()}?client_id={self.setting('KEY')}&" \
                    f"redirect_url={self.setting('LOGOUT_REDIRECT_URL')}"
         else:
             return self.end_session_url()
 
+    def _cached_url(self, name, build):
+        """Return the URL produced by ``build``, cached for the strategy's current settings snapshot.
+
+        The provider URLs only depend on settings, so they are built once per settings snapshot. URLs are not cached
+        for strategies without a ``settings_version`` (e.g. the social-auth test strategy, or strategies resolving
+        settings per site, see ``EdxDjangoStrategy.memoize_settings``).
+        """
+        version = getattr(self.strategy, 'settings_version', None)
+        if version is None:
+            return build()
+
+        key = (type(self.strategy), type(self), name)
+        cached = _url_cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = _url_cache[key] = (version, build())
+        return cached[1]
+
     def start(self):
         """Initialize OAuth authentication with session cleanup."""
 
@@ -98,20 +173,187 @@ class EdXOAuth2(BaseOAuth2):
                 existing_username
             )
 
-            logout(request)
+            if self.setting('SESSION_CLEANUP_MODE', SESSION_CLEANUP_LOGOUT) == SESSION_CLEANUP_ROTATE:
+                self._clear_session(request)
+            else:
+                logout(request)
 
         return super().start()
 
+    def _clear_session(self, request):
+        """Log the user out by clearing the session's data in place.
+
+        Unlike ``logout``, which deletes the session and makes the state stored by ``start`` create a new one,
+        the existing session is reused, so the begin request only updates a single session row. The session key is
+        still rotated before anyone is logged in again, because ``login`` cycles the key of any session without an
+        authenticated user.
+        """
+        user = request.user
+        user_logged_out.send(sender=user.__class__, request=request, user=user)
+        request.session.clear()
+        request.user = AnonymousUser()
+
     def authorization_url(self):
-        url_root = self.get_public_or_internal_url_root()
-        return f'{url_root}/oauth2/authorize'
+        return self._cached_url(
+            'authorization_url', lambda: f'{self.get_public_or_internal_url_root()}/oauth2/authorize'
+        )
 
     def access_token_url(self):
         return f"{self.setting('URL_ROOT')}/oauth2/access_token"
 
     def end_session_url(self):
-        url_root = self.get_public_or_internal_url_root()
-        return f'{url_root}/logout'
+        return self._cached_url('end_session_url', lambda: f'{self.get_public_or_internal_url_root()}/logout')
+
+    def request(self, url, *, method='GET', headers=None, data=None, json=None, auth=None, params=None,
+                timeout=None):
+        """Make a request to the provider using the process-wide pooled session.
+
+        This mirrors ``BaseAuth.request``, but reuses keep-alive connections instead of opening a new connection for
+        every call. Unless a timeout is given, or configured via ``REQUESTS_TIMEOUT``/``URLOPEN_TIMEOUT``, separate
+        connect and read timeouts are used.
+
+        Services can opt in to retries and circuit breaking. With ``RETRIES`` set, failed requests are retried (see
+        ``http.is_retryable``) up to that many times, with jittered exponential backoff. With
+        ``CIRCUIT_BREAKER_FAILURE_THRESHOLD`` set, once that many consecutive requests to the provider have failed,
+        requests fail fast with :class:`ProviderUnavailable` for ``CIRCUIT_BREAKER_RESET_TIMEOUT`` seconds.
+        """
+        options, pool = self._request_options(headers, timeout)
+        session = http.get_session(**pool)
+        breaker = self._get_circuit_breaker(url)
+
+        attempt = 0
+        while True:
+            self._before_provider_request(breaker)
+            try:
+                response = session.request(method, url, data=data, json=json, auth=auth, params=params, **options)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                delay = self._after_provider_request(method, attempt, breaker, error=err)
+            except BaseException:
+                # Any other error (e.g. a broken response body, or a cancellation) is a failure too: it must not
+                # leave the trial request of a half-open circuit in progress forever.
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            else:
+                delay = self._after_provider_request(method, attempt, breaker, response=response)
+                if delay is None:
+                    response.raise_for_status()
+                    return response
+            time.sleep(delay)
+            attempt += 1
+
+    async def arequest(self, url, *, method='GET', headers=None, data=None, json=None, auth=None, params=None,
+                       timeout=None):
+        """Asynchronous counterpart of :meth:`request`, which does not block the event loop."""
+        options, pool = self._request_options(headers, timeout)
+        breaker = self._get_circuit_breaker(url)
+
+        attempt = 0
+        while True:
+            self._before_provider_request(breaker)
+            try:
+                response = await http.async_request(
+                    method, url, data=data, json=json, auth=auth, params=params, **pool, **options
+                )
+            except (requests.ConnectionError, requests.Timeout) as err:
+                delay = self._after_provider_request(method, attempt, breaker, error=err)
+            except BaseException:
+                # Any other error (e.g. a broken response body, or a cancellation) is a failure too: it must not
+                # leave the trial request of a half-open circuit in progress forever.
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            else:
+                delay = self._after_provider_request(method, attempt, breaker, response=response)
+                if delay is None:
+                    response.raise_for_status()
+                    return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _get_circuit_breaker(self, url):
+        """Return the circuit breaker for the host serving ``url``, or ``None`` if circuit breaking is disabled."""
+        failure_threshold = self.setting('CIRCUIT_BREAKER_FAILURE_THRESHOLD')
+        if not failure_threshold:
+            return None
+        return http.get_circuit_breaker(
+            urlsplit(url).netloc,
+            failure_threshold=failure_threshold,
+            reset_timeout=self.setting('CIRCUIT_BREAKER_RESET_TIMEOUT', http.DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT),
+        )
+
+    def _before_provider_request(self, breaker):
+        """Fail fast, with :class:`ProviderUnavailable`, if the circuit breaker does not allow a request."""
+        if breaker is not None and not breaker.allow_request():
+            # .. custom_attribute_name: provider_request.circuit_open
+            # .. custom_attribute_description: True if a request to the provider was rejected, without being made,
+            #      because the provider's circuit breaker is open.
+            set_custom_attribute('provider_request.circuit_open', True)
+            raise ProviderUnavailable(self)
+
+    def _after_provider_request(self, method, attempt, breaker, error=None, response=None):
+        """Record the outcome of a provider request, and decide whether to retry it.
+
+        Connection errors, timeouts and 5xx responses count as failures of the provider.
+
+        Returns:
+            float: The delay, in seconds, before retrying the request; or ``None`` if ``response`` is final.
+
+        Raises:
+            AuthConnectionError: if the request failed with a connection error that is not retried.
+        """
+        failed = error is not None or response.status_code >= 500
+        if breaker is not None:
+            if not failed:
+                breaker.record_success()
+            elif breaker.record_failure():
+                logger.warning(
+                    'Opened the circuit breaker for provider requests after %d consecutive failures.', breaker.failures
+                )
+
+        if failed and attempt < self.setting('RETRIES', http.DEFAULT_RETRIES) and \
+                http.is_retryable(method, error=error, response=response):
+            # .. custom_attribute_name: provider_request.retries
+            # .. custom_attribute_description: The number of times the latest provider request was retried after
+            #      a connection error, timeout or gateway error.
+            set_custom_attribute('provider_request.retries', attempt + 1)
+            return http.retry_delay(
+                attempt,
+                backoff=self.setting('RETRY_BACKOFF', http.DEFAULT_RETRY_BACKOFF),
+                max_backoff=self.setting('RETRY_MAX_BACKOFF', http.DEFAULT_RETRY_MAX_BACKOFF),
+            )
+
+        if isinstance(error, requests.ConnectionError):
+            raise AuthConnectionError(self, str(error)) from error
+        if error is not None:
+            raise error
+        return None
+
+    def _request_options(self, headers, timeout):
+        """Return the request options and the pool configuration shared by :meth:`request` and :meth:`arequest`."""
+        headers = {} if headers is None else dict(headers)
+
+        if timeout is None:
+            timeout = self.setting('REQUESTS_TIMEOUT') or self.setting('URLOPEN_TIMEOUT') or (
+                self.setting('CONNECT_TIMEOUT', http.DEFAULT_CONNECT_TIMEOUT),
+                self.setting('READ_TIMEOUT', http.DEFAULT_READ_TIMEOUT),
+            )
+
+        if self.SEND_USER_AGENT and 'User-Agent' not in headers:
+            headers['User-Agent'] = self.setting('USER_AGENT') or user_agent()
+
+        options = {
+            'headers': headers,
+            'timeout': timeout,
+            'proxies': self.setting('PROXIES'),
+            'verify': self.setting('VERIFY_SSL', True),
+        }
+        pool = {
+            'pool_connections': self.setting('POOL_CONNECTIONS', http.DEFAULT_POOL_CONNECTIONS),
+            'pool_maxsize': self.setting('POOL_MAXSIZE', http.DEFAULT_POOL_MAXSIZE),
+            'pool_block': self.setting('POOL_BLOCK', False),
+        }
+        return options, pool
 
     def auth_complete_params(self, state=None):
         params = super().auth_complete_params(state)
@@ -119,6 +361,12 @@ class EdXOAuth2(BaseOAuth2):
         params['token_type'] = 'jwt'
         return params
 
+    def refresh_token_params(self, token, *args, **kwargs):
+        params = super().refresh_token_params(token, *args, **kwargs)
+        # Refreshed access tokens should also be JWTs, see auth_complete_params.
+        params['token_type'] = 'jwt'
+        return params
+
     def auth_complete(self, *args, **kwargs):
         """
         This method is overwritten to emit the `EdXOAuth2.auth_complete_signal` signal.
@@ -126,29 +374,320 @@ class EdXOAuth2(BaseOAuth2):
         # WARNING: During testing, the user model class is `social_core.tests.models.User`,
         # not the model specified for the application.
         user = super().auth_complete(*args, **kwargs)
-        self.auth_complete_signal.send(sender=self.__class__, user=user)
+        if hasattr(self.strategy, 'discard_stateless_state'):
+            # The OAuth state has been used, so the stateless state cookie (if any) is no longer needed.
+            self.strategy.discard_stateless_state()
+        if self.setting('DEFER_AUTH_COMPLETE_SIGNAL'):
+            self.get_signal_dispatcher().dispatch(self.__class__, user)
+        else:
+            self.auth_complete_signal.send(sender=self.__class__, user=user)
         return user
 
+    def get_rate_limiter(self):
+        """Return the rate limiter admitting the requests of the login flow, or ``None`` if it is disabled.
+
+        The limiter is applied by the views of ``oauth2_urlpatterns``, see ``auth_backends.views.rate_limited``.
+        """
+        return ratelimit.get_rate_limiter(
+            ip_rate=self.setting('RATE_LIMIT_IP_RATE'),
+            ip_burst=self.setting('RATE_LIMIT_IP_BURST'),
+            global_rate=self.setting('RATE_LIMIT_GLOBAL_RATE'),
+            global_burst=self.setting('RATE_LIMIT_GLOBAL_BURST'),
+            cache_alias=self.setting('RATE_LIMIT_CACHE_ALIAS'),
+        )
+
+    def get_signal_dispatcher(self):
+        """Return the dispatcher delivering ``auth_complete_signal`` when its dispatch is deferred."""
+        return dispatch.get_dispatcher(
+            self.auth_complete_signal,
+            self.auth_complete_batch_signal,
+            workers=self.setting('SIGNAL_WORKERS', dispatch.DEFAULT_WORKERS),
+            queue_size=self.setting('SIGNAL_QUEUE_SIZE', dispatch.DEFAULT_QUEUE_SIZE),
+            batch_size=self.setting('SIGNAL_BATCH_SIZE', dispatch.DEFAULT_BATCH_SIZE),
+        )
+
+    async def aauthenticate(self, *args, **kwargs):
+        """Async counterpart of ``authenticate``, used by ``django.contrib.auth.aauthenticate``."""
+        return await sync_to_async(self.authenticate)(*args, **kwargs)
+
+    async def aget_user(self, user_id):
+        """Async counterpart of ``get_user``, used by ``request.auser()``."""
+        return await sync_to_async(self.get_user)(user_id)
+
+    async def aauth_complete(self, *args, **kwargs):
+        """Asynchronous counterpart of :meth:`auth_complete`.
+
+        The token exchange is awaited without blocking the event loop. The rest of the login (state validation,
+        reading the user data and the ORM-bound pipeline) runs via ``sync_to_async``.
+        """
+        await self.aprefetch_access_token()
+        return await sync_to_async(self.auth_complete)(*args, **kwargs)
+
+    async def aprefetch_access_token(self):
+        """Exchange the authorization code for an access token ahead of :meth:`auth_complete`.
+
+        The token response (or the HTTP error) is kept on the backend and returned by the next call to
+        :meth:`request_access_token`. Callbacks without an authorization code (e.g. errors reported by the provider
+        or resumed partial pipelines) are left to :meth:`auth_complete`.
+        """
+        if not self.data.get('code') or self.data.get('error'):
+            return
+
+        state = await sync_to_async(self.validate_state)()
+        data = params = payload = None
+        auth_params = self.auth_complete_params(state)
+        if self.ACCESS_TOKEN_METHOD == 'GET':
+            params = auth_params
+        elif self.ACCESS_TOKEN_PAYLOAD == 'json':
+            payload = auth_params
+        else:
+            data = auth_params
+
+        start = time.perf_counter()
+        try:
+            response = await self.arequest(
+                self.access_token_url(),
+                method=self.ACCESS_TOKEN_METHOD,
+                headers=self.auth_headers(),
+                data=data,
+                json=payload,
+                params=params,
+                auth=self.auth_complete_credentials(),
+            )
+            self._prefetched_access_token = response.json()
+        except requests.HTTPError as error:
+            # Raised from request_access_token(), so that it is handled exactly like an error of a synchronous login.
+            self._prefetched_access_token = error
+        finally:
+            record_access_token_request_duration(start)
+
+    def request_access_token(self, *args, **kwargs):
+        """Return the token response prefetched by :meth:`aprefetch_access_token`, or request it from the provider."""
+        prefetched, self._prefetched_access_token = self._prefetched_access_token, None
+        if prefetched is None:
+            start = time.perf_counter()
+            try:
+                return super().request_access_token(*args, **kwargs)
+            finally:
+                record_access_token_request_duration(start)
+        if isinstance(prefetched, Exception):
+            with wrap_access_token_error(self):
+                raise prefetched
+        return prefetched
+
+    def pipeline(self, pipeline, pipeline_index=0, *args, **kwargs):  # pylint: disable=keyword-arg-before-vararg
+        """Run the pipeline, coalescing concurrent logins of the same user if ``COALESCE_LOGINS`` is enabled.
+
+        See ``auth_backends.coalescing``. Resumed partial pipelines are never coalesced.
+        """
+        response = kwargs.get('response')
+        if pipeline_index or response is None or not self.setting('COALESCE_LOGINS'):
+            return super().pipeline(pipeline, pipeline_index, *args, **kwargs)
+
+        uid = self.get_user_id(self.get_user_details(response), response)
+        coalescer = coalescing.LoginCoalescer(
+            self.name,
+            window=self.setting('COALESCE_LOGINS_WINDOW', coalescing.DEFAULT_WINDOW),
+            lock_timeout=self.setting('COALESCE_LOGINS_TIMEOUT', coalescing.DEFAULT_LOCK_TIMEOUT),
+        )
+        return coalescer.run(
+            str(uid),
+            functools.partial(super().pipeline, pipeline, pipeline_index, *args, **kwargs),
+            lambda social_id: self._load_coalesced_user(social_id, str(uid)),
+        )
+
+    def _load_coalesced_user(self, social_id, uid):
+        """Return the user of the association logged in by a concurrent login, or ``None`` if it no longer matches."""
+        social = self.strategy.storage.user.objects.select_related('user').filter(
+            pk=social_id, provider=self.name, uid=uid
+        ).first()
+        if social is None:
+            return None
+        user = social.user
+        user.social_user = social
+        user.is_new = False
+        return user
+
+    def run_pipeline(self, pipeline, pipeline_index=0, *args, **kwargs):  # pylint: disable=keyword-arg-before-vararg
+        """Run the pipeline, letting the strategy instrument each step if ``INSTRUMENT_PIPELINE`` is enabled.
+
+        Instrumented pipelines are run by a copy of ``BaseAuth.run_pipeline``, see
+        ``EdxDjangoStrategy.wrap_pipeline_step``. Otherwise, ``BaseAuth.run_pipeline`` runs the pipeline.
+        """
+        wrap_step = getattr(self.strategy, 'wrap_pipeline_step', None)
+        if wrap_step is None or not self.setting('INSTRUMENT_PIPELINE'):
+            return super().run_pipeline(pipeline, pipeline_index, *args, **kwargs)
+
+        out = kwargs.copy()
+        out.setdefault('strategy', self.strategy)
+        out.setdefault('backend', out.pop(self.name, None) or self)
+        out.setdefault('request', self.strategy.request_data())
+        out.setdefault('details', {})
+
+        if not isinstance(pipeline_index, int) or pipeline_index < 0 or pipeline_index >= len(pipeline):
+            pipeline_index = 0
+
+        for idx, name in enumerate(pipeline[pipeline_index:]):
+            out['pipeline_index'] = pipeline_index + idx
+            func = wrap_step(name, module_member(name), backend=self)
+            result = func(*args, **out) or {}
+            if not isinstance(result, dict):
+                return result
+            out.update(result)
+        return out
+
+    def jwks_url(self):
+        return self.setting('JWKS_URL') or f"{self.setting('URL_ROOT')}/oauth2/jwks.json"
+
+    def jwt_issuer(self):
+        """Return the ``iss`` claim of the provider's tokens: the ``JWT_ISSUER`` setting, or ``<URL_ROOT>/oauth2``."""
+        return self.setting('JWT_ISSUER') or f"{self.setting('URL_ROOT')}/oauth2"
+
+    def get_jwks_key_store(self):
+        """Return the process-wide key store holding the provider's signing keys.
+
+        Keys come from the ``JWKS`` setting (a key set dict, or the path to a JSON file) when it is defined, and from
+        the provider's JWKS endpoint otherwise.
+        """
+        static_jwks = self.setting('JWKS')
+        if static_jwks:
+            cache_key = ('static', repr(static_jwks))
+
+            def source_factory():
+                return jwks.StaticKeySource(static_jwks)
+        else:
+            url = self.jwks_url()
+            cache_key = ('url', url)
+
+            def source_factory():
+                return jwks.URLKeySource(url, http.get_session(), timeout=(
+                    self.setting('CONNECT_TIMEOUT', http.DEFAULT_CONNECT_TIMEOUT),
+                    self.setting('READ_TIMEOUT', http.DEFAULT_READ_TIMEOUT),
+                ))
+
+        return jwks.get_key_store(
+            cache_key,
+            source_factory,
+            ttl=self.setting('JWKS_CACHE_TTL', jwks.DEFAULT_JWKS_CACHE_TTL),
+            stale_ttl=self.setting('JWKS_STALE_TTL', jwks.DEFAULT_JWKS_STALE_TTL),
+        )
+
+    def verify_access_token(self, access_token, issuer=None, audience=None):
+        """Verify the access token's signature against the provider's JWKS and return its claims.
+
+        The ``iss`` and ``aud`` claims are checked against ``issuer`` and ``audience``, which default to the
+        ``JWT_ISSUER`` and ``JWT_AUDIENCE`` settings; claims without an expected value are not checked.
+        """
+        try:
+            return jwks.verify_jwt(
+                access_token,
+                self.get_jwks_key_store(),
+                algorithms=self.setting('JWT_ALGORITHMS', jwks.DEFAULT_JWT_ALGORITHMS),
+                issuer=issuer or self.setting('JWT_ISSUER'),
+                audience=audience or self.setting('JWT_AUDIENCE'),
+            )
+        except jwt.PyJWTError as error:
+            raise AuthTokenError(self, str(error)) from error
+
+    def backchannel_logout(self, logout_token):
+        """Log out the user of a back-channel logout token by deleting their indexed sessions, see ``session_index``.
+
+        A token with a ``sid`` claim only logs out the session it identifies, otherwise all sessions of the user are
+        deleted.
+
+        Returns:
+            int: Number of deleted sessions.
+        """
+        claim, value = self.verify_logout_token(logout_token)
+        return session_index.delete_sessions(self.name, value, claim=claim)
+
+    def verify_logout_token(self, logout_token):
+        """Verify a back-channel logout token from the provider, and return the claim identifying what to log out.
+
+        The token must be signed with one of the provider's keys for this client, and carry the back-channel logout
+        event, a unique ``jti`` and an ``iat`` at most ``LOGOUT_TOKEN_MAX_AGE`` seconds old. A ``jti`` already seen
+        within that window is rejected as a replay. See
+        https://openid.net/specs/openid-connect-backchannel-1_0.html#Validation.
+
+        Returns:
+            tuple: ``(claim, value)`` pair of the ``sid`` claim if present, else the ``sub`` claim, else the user's
+            ``ID_KEY`` claim, in which case ``claim`` is ``None``.
+        """
+        try:
+            payload = jwks.verify_jwt(
+                logout_token,
+                self.get_jwks_key_store(),
+                algorithms=self.setting('JWT_ALGORITHMS', jwks.DEFAULT_JWT_ALGORITHMS),
+                issuer=self.jwt_issuer(),
+                audience=self.setting('KEY'),
+            )
+        except jwt.PyJWTError as error:
+            raise AuthTokenError(self, str(error)) from error
+
+        if not isinstance(payload.get('events'), dict) or BACKCHANNEL_LOGOUT_EVENT not in payload['events']:
+            raise AuthTokenError(self, 'The token is not a logout token')
+        if 'nonce' in payload:
+            # Prevents ID tokens from being used as logout tokens.
+            raise AuthTokenError(self, 'Logout tokens must not contain a nonce')
+        max_age = self.setting('LOGOUT_TOKEN_MAX_AGE', DEFAULT_LOGOUT_TOKEN_MAX_AGE)
+        if not isinstance(payload.get('iat'), (int, float)) or payload['iat'] < time.time() - max_age:
+            raise AuthTokenError(self, 'The logout token has no recent iat claim')
+        if not payload.get('jti'):
+            raise AuthTokenError(self, 'The logout token has no jti claim')
+
+        for claim in ('sid', 'sub', self.ID_KEY):
+            if payload.get(claim):
+                break
+        else:
+            raise AuthTokenError(self, f'The logout token has no sid, sub or {self.ID_KEY} claim')
+
+        # Checked last, so that rejected tokens are not recorded. Tokens are recorded a little longer than they are
+        # accepted, to cover clock differences between processes.
+        if not session_index.record_logout_token(self.name, str(payload['jti']), max_age + 60):
+            raise AuthTokenError(self, 'The logout token was already used')
+        return (None if claim == self.ID_KEY else claim), str(payload[claim])
+
     def user_data(self, access_token, *args, **kwargs):
-        # The algorithm is required but unused because signature verification is skipped.
-        # Note: signature verification happens earlier during the authentication process.
-        decoded_access_token = jwt.decode(access_token, algorithms=["HS256"], options={"verify_signature": False})
-        keys = list(self.CLAIMS_TO_DETAILS_KEY_MAP.keys()) + ['administrator', 'superuser']
+        if self.setting('VERIFY_SIGNATURE', False):
+            decoded_access_token = self.verify_access_token(access_token)
+        else:
+            # Note: signature verification happens earlier during the authentication process.
+            decoded_access_token = decode_jwt_payload(access_token)
+        keys = self.get_claims_mapping().claims
         user_data = {key: decoded_access_token[key] for key in keys if key in decoded_access_token}
         return user_data
 
     def get_user_details(self, response):
-        details = self._map_user_details(response)
-
-        # Limits the scope of languages we can use
-        locale = response.get('locale')
-        if locale:
-            details['language'] = _to_language(response['locale'])
+        return self.get_claims_mapping()(response)
 
-        details['is_staff'] = response.get('administrator', False)
-        details['is_superuser'] = response.get('superuser', False)
+    @classmethod
+    def get_claims_mapping(cls):
+        """Return the ClaimsMapping for this class, compiled on first use.
 
-        return details
+        The mapping combines ``CLAIMS_TO_DETAILS_KEY_MAP`` and ``ROLE_CLAIMS_TO_DETAILS_KEY_MAP``, applying
+        ``CLAIM_TRANSFORMS`` and ``CLAIM_DEFAULTS``. It is compiled again whenever one of these attributes, or
+        ``discard_missing_values``, is replaced or modified in place.
+        """
+        sources = (
+            cls.CLAIMS_TO_DETAILS_KEY_MAP,
+            cls.ROLE_CLAIMS_TO_DETAILS_KEY_MAP,
+            cls.CLAIM_TRANSFORMS,
+            cls.CLAIM_DEFAULTS,
+            cls.discard_missing_values,
+        )
+        cached = cls.__dict__.get('_claims_mapping')
+        if cached is None or cached[0] != sources:
+            claims_map, role_claims_map, transforms, defaults, discard_missing_values = sources
+            mapping = ClaimsMapping(
+                {**claims_map, **role_claims_map},
+                transforms=transforms,
+                defaults=defaults,
+                discard_missing_values=discard_missing_values,
+            )
+            # The attributes are copied, so that changes made in place are detected too.
+            copies = (dict(claims_map), dict(role_claims_map), dict(transforms), dict(defaults), discard_missing_values)
+            cls._claims_mapping = cached = (copies, mapping)
+        return cached[1]
 
     def get_public_or_internal_url_root(self):
         return self.setting('PUBLIC_URL_ROOT') or self.setting('URL_ROOT')
@@ -156,7 +695,10 @@ class EdXOAuth2(BaseOAuth2):
     def _map_user_details(self, response):
         """Maps key/values from the response to key/values in the user model.
 
-        Does not transfer any key/value that is empty or not present in the response.
+        Does not transfer any key/value that is empty or not present in the response. Only
+        ``CLAIMS_TO_DETAILS_KEY_MAP`` is applied: the role claims, transforms and defaults are not.
+
+        Deprecated: ``get_user_details`` no longer calls this method, and applies ``get_claims_mapping()`` instead.
         """
         dest = {}
         for source_key, dest_key in self.CLAIMS_TO_DETAILS_KEY_MAP.items():
@@ -165,3 +707,27 @@ class EdXOAuth2(BaseOAuth2):
                 dest[dest_key] = value
 
         return dest
+
+
+class CachedUserEdXOAuth2(EdXOAuth2):
+    """``EdXOAuth2`` serving the users of authenticated sessions from a cache.
+
+    Use this backend in place of ``EdXOAuth2`` in ``AUTHENTICATION_BACKENDS``. Django then loads the user of each
+    request from a snapshot kept in the Django cache (see ``auth_backends.user_cache``), rather than with a query.
+    Snapshots expire after ``SOCIAL_AUTH_EDX_OAUTH2_USER_CACHE_TIMEOUT`` seconds, and are invalidated whenever the
+    user is saved (e.g. by the ``update_email`` and ``user_details`` pipeline steps), deleted, or logs in.
+    """
+    # local only (not part of social-auth)
+    # Enables the invalidation of the snapshots, see auth_backends.user_cache.is_enabled().
+    caches_users = True
+
+    def get_user(self, user_id):
+        user = user_cache.get_user(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache.set_user(user)
+        return user
+
+
+EdXOAuth2.auth_complete_signal.connect(user_cache.invalidate_logged_in_user, dispatch_uid='auth_backends.user_cache')
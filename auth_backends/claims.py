@@ -0,0 +1,78 @@
+"""Helpers for reading the claims of provider-issued JWTs."""
+import base64
+import binascii
+import json
+
+import jwt
+
+
+def decode_jwt_payload(token):
+    """Return the claims of a JWT without verifying its signature.
+
+    This is a lightweight alternative to ``jwt.decode(token, options={'verify_signature': False})`` for tokens whose
+    authenticity has already been established: the payload segment is base64url-decoded and parsed as JSON, and
+    nothing else (header parsing, algorithm lookup, registered claim validation) is done.
+
+    Raises:
+        jwt.DecodeError: if the token is malformed.
+    """
+    if isinstance(token, bytes):
+        token = token.decode('ascii')
+
+    try:
+        _, payload_segment, _ = token.split('.')
+    except ValueError as error:
+        raise jwt.DecodeError('Not enough segments') from error
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(payload_segment + '=' * (-len(payload_segment) % 4)))
+    except (binascii.Error, ValueError) as error:
+        raise jwt.DecodeError(f'Invalid payload: {error}') from error
+
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError('Invalid payload: must be a JSON object')
+    return payload
+
+
+_MISSING = object()
+
+
+class ClaimsMapping:
+    """Compiled mapping of token claims to user details.
+
+    The mapping is compiled once into a tuple of ``(claim, detail key, transform, default)`` entries, so that
+    producing the details for a response is a single pass over the claims.
+
+    Arguments:
+        claims_map (dict): Maps claim names to detail keys.
+        transforms (dict): Maps claim names to callables applied to the claim value.
+        defaults (dict): Maps claim names to the value used when the claim is missing (or ``None``).
+        discard_missing_values (bool): Whether missing claims without a default are left out of the details, rather
+            than mapped to ``None``.
+    """
+
+    def __init__(self, claims_map, transforms=None, defaults=None, discard_missing_values=True):
+        transforms = transforms or {}
+        defaults = defaults or {}
+        self.entries = tuple(
+            (claim, detail_key, transforms.get(claim), defaults.get(claim, _MISSING))
+            for claim, detail_key in claims_map.items()
+        )
+        self.claims = tuple(claim for claim, _, _, _ in self.entries)
+        self.discard_missing_values = discard_missing_values
+
+    def __call__(self, response):
+        """Return the user details for the given claims."""
+        details = {}
+        for claim, detail_key, transform, default in self.entries:
+            value = response.get(claim)
+            if value is None:
+                if default is not _MISSING:
+                    details[detail_key] = default
+                elif not self.discard_missing_values:
+                    details[detail_key] = None
+            elif transform is None:
+                details[detail_key] = value
+            else:
+                details[detail_key] = transform(value)
+        return details
@@ -0,0 +1,95 @@
+"""Coalescing of concurrent logins of the same user.
+
+A user double-clicking, or with several tabs going through ``social:complete`` at once, makes the login pipeline run
+concurrently for the same user, racing to create and associate it. When login coalescing is enabled (see
+``SOCIAL_AUTH_EDX_OAUTH2_COALESCE_LOGINS``), only one of these pipelines runs: the others wait for it, and log the
+same user in. Only the logins that were waiting for a pipeline reuse its result: a login starting after it ended runs
+its own pipeline, so that e.g. changes of the user's details at the provider are applied.
+"""
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache as default_cache
+from edx_django_utils.monitoring import set_custom_attribute
+
+DEFAULT_WINDOW = 5
+DEFAULT_LOCK_TIMEOUT = 30
+DEFAULT_POLL_INTERVAL = 0.05
+CACHE_KEY_PREFIX = 'auth_backends.login'
+
+
+class LoginCoalescer:
+    """Runs the login pipeline of a user once for concurrent logins, in any thread or process sharing the cache.
+
+    Arguments:
+        backend_name (str): Name of the backend running the pipeline.
+        window (int): Number of seconds the result of a pipeline is kept for the logins waiting for it.
+        lock_timeout (int): Maximum number of seconds a pipeline is expected to take. Logins waiting for another
+            login's pipeline for longer than this run the pipeline themselves.
+        poll_interval (float): Number of seconds between checks for the result of another login's pipeline.
+        cache: Django cache holding the locks and results. Defaults to the default cache.
+    """
+
+    def __init__(self, backend_name, *, window=DEFAULT_WINDOW, lock_timeout=DEFAULT_LOCK_TIMEOUT,
+                 poll_interval=DEFAULT_POLL_INTERVAL, cache=None, clock=time.monotonic):
+        self.backend_name = backend_name
+        self.window = window
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.cache = default_cache if cache is None else cache
+        self.clock = clock
+
+    def run(self, uid, run_pipeline, load_user):
+        """Return the user logging in with ``uid``, running the pipeline unless another login of the user does.
+
+        Arguments:
+            uid (str): Uid of the user at the provider.
+            run_pipeline (callable): Runs the pipeline, and returns its result: a user with a ``social_user``, or
+                e.g. the response of a partial pipeline, which is not shared.
+            load_user (callable): Returns the user of the given ``UserSocialAuth`` id, ready to be logged in, or
+                ``None``.
+        """
+        result_key = self._result_cache_key(uid)
+        lock_key = self._lock_cache_key(uid)
+        deadline = self.clock() + self.lock_timeout
+        # Id of the pipeline run this login waits for, held in the lock.
+        awaited_run_id = None
+        while True:
+            run_id = uuid.uuid4().hex
+            if self.cache.add(lock_key, run_id, self.lock_timeout):
+                try:
+                    user = run_pipeline()
+                    social = getattr(user, 'social_user', None)
+                    if social is not None:
+                        self.cache.set(result_key, (run_id, social.pk), self.window)
+                    return user
+                finally:
+                    self.cache.delete(lock_key)
+            if awaited_run_id is None:
+                awaited_run_id = self.cache.get(lock_key)
+            result = self.cache.get(result_key)
+            if awaited_run_id is not None and result is not None and result[0] == awaited_run_id:
+                user = load_user(result[1])
+                if user is not None:
+                    # .. custom_attribute_name: auth_complete.coalesced
+                    # .. custom_attribute_description: True if the login reused the result of the pipeline run by
+                    #      a concurrent login of the same user, rather than running the pipeline.
+                    set_custom_attribute('auth_complete.coalesced', True)
+                    return user
+            if self.clock() >= deadline:
+                # The login holding the lock is gone, or too slow: run the pipeline without it.
+                return run_pipeline()
+            time.sleep(self.poll_interval)
+
+    def _hash(self, uid):
+        """Return a cache-safe digest of the uid."""
+        return hashlib.sha256(f'{self.backend_name}.{uid}'.encode()).hexdigest()
+
+    def _result_cache_key(self, uid):
+        """Return the cache key of the (run id, association id) pair logged in by the latest pipeline of a user."""
+        return f'{CACHE_KEY_PREFIX}.result.{self._hash(uid)}'
+
+    def _lock_cache_key(self, uid):
+        """Return the cache key of the lock held while running the pipeline of a user."""
+        return f'{CACHE_KEY_PREFIX}.lock.{self._hash(uid)}'
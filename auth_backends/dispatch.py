@@ -0,0 +1,179 @@
+"""Deferred delivery of ``EdXOAuth2.auth_complete_signal``.
+
+By default the signal is sent synchronously, so its receivers add to the latency of every login. When deferred
+dispatch is enabled (see ``SOCIAL_AUTH_EDX_OAUTH2_DEFER_AUTH_COMPLETE_SIGNAL``), the signal's payload is queued once
+the login's transaction commits, and delivered by a pool of worker threads. Workers also send the queued users, in
+batches, to the receivers of ``EdXOAuth2.auth_complete_batch_signal``.
+
+The queue is bounded: payloads are dropped, and counted, when it is full, so that slow receivers cannot make the
+process run out of memory.
+
+Threads do not survive a fork: in a forked process (e.g. a worker forked by a pre-forking server after the
+application was loaded), dispatchers forget the threads and queue inherited from the parent, and start their own
+workers on first use.
+"""
+import functools
+import logging
+import os
+import queue
+import threading
+import weakref
+from collections import defaultdict
+
+from django.db import close_old_connections, transaction
+from edx_django_utils.monitoring import set_custom_attribute
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 50
+
+# Dispatchers of the process, reset after a fork.
+_instances = weakref.WeakSet()
+
+
+class DeferredSignalDispatcher:
+    """Delivers the payloads of a signal from a bounded queue, with a pool of worker threads.
+
+    Arguments:
+        signal (Signal): Signal sent, with a ``user`` argument, for each payload.
+        batch_signal (Signal): Optional signal sent, with a ``users`` argument, for each batch of payloads.
+        workers (int): Number of worker threads, started on first use.
+        queue_size (int): Maximum number of queued payloads.
+        batch_size (int): Maximum number of payloads delivered at once.
+    """
+
+    def __init__(self, signal, batch_signal=None, *, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.signal = signal
+        self.batch_signal = batch_signal
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+    def dispatch(self, sender, user):
+        """Queue the payload once the current transaction commits (or immediately, outside of a transaction)."""
+        transaction.on_commit(functools.partial(self.enqueue, sender, user))
+
+    def enqueue(self, sender, user):
+        """Queue the payload, dropping it if the queue is full.
+
+        Returns:
+            bool: Whether the payload was queued.
+        """
+        self._start_workers()
+        try:
+            self.queue.put_nowait((sender, user))
+            queued = True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning('Dropped an [%s] payload: the queue of deferred signals is full.', sender.__name__)
+            queued = False
+
+        # .. custom_attribute_name: auth_complete_signal.queue_depth
+        # .. custom_attribute_description: The number of deferred auth_complete_signal payloads waiting to be
+        #      delivered, after queueing the current one.
+        set_custom_attribute('auth_complete_signal.queue_depth', self.queue.qsize())
+        # .. custom_attribute_name: auth_complete_signal.dropped
+        # .. custom_attribute_description: The number of deferred auth_complete_signal payloads dropped by this
+        #      process because the queue was full.
+        set_custom_attribute('auth_complete_signal.dropped', self.dropped)
+        return queued
+
+    def flush(self):
+        """Block until all queued payloads are delivered."""
+        self.queue.join()
+
+    def deliver(self, batch):
+        """Send the signals for a batch of ``(sender, user)`` payloads, logging the errors raised by receivers."""
+        users_by_sender = defaultdict(list)
+        for sender, user in batch:
+            self._send(self.signal, sender=sender, user=user)
+            users_by_sender[sender].append(user)
+        if self.batch_signal is not None and self.batch_signal.has_listeners():
+            for sender, users in users_by_sender.items():
+                self._send(self.batch_signal, sender=sender, users=users)
+
+    @staticmethod
+    def _send(signal, **kwargs):
+        """Send the signal to all receivers, even if some of them fail."""
+        for receiver, response in signal.send_robust(**kwargs):
+            if isinstance(response, Exception):
+                logger.error('Receiver [%s] of a deferred signal failed.', receiver, exc_info=response)
+
+    def _start_workers(self):
+        """Start the worker threads, if they are not running yet."""
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work, name=f'auth-signal-dispatch-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _reset_after_fork(self):
+        """Forget the worker threads, queued payloads and locks inherited from the parent process.
+
+        The threads do not run in the child process, and the queue and locks may have been held by one of them at the
+        time of the fork. Payloads queued in the parent are delivered by the parent.
+        """
+        self._lock = threading.Lock()
+        self._threads = []
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.dropped = 0
+
+    def _work(self):
+        """Deliver queued payloads, in batches, forever."""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.deliver(batch)
+            except Exception:
+                logger.exception('Failed to deliver deferred signals.')
+            finally:
+                # Receivers may have used the database.
+                close_old_connections()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Reset the dispatchers of a forked process, see ``DeferredSignalDispatcher._reset_after_fork``."""
+    global _dispatchers_lock  # pylint: disable=global-statement
+    _dispatchers_lock = threading.Lock()
+    for dispatcher in list(_instances):
+        dispatcher._reset_after_fork()  # pylint: disable=protected-access
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_dispatcher(signal, batch_signal=None, *, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                   batch_size=DEFAULT_BATCH_SIZE):
+    """Return the process-wide dispatcher of the given signals and configuration."""
+    key = (signal, batch_signal, workers, queue_size, batch_size)
+    dispatcher = _dispatchers.get(key)
+    if dispatcher is None:
+        with _dispatchers_lock:
+            dispatcher = _dispatchers.setdefault(key, DeferredSignalDispatcher(
+                signal, batch_signal, workers=workers, queue_size=queue_size, batch_size=batch_size
+            ))
+    return dispatcher
@@ -0,0 +1,282 @@
+"""HTTP helpers used to talk to the OAuth2 provider.
+
+Requests made through a shared :class:`requests.Session` reuse pooled, keep-alive connections to the provider instead
+of paying for a new TCP/TLS handshake on every call.
+
+Asynchronous callers use :func:`async_request`, which is backed by a pooled ``httpx.AsyncClient`` when httpx is
+installed and otherwise runs the pooled session on a worker thread.
+
+Failing requests can be retried after :func:`retry_delay`, and a :class:`CircuitBreaker` lets callers fail fast while
+the provider is unhealthy.
+"""
+import asyncio
+import http.cookiejar
+import io
+import random
+import threading
+import time
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import ConnectTimeoutError
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+# Retries and circuit breaking are opt-in, see EdXOAuth2.request.
+DEFAULT_RETRIES = 0
+DEFAULT_RETRY_BACKOFF = 0.2
+DEFAULT_RETRY_MAX_BACKOFF = 2
+DEFAULT_CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT = 30
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+RETRY_STATUSES = frozenset((502, 503, 504))
+
+# Pooled sessions and clients are shared by the requests made for all users: they must not keep the cookies set by
+# the provider (e.g. load balancer cookies), which would otherwise be sent with the requests made for other users.
+NO_COOKIES_POLICY = http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Async clients are bound to the event loop they were created on, so they are kept per loop.
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+def get_session(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+    """Return the process-wide pooled session for the given pool configuration.
+
+    Sessions are created lazily and shared by every thread in the process. ``pool_connections`` is the number of
+    per-host pools to keep, ``pool_maxsize`` the number of keep-alive connections kept for each host and
+    ``pool_block`` whether callers wait for a free connection once a host's pool is exhausted, rather than opening
+    (and later discarding) an extra one. Sessions do not keep the cookies set by responses.
+    """
+    key = (pool_connections, pool_maxsize, pool_block)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.cookies.set_policy(NO_COOKIES_POLICY)
+                adapter = HTTPAdapter(
+                    pool_connections=pool_connections,
+                    pool_maxsize=pool_maxsize,
+                    pool_block=pool_block,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[key] = session
+    return session
+
+
+def close_sessions():
+    """Close and forget all pooled sessions (e.g. after forking a worker process)."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_async_client(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                     verify=True):
+    """Return the pooled ``httpx.AsyncClient`` of the running event loop for the given configuration.
+
+    The pool options have the same meaning as for :func:`get_session`.
+    """
+    loop = asyncio.get_running_loop()
+    key = (pool_connections, pool_maxsize, pool_block, verify)
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=pool_connections * pool_maxsize if pool_block else None,
+                max_keepalive_connections=pool_connections * pool_maxsize,
+            )
+            client = clients[key] = httpx.AsyncClient(limits=limits, verify=verify)
+            client.cookies.jar.set_policy(NO_COOKIES_POLICY)
+    return client
+
+
+async def async_request(method, url, *, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                        pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False, timeout=None, proxies=None, verify=True,
+                        **kwargs):
+    """Make a request without blocking the event loop and return a :class:`requests.Response`.
+
+    The arguments are those of :meth:`requests.Session.request`. Transport errors are raised as the equivalent
+    ``requests`` exceptions, so callers handle both code paths the same way. Requests going through ``proxies`` always
+    use the pooled session on a worker thread.
+    """
+    if httpx is None or proxies:
+        session = get_session(pool_connections, pool_maxsize, pool_block)
+        return await sync_to_async(session.request, thread_sensitive=False)(
+            method, url, timeout=timeout, proxies=proxies, verify=verify, **kwargs
+        )
+
+    client = get_async_client(pool_connections, pool_maxsize, pool_block, verify)
+    try:
+        response = await client.request(method, url, timeout=_to_httpx_timeout(timeout), **kwargs)
+    except httpx.ConnectTimeout as error:
+        raise requests.ConnectTimeout(str(error)) from error
+    except httpx.TimeoutException as error:
+        raise requests.ReadTimeout(str(error)) from error
+    except httpx.TransportError as error:
+        raise requests.ConnectionError(str(error)) from error
+    return _to_requests_response(response)
+
+
+def _to_httpx_timeout(timeout):
+    """Convert a ``requests`` timeout (a number or a ``(connect, read)`` tuple) to an ``httpx.Timeout``."""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _to_requests_response(response):
+    """Convert a read ``httpx.Response`` to a :class:`requests.Response`."""
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.reason = response.reason_phrase
+    converted.headers = CaseInsensitiveDict(response.headers)
+    converted.encoding = response.encoding
+    converted.url = str(response.url)
+    converted.raw = io.BytesIO(response.content)
+    return converted
+
+
+async def close_async_clients():
+    """Close and forget the async clients of the running event loop."""
+    with _async_clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def is_connect_error(error):
+    """Return whether the request failed before it was sent, in which case retrying it is safe for any method."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if httpx is not None and isinstance(error.__cause__, httpx.ConnectError):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    # NewConnectionError (e.g. connection refused, failed name resolution) is a ConnectTimeoutError.
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def is_retryable(method, error=None, response=None):
+    """Return whether a request that failed with ``error``, or was answered with ``response``, can be retried.
+
+    Requests that were never sent are always retryable. Other failures (read timeouts, dropped connections and
+    gateway errors) are only retried for idempotent methods: e.g. retrying the exchange of an authorization code that
+    the provider may already have redeemed would fail anyway.
+    """
+    if error is not None and is_connect_error(error):
+        return True
+    if method.upper() not in IDEMPOTENT_METHODS:
+        return False
+    return error is not None or response.status_code in RETRY_STATUSES
+
+
+def retry_delay(attempt, backoff=DEFAULT_RETRY_BACKOFF, max_backoff=DEFAULT_RETRY_MAX_BACKOFF):
+    """Return the number of seconds to wait before retrying after the given (zero-based) attempt.
+
+    Delays back off exponentially, with full jitter so that clients failing at the same time do not retry in lockstep.
+    """
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Process-local circuit breaker for requests to a provider.
+
+    After ``failure_threshold`` consecutive failures the circuit opens, and requests are rejected without being made.
+    Once ``reset_timeout`` seconds have passed, a single trial request is let through: the circuit closes if it
+    succeeds and opens again if it fails.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=DEFAULT_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Return the current state of the circuit."""
+        if self.opened_at is None:
+            return self.CLOSED
+        if self._trial_in_progress or self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """Return whether a request may be made, starting the trial request of a half-open circuit if necessary."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_in_progress or self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        """Record a successful request, closing the circuit."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        """Record a failed request, opening the circuit if the failure threshold is reached.
+
+        Returns:
+            bool: Whether this failure opened the circuit.
+        """
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self._trial_in_progress or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial_in_progress = False
+            return not was_open and self.opened_at is not None
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name, failure_threshold=DEFAULT_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                        reset_timeout=DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT):
+    """Return the process-wide circuit breaker with the given name (e.g. the provider's host) and configuration."""
+    key = (name, failure_threshold, reset_timeout)
+    breaker = _circuit_breakers.get(key)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = _circuit_breakers.setdefault(key, CircuitBreaker(failure_threshold, reset_timeout))
+    return breaker
+
+
+def reset_circuit_breakers():
+    """Forget all process-wide circuit breakers."""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
@@ -0,0 +1,73 @@
+"""Monitoring of the login pipeline and of the token exchange with the provider.
+
+See ``EdxDjangoStrategy.wrap_pipeline_step``.
+"""
+import functools
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from edx_django_utils.monitoring import set_custom_attribute
+
+OUTCOME_CONTINUE = 'continue'
+OUTCOME_INTERRUPT = 'interrupt'
+OUTCOME_ERROR = 'error'
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run while it is installed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def instrument_pipeline_step(name, func):
+    """Return a wrapper of the pipeline function ``func`` that records how the step ran as custom attributes.
+
+    ``name`` is the pipeline entry (e.g. ``social_core.pipeline.user.create_user``); attributes are named after its
+    last component.
+    """
+    step = name.rsplit('.', 1)[-1]
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        counter = QueryCounter()
+        outcome = OUTCOME_ERROR
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                result = func(*args, **kwargs)
+            # Steps continue the pipeline by returning a dict (or nothing). Anything else, e.g. a redirect to a
+            # partial pipeline view, interrupts it.
+            outcome = OUTCOME_CONTINUE if result is None or isinstance(result, dict) else OUTCOME_INTERRUPT
+            return result
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+
+            # .. custom_attribute_name: auth_pipeline.{step}.duration_ms
+            # .. custom_attribute_description: Wall time, in milliseconds, spent in the named pipeline step.
+            set_custom_attribute(f'auth_pipeline.{step}.duration_ms', round(duration_ms, 3))
+            # .. custom_attribute_name: auth_pipeline.{step}.query_count
+            # .. custom_attribute_description: Number of database queries run by the named pipeline step.
+            set_custom_attribute(f'auth_pipeline.{step}.query_count', counter.count)
+            # .. custom_attribute_name: auth_pipeline.{step}.outcome
+            # .. custom_attribute_description: How the named pipeline step ended: 'continue' if the pipeline went on
+            #      to the next step, 'interrupt' if the step returned a response (e.g. a redirect) and 'error' if it
+            #      raised an exception.
+            set_custom_attribute(f'auth_pipeline.{step}.outcome', outcome)
+
+    return wrapper
+
+
+def record_access_token_request_duration(start):
+    """Record the duration of the token exchange that started at ``start`` (a ``time.perf_counter()`` value)."""
+    # .. custom_attribute_name: auth_complete.access_token_request_ms
+    # .. custom_attribute_description: Wall time, in milliseconds, of the request exchanging the authorization code
+    #      for an access token, including failed requests.
+    set_custom_attribute('auth_complete.access_token_request_ms', round((time.perf_counter() - start) * 1000, 3))
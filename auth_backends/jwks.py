@@ -0,0 +1,188 @@
+"""Local verification of provider-signed JWTs.
+
+Public keys are fetched from a JSON Web Key Set (JWKS) source and held in an in-process :class:`JWKSKeyStore`, so
+verifying a token is a local signature check rather than a round-trip to the provider.
+"""
+import json
+import logging
+import threading
+import time
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JWKS_CACHE_TTL = 60 * 60 * 24
+DEFAULT_JWKS_STALE_TTL = 60 * 60
+DEFAULT_JWKS_MIN_REFRESH_INTERVAL = 30
+DEFAULT_JWT_ALGORITHMS = ('RS256', 'RS384', 'RS512')
+
+
+class KeySetFetchError(jwt.PyJWTError):
+    """Raised when the key set cannot be loaded from its source, e.g. because the JWKS endpoint is unreachable.
+
+    It is a ``jwt.PyJWTError``, so tokens that cannot be verified for lack of keys are rejected like invalid tokens.
+    """
+
+
+class URLKeySource:
+    """Loads a key set from the provider's JWKS endpoint."""
+
+    def __init__(self, url, session, timeout=None):
+        self.url = url
+        self.session = session
+        self.timeout = timeout
+
+    def __call__(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class StaticKeySource:
+    """Loads a key set from a dict, or from a JSON file that is re-read on every refresh.
+
+    Useful when keys are distributed with the service's configuration and for testing without network access.
+    """
+
+    def __init__(self, jwks):
+        self.jwks = jwks
+
+    def __call__(self):
+        if isinstance(self.jwks, dict):
+            return self.jwks
+        with open(self.jwks, encoding='utf-8') as f:
+            return json.load(f)
+
+
+class JWKSKeyStore:
+    """Thread-safe, ``kid``-indexed cache of the keys returned by a key source.
+
+    Keys are considered fresh for ``ttl`` seconds. For a further ``stale_ttl`` seconds, known keys are still served
+    while a background thread refreshes the key set. Only a lookup for an unknown ``kid`` (e.g. right after the
+    provider rotated its keys) or for keys past the stale window fetches synchronously; fetches for unknown ``kid``
+    values are rate limited by ``min_refresh_interval``, counted from the last fetch, even if it failed.
+    """
+
+    def __init__(self, source, ttl=DEFAULT_JWKS_CACHE_TTL, stale_ttl=DEFAULT_JWKS_STALE_TTL,
+                 min_refresh_interval=DEFAULT_JWKS_MIN_REFRESH_INTERVAL, clock=time.monotonic):
+        self.source = source
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        # Time of the last fetch, successful or not, which rate limits the fetches for unknown kid values.
+        self._attempted_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_key(self, kid):
+        """Return the :class:`jwt.PyJWK` for the given key ID.
+
+        A ``kid`` of ``None`` is accepted when the key set contains a single key.
+
+        Raises:
+            KeyError: if no key matches ``kid``.
+            jwt.PyJWTError: if the key set must be loaded and cannot be, see ``refresh``.
+        """
+        now = self.clock()
+        age = None if self._fetched_at is None else now - self._fetched_at
+
+        if age is None or age >= self.ttl + self.stale_ttl:
+            self.refresh()
+        elif not self._has_key(kid):
+            if now - self._attempted_at >= self.min_refresh_interval:
+                self.refresh()
+        elif age >= self.ttl:
+            self._refresh_in_background()
+
+        keys = self._keys
+        if kid is None and len(keys) == 1:
+            return next(iter(keys.values()))
+        return keys[kid]
+
+    def refresh(self):
+        """Synchronously reload the key set from the source.
+
+        Raises:
+            KeySetFetchError: if the source fails, e.g. with a connection error or an invalid JSON response.
+            jwt.PyJWKSetError: if the key set holds no usable key.
+        """
+        with self._lock:
+            self._attempted_at = self.clock()
+            try:
+                jwks = self.source()
+            except Exception as error:
+                raise KeySetFetchError(f'Failed to fetch the key set: {error}') from error
+            jwk_set = jwt.PyJWKSet.from_dict(jwks)
+            # Replace the mapping in one step so that readers never observe a partially built key set.
+            self._keys = {key.key_id: key for key in jwk_set.keys}
+            self._fetched_at = self.clock()
+
+    def _has_key(self, kid):
+        """Return whether a key for ``kid`` is cached, without loading the key set."""
+        return kid in self._keys or (kid is None and len(self._keys) == 1)
+
+    def _refresh_in_background(self):
+        """Start a background refresh, unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        """Refresh the key set, logging (rather than raising) failures."""
+        try:
+            self.refresh()
+        except Exception:
+            # Keep serving the stale keys; the next lookup past the stale window fetches synchronously.
+            logger.exception('Failed to refresh JWKS key set in the background.')
+        finally:
+            self._refreshing = False
+
+
+_key_stores = {}
+_key_stores_lock = threading.Lock()
+
+
+def get_key_store(cache_key, source_factory, **kwargs):
+    """Return the process-wide key store for ``cache_key``, creating it with ``source_factory()`` if necessary."""
+    store = _key_stores.get(cache_key)
+    if store is None:
+        with _key_stores_lock:
+            store = _key_stores.get(cache_key)
+            if store is None:
+                store = _key_stores[cache_key] = JWKSKeyStore(source_factory(), **kwargs)
+    return store
+
+
+def clear_key_stores():
+    """Forget all process-wide key stores."""
+    with _key_stores_lock:
+        _key_stores.clear()
+
+
+def verify_jwt(token, key_store, algorithms=DEFAULT_JWT_ALGORITHMS, issuer=None, audience=None):
+    """Verify the signature and registered claims of ``token`` and return its payload.
+
+    Raises:
+        jwt.PyJWTError: if the token cannot be verified, e.g. ``jwt.InvalidTokenError`` for an invalid token, or
+            ``jwt.InvalidKeyError`` if no key of the key store has the token's ``kid``.
+    """
+    header = jwt.get_unverified_header(token)
+    try:
+        key = key_store.get_key(header.get('kid'))
+    except KeyError as error:
+        raise jwt.InvalidKeyError(f"No signing key found for kid [{header.get('kid')}]") from error
+
+    return jwt.decode(
+        token,
+        key.key,
+        algorithms=list(algorithms),
+        issuer=issuer,
+        audience=audience,
+        options={'verify_aud': audience is not None},
+    )
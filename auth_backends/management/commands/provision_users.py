@@ -0,0 +1,142 @@
+"""Pre-create the users, and their social auth associations, listed in an export of the provider's users."""
+import logging
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from social_django.models import UserSocialAuth
+from social_django.utils import load_backend, load_strategy
+
+from auth_backends.management.exports import EXPORT_FORMATS, get_export_format, read_batches
+from auth_backends.pipeline import get_protected_user_fields
+from auth_backends.tokens import DEFAULT_BACKEND_NAME
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Pre-create users and their associations, so that their first login does not create them.
+
+    Each record of the export holds the claims the provider issues for a user (``preferred_username``, ``email``,
+    ``given_name``, ``administrator``...), which are mapped to user details with the backend's
+    ``get_user_details``. Users are created with the fields the login pipeline would set (``create_user`` sets the
+    username and email, and ``user_details`` the unprotected fields), and associated with the backend using the
+    same uid as a login.
+
+    The export is streamed, and written in batches with ``bulk_create``, so memory use does not depend on its size.
+    Existing users and associations are left untouched, so the command can be run again, e.g. with a newer export.
+    Users that cannot be created (e.g. because another user has the same value of a unique field) are reported as
+    unresolved, and are not associated.
+    """
+    help = 'Create the users, and their social auth associations, listed in a JSON Lines or CSV export.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the export.')
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS,
+            help='Format of the export. Defaults to csv for .csv files, and to jsonl otherwise.',
+        )
+        parser.add_argument('--backend', default=DEFAULT_BACKEND_NAME, help='Name of the social auth backend.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users written per query.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the users that would be created.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or get_export_format(options['path'])
+        strategy = load_strategy()
+        backend = load_backend(strategy, options['backend'], None)
+        user_fields = self.get_user_fields(strategy, backend)
+        counts = {'users': 0, 'associations': 0, 'skipped': 0, 'unresolved': 0}
+        start = time.monotonic()
+
+        try:
+            for batch in read_batches(options['path'], file_format, options['batch_size']):
+                self.provision(backend, user_fields, batch, counts, dry_run=options['dry_run'])
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Could not read the export: {error}') from error
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"{'Would create' if options['dry_run'] else 'Created'} {counts['users']} users and "
+            f"{counts['associations']} associations ({counts['skipped']} records skipped, {counts['unresolved']} "
+            f"unresolved users) in {elapsed:.1f}s."
+        )
+
+    @staticmethod
+    def get_user_fields(strategy, backend):
+        """Return a function returning the fields of a new user, given the user's details."""
+        User = get_user_model()
+        field_names = {field.name for field in User._meta.concrete_fields}  # pylint: disable=protected-access
+        field_names -= set(get_protected_user_fields(strategy, backend)) - {'username', 'email'}
+        field_mapping = strategy.setting('USER_FIELD_MAPPING', {}, backend=backend)
+
+        def user_fields(details):
+            fields = {field_mapping.get(key, key): value for key, value in details.items() if value is not None}
+            return {field: value for field, value in fields.items() if field in field_names}
+        return user_fields
+
+    def provision(self, backend, user_fields, records, counts, dry_run=False):
+        """Create the missing users, and associations, of a batch of records."""
+        User = get_user_model()
+        users = {}
+        for record in records:
+            details = backend.get_user_details(record)
+            uid = backend.get_user_id(details, record)
+            if not details.get('username') or not uid:
+                counts['skipped'] += 1
+                continue
+            users[details['username']] = (str(uid), details)
+
+        existing = dict(User.objects.filter(username__in=users).values_list('username', 'pk'))
+        new_users = [
+            User(password=make_password(None), **user_fields(details))
+            for username, (_, details) in users.items() if username not in existing
+        ]
+        uids = {uid: username for username, (uid, _) in users.items()}
+        existing_uids = set(
+            UserSocialAuth.objects.filter(provider=backend.name, uid__in=uids).values_list('uid', flat=True)
+        )
+        missing_uids = [uid for uid in uids if uid not in existing_uids]
+        if dry_run:
+            counts['users'] += len(new_users)
+            counts['associations'] += len(missing_uids)
+            return
+
+        if not new_users and not missing_uids:
+            return
+
+        # Conflicts are ignored, so that users created concurrently (e.g. by a login) are left untouched. The rows
+        # skipped are not reported, so the users are read back: the random unusable password of each new user
+        # identifies the rows created here.
+        User.objects.bulk_create(new_users, ignore_conflicts=True)
+        passwords = {user.username: user.password for user in new_users}
+        usernames = set(passwords).union(uids[uid] for uid in missing_uids)
+        user_ids = {}
+        for username, user_id, password in User.objects.filter(username__in=usernames).values_list(
+            'username', 'pk', 'password'
+        ):
+            user_ids[username] = user_id
+            counts['users'] += passwords.get(username) == password
+
+        unresolved = [uids[uid] for uid in missing_uids if uids[uid] not in user_ids]
+        if unresolved:
+            logger.warning('Skipping the associations of users that could not be created: %s', ', '.join(unresolved))
+            counts['unresolved'] += len(unresolved)
+        associations = [
+            UserSocialAuth(
+                user_id=user_ids[uids[uid]], provider=backend.name, uid=uid,
+                extra_data=self.get_extra_data(users[uids[uid]][1]),
+            )
+            for uid in missing_uids if uids[uid] in user_ids
+        ]
+        if associations:
+            UserSocialAuth.objects.bulk_create(associations, ignore_conflicts=True)
+            # Associations created concurrently in the meantime (e.g. by a login) are counted too.
+            counts['associations'] += UserSocialAuth.objects.filter(
+                provider=backend.name, uid__in=[association.uid for association in associations]
+            ).count()
+
+    @staticmethod
+    def get_extra_data(details):
+        """Return the extra data stored with a new association, i.e. the provider's user id if it is known."""
+        return {'user_id': details['user_id']} if details.get('user_id') is not None else {}
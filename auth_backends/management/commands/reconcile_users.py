@@ -0,0 +1,121 @@
+"""Bring the emails and roles of local users in line with an export of the provider's users."""
+import logging
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from social_django.models import UserSocialAuth
+from social_django.utils import load_backend, load_strategy
+
+from auth_backends.management.exports import EXPORT_FORMATS, get_export_format, read_batches
+from auth_backends.signals import send_user_changed
+from auth_backends.tokens import DEFAULT_BACKEND_NAME
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = ('email', 'is_staff', 'is_superuser')
+
+
+class Command(BaseCommand):
+    """Update the users whose email or roles differ from the provider's, without waiting for them to log in.
+
+    Each record of the export holds the claims the provider issues for a user, which are mapped to user details with
+    the backend's ``get_user_details``. Only the fields whose claim is present in a record are reconciled: a record
+    without role claims leaves the roles of its user alone, rather than revoking them. Records are matched to local
+    users through their social auth association, and, as in the ``update_email`` pipeline step, a user is skipped if
+    its username differs from the record's.
+
+    The export is streamed and diffed in batches, each costing one query to read the users and, if any of them
+    changed, one ``bulk_update`` of the changed users.
+    """
+    help = 'Update the emails and roles of local users from a JSON Lines or CSV export of the provider\'s users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the export.')
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS,
+            help='Format of the export. Defaults to csv for .csv files, and to jsonl otherwise.',
+        )
+        parser.add_argument('--backend', default=DEFAULT_BACKEND_NAME, help='Name of the social auth backend.')
+        parser.add_argument(
+            '--fields', default=','.join(DEFAULT_FIELDS),
+            help='Comma-separated user fields to reconcile. Defaults to %(default)s.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users read per query.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the users that would be updated.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or get_export_format(options['path'])
+        backend = load_backend(load_strategy(), options['backend'], None)
+        fields = [field for field in options['fields'].split(',') if field]
+        User = get_user_model()
+        field_names = {field.name for field in User._meta.concrete_fields}  # pylint: disable=protected-access
+        unknown = set(fields) - field_names
+        if unknown:
+            raise CommandError(f"Unknown user fields: {', '.join(sorted(unknown))}")
+
+        counts = {'checked': 0, 'updated': 0, 'mismatched': 0, 'missing': 0}
+        start = time.monotonic()
+        try:
+            for batch in read_batches(options['path'], file_format, options['batch_size']):
+                self.reconcile(backend, fields, batch, counts, dry_run=options['dry_run'])
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Could not read the export: {error}') from error
+
+        elapsed = time.monotonic() - start
+        rate = counts['checked'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{'Would update' if options['dry_run'] else 'Updated'} {counts['updated']} of {counts['checked']} users "
+            f"({counts['mismatched']} username mismatches, {counts['missing']} unknown) in {elapsed:.1f}s "
+            f"({rate:.0f} users/s)."
+        )
+
+    def reconcile(self, backend, fields, records, counts, dry_run=False):
+        """Update the users of a batch of records whose fields differ from the records'."""
+        entries = backend.get_claims_mapping().entries
+        details_by_uid = {}
+        for record in records:
+            details = backend.get_user_details(record)
+            uid = backend.get_user_id(details, record)
+            if uid:
+                # Missing claims are unknown rather than false, even if the mapping gives them a default.
+                present = {detail_key for claim, detail_key, _, _ in entries if record.get(claim) is not None}
+                details_by_uid[str(uid)] = {key: value for key, value in details.items() if key in present}
+        counts['checked'] += len(details_by_uid)
+
+        associations = UserSocialAuth.objects.filter(
+            provider=backend.name, uid__in=details_by_uid
+        ).select_related('user')
+        changed_users = []
+        changed_fields = set()
+        found = 0
+        for social in associations:
+            found += 1
+            user = social.user
+            details = details_by_uid[social.uid]
+            if details.get('username') != user.username:
+                logger.warning(
+                    'Skipping user [%s]: its username does not match the provider\'s username [%s].',
+                    user.username,
+                    details.get('username'),
+                )
+                counts['mismatched'] += 1
+                continue
+
+            changed = [
+                field for field in fields
+                if details.get(field) is not None and getattr(user, field) != details[field]
+            ]
+            if changed:
+                for field in changed:
+                    setattr(user, field, details[field])
+                changed_users.append(user)
+                changed_fields.update(changed)
+        counts['missing'] += len(details_by_uid) - found
+        counts['updated'] += len(changed_users)
+
+        if changed_users and not dry_run:
+            get_user_model().objects.bulk_update(changed_users, sorted(changed_fields))
+            # bulk_update does not send post_save, so the cached copies of the users are invalidated explicitly.
+            for user in changed_users:
+                send_user_changed(user.pk)
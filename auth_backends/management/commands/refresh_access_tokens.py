@@ -0,0 +1,91 @@
+"""Refresh the stored access tokens of users ahead of their expiry."""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from social_django.models import UserSocialAuth
+
+from auth_backends.tokens import DEFAULT_BACKEND_NAME, DEFAULT_REFRESH_MARGIN, TokenManager
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Refresh, with their stored refresh tokens, the access tokens of users that expire soon.
+
+    Associations are read in batches ordered by primary key, so memory use does not depend on the number of users.
+    Refreshes use the same single-flight locking as ``TokenManager.get_access_token``, so the command can run while
+    services request tokens.
+    """
+    help = 'Refresh the stored access tokens that expire within the given margin.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=DEFAULT_BACKEND_NAME, help='Name of the social auth backend.')
+        parser.add_argument(
+            '--margin', type=int, default=DEFAULT_REFRESH_MARGIN,
+            help='Refresh tokens expiring within this number of seconds.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of associations read per query.')
+        parser.add_argument('--workers', type=int, default=1, help='Number of tokens refreshed concurrently.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the tokens that would be refreshed.')
+
+    def handle(self, *args, **options):
+        manager = TokenManager(options['backend'], refresh_margin=options['margin'])
+        queryset = UserSocialAuth.objects.filter(
+            provider=options['backend'], extra_data__has_key='refresh_token'
+        ).order_by('pk')
+        workers = max(options['workers'], 1)
+        counts = {'refreshed': 0, 'skipped': 0, 'failed': 0}
+        start = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            last_pk = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                due = [social for social in batch if manager.needs_refresh(social)]
+                counts['skipped'] += len(batch) - len(due)
+                if options['dry_run']:
+                    counts['refreshed'] += len(due)
+                    continue
+
+                if workers == 1:
+                    results = [self._refresh_all(manager, due, close_connections=False)]
+                else:
+                    results = executor.map(
+                        self._refresh_all, [manager] * workers, [due[i::workers] for i in range(workers)]
+                    )
+                for refreshed, failed in results:
+                    counts['refreshed'] += refreshed
+                    counts['failed'] += failed
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"{'Would refresh' if options['dry_run'] else 'Refreshed'} {counts['refreshed']} access tokens "
+            f"({counts['skipped']} not due, {counts['failed']} failed) in {elapsed:.1f}s."
+        )
+
+    @staticmethod
+    def _refresh_all(manager, associations, close_connections=True):
+        """Refresh the access tokens of the given associations, and return the numbers of refreshes and failures."""
+        refreshed = failed = 0
+        try:
+            for social in associations:
+                try:
+                    # Forced, as the cached token of a due association is only fresh for the services' margin.
+                    manager.refresh(social, force=True)
+                except Exception:
+                    logger.exception('Failed to refresh the access token of user [%s].', social.user_id)
+                    failed += 1
+                else:
+                    refreshed += 1
+            return refreshed, failed
+        finally:
+            if close_connections:
+                # Worker threads have their own database connections.
+                connections.close_all()
@@ -0,0 +1,38 @@
+"""Readers of the user exports of the provider, used by the management commands."""
+import csv
+import itertools
+import json
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+CSV_BOOLEANS = {'true': True, 'false': False}
+
+
+def get_export_format(path):
+    """Return the format of an export given its path: csv for .csv files, and jsonl otherwise."""
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def read_records(path, file_format):
+    """Yield the user records (dicts of claims) of a JSON Lines or CSV file, one at a time."""
+    with open(path, newline='', encoding='utf-8') as export:
+        if file_format == 'csv':
+            for row in csv.DictReader(export):
+                # CSV has no types: empty cells are missing claims, and booleans are spelled out.
+                yield {
+                    claim: CSV_BOOLEANS.get(value.lower(), value)
+                    for claim, value in row.items() if value not in (None, '')
+                }
+        else:
+            for line in export:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_batches(path, file_format, batch_size):
+    """Yield the user records of an export in lists of up to ``batch_size`` records."""
+    records = read_records(path, file_format)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
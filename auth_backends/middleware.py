@@ -0,0 +1,257 @@
+"""Authentication of API requests made with the provider's JWT access tokens."""
+import copy
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError
+from django.dispatch import receiver
+from django.http import JsonResponse
+from social_core.exceptions import AuthTokenError
+from social_django.utils import load_backend, load_strategy
+
+from auth_backends.signals import user_changed
+from auth_backends.strategies import settings_snapshot
+
+DEFAULT_USER_CACHE_SIZE = 1024
+DEFAULT_USER_CACHE_TTL = 60
+CACHE_KEY_PREFIX = 'auth_backends.jwt_user'
+
+# Resolvers in use in the process, whose caches are invalidated when a user is changed, see signals.user_changed.
+_resolvers = weakref.WeakSet()
+
+
+class ExpiringLRUCache:
+    """Thread-safe, bounded, in-process cache of values that expire at a given time.
+
+    The least recently used entry is evicted when the cache holds ``maxsize`` entries.
+    """
+
+    def __init__(self, maxsize=DEFAULT_USER_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for ``key``, or ``None`` if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        """Store ``value`` for ``key`` until ``expires_at`` (a Unix timestamp)."""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        """Remove the entries whose value matches ``predicate``."""
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+class JwtUserResolver:
+    """Resolves the user of a JWT access token issued by the provider.
+
+    Tokens are verified, and mapped to user details, by the backend (see ``EdXOAuth2.verify_access_token`` and
+    ``EdXOAuth2.get_user_details``). Only unrestricted tokens issued by the provider to this service are accepted: the
+    ``iss`` claim must match ``issuer`` and the ``aud`` claim ``audience``. Users are created, and their profile kept in
+    sync with the claims, but their roles are never changed: ``administrator`` and ``superuser`` claims do not make
+    users staff or superusers.
+
+    The resolved user is then cached, keyed by a hash of the token, until the token expires: in a bounded in-process
+    LRU cache, for at most ``local_ttl`` seconds, and, if ``shared_cache`` is given, in that Django cache. Cached users
+    are invalidated when the user is saved or deleted, in this process and in the shared cache; other processes keep
+    their copy until it expires from their in-process cache.
+
+    Arguments:
+        backend: Backend instance verifying the tokens.
+        maxsize (int): Maximum number of users kept in the in-process cache.
+        shared_cache: Optional Django cache shared by all processes.
+        issuer (str): Expected ``iss`` claim. Defaults to the backend's ``JWT_ISSUER`` setting, or the provider's
+            issuer (``<URL_ROOT>/oauth2``).
+        audience (str): Expected ``aud`` claim. Defaults to the backend's ``JWT_AUDIENCE`` setting, which is required
+            otherwise: the provider's access tokens carry its ``JWT_AUDIENCE``, not the service's client id.
+        local_ttl (int): Maximum number of seconds a user is kept in the in-process cache.
+    """
+
+    # User fields kept in sync with the token's claims.
+    SYNCED_FIELDS = ('email', 'first_name', 'last_name')
+
+    def __init__(self, backend, maxsize=DEFAULT_USER_CACHE_SIZE, shared_cache=None, clock=time.time, *,
+                 issuer=None, audience=None, local_ttl=DEFAULT_USER_CACHE_TTL):
+        self.backend = backend
+        self.local_cache = ExpiringLRUCache(maxsize, clock=clock)
+        self.shared_cache = shared_cache
+        self.clock = clock
+        self.issuer = issuer or backend.jwt_issuer()
+        self.audience = audience or backend.setting('JWT_AUDIENCE')
+        if not self.audience:
+            raise ImproperlyConfigured('SOCIAL_AUTH_EDX_OAUTH2_JWT_AUDIENCE must be set to verify JWT access tokens')
+        self.local_ttl = local_ttl
+        _resolvers.add(self)
+
+    def resolve(self, token):
+        """Return the user of ``token``.
+
+        Each call returns a distinct user instance, so that callers can modify it.
+
+        Raises:
+            AuthTokenError: if the token cannot be verified.
+        """
+        key = f'{CACHE_KEY_PREFIX}.{hashlib.sha256(token.encode()).hexdigest()}'
+        user = self.local_cache.get(key)
+        if user is None and self.shared_cache is not None:
+            cached = self.shared_cache.get(key)
+            if cached is not None:
+                user, expires_at = cached
+                self.local_cache.set(key, user, min(expires_at, self.clock() + self.local_ttl))
+        if user is not None:
+            return copy.copy(user)
+
+        claims = self.backend.verify_access_token(token, issuer=self.issuer, audience=self.audience)
+        if claims.get('is_restricted'):
+            raise AuthTokenError(self.backend, 'Restricted tokens are not accepted')
+        details = self.backend.get_user_details(claims)
+        if not details.get('username'):
+            raise AuthTokenError(self.backend, 'The token does not identify a user')
+        user = self.sync_user(details)
+        if not user.is_active:
+            raise AuthTokenError(self.backend, 'The user is inactive')
+
+        expires_at = claims.get('exp')
+        if expires_at is not None:
+            self.local_cache.set(key, user, min(expires_at, self.clock() + self.local_ttl))
+            if self.shared_cache is not None:
+                timeout = int(expires_at - self.clock())
+                if timeout > 0:
+                    self.shared_cache.set(key, (user, expires_at), timeout)
+                    self._index_shared_key(user.pk, key, expires_at)
+        return copy.copy(user)
+
+    def sync_user(self, details):
+        """Return the user with the username in ``details``, creating it or updating its changed fields."""
+        User = get_user_model()
+        values = {field: details[field] for field in self.SYNCED_FIELDS if field in details}
+        try:
+            user, created = User.objects.get_or_create(username=details['username'], defaults=values)
+        except IntegrityError:
+            # The first requests of a new user raced, and another one created it. get_or_create inserts in a
+            # savepoint, so the transaction of the request, if any, is still usable.
+            user, created = User.objects.get(username=details['username']), False
+        if not created:
+            changed = [field for field, value in values.items() if getattr(user, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(user, field, values[field])
+                user.save(update_fields=changed)
+        return user
+
+    def invalidate_user(self, user_id):
+        """Forget the cached users with the given id."""
+        self.local_cache.discard(lambda user: user.pk == user_id)
+        if self.shared_cache is not None:
+            index_key = self._index_cache_key(user_id)
+            keys = self.shared_cache.get(index_key) or {}
+            self.shared_cache.delete_many([*keys, index_key])
+
+    def _index_cache_key(self, user_id):
+        """Return the cache key of the shared cache keys of a user's tokens."""
+        return f'{CACHE_KEY_PREFIX}.index.{user_id}'
+
+    def _index_shared_key(self, user_id, key, expires_at):
+        """Record the shared cache key of a user's token, so that it can be invalidated."""
+        index_key = self._index_cache_key(user_id)
+        now = self.clock()
+        keys = {k: exp for k, exp in (self.shared_cache.get(index_key) or {}).items() if exp > now}
+        keys[key] = expires_at
+        self.shared_cache.set(index_key, keys, int(max(keys.values()) - now) + 1)
+
+
+@receiver(user_changed)
+def invalidate_changed_user(sender, user_id, **kwargs):  # pylint: disable=unused-argument
+    """Invalidate the users cached by the resolvers of the process when a user is changed, e.g. saved or deleted."""
+    for resolver in list(_resolvers):
+        resolver.invalidate_user(user_id)
+
+
+class JwtAuthenticationMiddleware:
+    """Authenticates requests bearing a JWT access token issued by the provider.
+
+    Requests with an ``Authorization: JWT <token>`` header are authenticated as the token's user, resolved with a
+    :class:`JwtUserResolver`; requests with an invalid token are rejected with a 401 response. Other requests are left
+    untouched. Add the middleware after ``AuthenticationMiddleware``.
+
+    The resolver is configured with the backend's ``JWT_USER_CACHE_SIZE`` and ``JWT_USER_CACHE_TTL`` settings (the
+    size of the in-process cache, and the lifetime of its entries) and ``JWT_USER_SHARED_CACHE`` setting (the alias of
+    a Django cache shared by all processes). The backend's ``JWT_AUDIENCE`` setting is required: the middleware raises
+    ``ImproperlyConfigured`` when it is loaded without it.
+    """
+    auth_backend_name = 'edx-oauth2'
+    authorization_scheme = 'JWT'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # (settings version, resolver) pair. The resolver is created when the middleware is loaded, so that missing
+        # settings fail at startup rather than on the first request.
+        self._resolver = (settings_snapshot.version, self.create_resolver())
+
+    @property
+    def resolver(self):
+        """The user resolver, recreated whenever settings change."""
+        version = settings_snapshot.version
+        if self._resolver[0] != version:
+            self._resolver = (version, self.create_resolver())
+        return self._resolver[1]
+
+    def create_resolver(self):
+        """Return a user resolver configured with the backend's settings.
+
+        Raises:
+            ImproperlyConfigured: if the backend's ``JWT_AUDIENCE`` setting is not set.
+        """
+        backend = load_backend(load_strategy(), self.auth_backend_name, None)
+        shared_cache_alias = backend.setting('JWT_USER_SHARED_CACHE')
+        return JwtUserResolver(
+            backend,
+            maxsize=backend.setting('JWT_USER_CACHE_SIZE', DEFAULT_USER_CACHE_SIZE),
+            shared_cache=caches[shared_cache_alias] if shared_cache_alias else None,
+            local_ttl=backend.setting('JWT_USER_CACHE_TTL', DEFAULT_USER_CACHE_TTL),
+        )
+
+    def __call__(self, request):
+        token = self.get_token(request)
+        if token is not None:
+            try:
+                request.user = self.resolver.resolve(token)
+            except AuthTokenError:
+                return JsonResponse({'detail': 'Invalid token.'}, status=401)
+        return self.get_response(request)
+
+    def get_token(self, request):
+        """Return the JWT of the request's ``Authorization`` header, or ``None``."""
+        scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme != self.authorization_scheme or not token.strip():
+            return None
+        return token.strip()
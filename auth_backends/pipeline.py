@@ -5,6 +5,7 @@ For more info visit https://python-social-auth.readthedocs.io/en/latest/pipeline
 import logging
 from django.contrib.auth import get_user_model
 from edx_django_utils.monitoring import set_custom_attribute
+from social_core.exceptions import AuthAlreadyAssociated
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -33,6 +34,32 @@ def get_user_if_exists(strategy, details, user=None, *args, **kwargs):  # pylint
     return {}
 
 
+def get_social_and_user(backend, uid, details, user=None, *args, **kwargs):  # pylint: disable=keyword-arg-before-vararg
+    """Resolve the social association and the user with as few queries as possible.
+
+    This replaces the combination of ``social_core.pipeline.social_auth.social_user`` and ``get_user_if_exists``.
+    The association and its user are loaded with a single query. Only if there is no association is the user
+    looked up by username. The resolved objects are passed on to later steps (e.g. ``load_extra_data``) via the
+    pipeline kwargs, so they do not query for them again.
+    """
+    storage = backend.strategy.storage.user
+    social = storage.objects.select_related('user').filter(provider=backend.name, uid=str(uid)).first()
+
+    if social:
+        if user and social.user != user:
+            raise AuthAlreadyAssociated(backend)
+        user = user or social.user
+    elif not user:
+        user = User.objects.filter(username=details.get('username')).first()
+
+    return {
+        'social': social,
+        'user': user,
+        'is_new': user is None,
+        'new_association': social is None,
+    }
+
+
 def update_email(strategy, details, user=None, *args, **kwargs):  # pylint: disable=keyword-arg-before-vararg
     """Update the user's email address using data from provider."""
 
@@ -51,15 +78,79 @@ def update_email(strategy, details, user=None, *args, **kwargs):  # pylint: disa
                 user_username,
                 details_username
             )
-            return  # Exit without updating email
+            return None  # Exit without updating email
 
         # Proceed with email update only if usernames match
         email = details.get('email')
         if email and user.email != email:
             user.email = email
-            strategy.storage.user.changed(user)
 
             # .. custom_attribute_name: update_email.email_updated
             # .. custom_attribute_description: Indicates that the user's email was
             #    actually updated during this pipeline execution.
             set_custom_attribute('update_email.email_updated', True)
+
+            changed_fields = kwargs.get('user_changed_fields')
+            if changed_fields is None:
+                strategy.storage.user.changed(user)
+            else:
+                # The change is saved by save_user_changes, at the end of the pipeline.
+                return {'user_changed_fields': changed_fields + ['email']}
+    return None
+
+
+def user_details(strategy, details, backend, user=None, *args, **kwargs):  # pylint: disable=keyword-arg-before-vararg
+    """Update user details using data from provider, without saving the user.
+
+    This is equivalent to ``social_core.pipeline.user.user_details``, but rather than saving the user, it records
+    the changed fields in the ``user_changed_fields`` pipeline kwarg. Later steps (e.g. ``update_email``) add to
+    these fields, and ``save_user_changes`` saves all of them with a single query, or none if nothing changed.
+    """
+    changed_fields = list(kwargs.get('user_changed_fields') or [])
+    if not user:
+        return {'user_changed_fields': changed_fields}
+
+    protected = get_protected_user_fields(strategy, backend)
+    immutable = tuple(strategy.setting('IMMUTABLE_USER_FIELDS', [], backend=backend))
+    field_mapping = strategy.setting('USER_FIELD_MAPPING', {}, backend=backend)
+
+    for name, value in details.items():
+        # Convert to existing user field if mapping exists
+        name = field_mapping.get(name, name)
+        if value is None or not hasattr(user, name) or name in protected:
+            continue
+
+        current_value = getattr(user, name, None)
+        if current_value == value or (name in immutable and current_value):
+            continue
+
+        setattr(user, name, value)
+        changed_fields.append(name)
+
+    return {'user_changed_fields': changed_fields}
+
+
+def get_protected_user_fields(strategy, backend):
+    """Return the names of the user fields that ``user_details`` does not update."""
+    if strategy.setting('NO_DEFAULT_PROTECTED_USER_FIELDS', backend=backend) is True:
+        protected = ()
+    else:
+        protected = ('username', 'id', 'pk', 'email', 'password', 'is_active', 'is_staff', 'is_superuser')
+    return protected + tuple(strategy.setting('PROTECTED_USER_FIELDS', [], backend=backend))
+
+
+def save_user_changes(strategy, user=None, user_changed_fields=None,  # pylint: disable=keyword-arg-before-vararg
+                      *args, **kwargs):
+    """Save the user fields changed by earlier pipeline steps with a single query.
+
+    Nothing is written if no field changed. Only the changed fields are written, unless some of the changed attributes
+    are not concrete fields of the user model (e.g. properties with a setter), in which case the whole user is saved.
+    """
+    if user and user_changed_fields:
+        changed_fields = set(user_changed_fields)
+        concrete_fields = user._meta.concrete_fields  # pylint: disable=protected-access
+        if changed_fields <= {name for field in concrete_fields for name in (field.name, field.attname)}:
+            user.save(update_fields=sorted(changed_fields))
+        else:
+            user.save()
+    return {'user_changed_fields': []}
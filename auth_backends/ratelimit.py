@@ -0,0 +1,233 @@
+"""Admission control of the login flow.
+
+When rate limiting is enabled (see ``SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_IP_RATE`` and
+``SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_GLOBAL_RATE``), each step of the login flow served by ``oauth2_urlpatterns`` (the
+login view, ``social:begin`` and ``social:complete``) takes a token from a per-IP and a global token bucket before doing
+anything else (see ``auth_backends.views.rate_limited``). Requests finding a bucket empty are answered with a 429,
+before the session is read or written, and before the provider is contacted.
+
+Buckets are kept in process by default, or shared by all processes through a Django cache (see
+``SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_CACHE_ALIAS``).
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.http import HttpResponse
+from edx_django_utils.monitoring import set_custom_attribute
+
+DEFAULT_MAX_KEYS = 10000
+CACHE_KEY_PREFIX = 'auth_backends.ratelimit'
+
+# Scopes of the token buckets.
+SCOPE_IP = 'ip'
+SCOPE_GLOBAL = 'global'
+
+
+class TokenBucket:
+    """Process-local token buckets, keyed e.g. by client IP.
+
+    Each bucket holds up to ``burst`` tokens, and is refilled with ``rate`` tokens per second. The least recently used
+    buckets are forgotten beyond ``max_keys`` buckets, which is the same as refilling them.
+    """
+
+    def __init__(self, rate, burst, max_keys=DEFAULT_MAX_KEYS, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take a token from the bucket of ``key``.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds until one is available.
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens, wait = _take(tokens, updated, now, self.rate, self.burst)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def peek(self, key):
+        """Return the number of seconds until a token is available in the bucket of ``key``, without taking it."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+        return _wait(_refill(tokens, updated, now, self.rate, self.burst), self.rate)
+
+
+class CacheTokenBucket:
+    """Token buckets shared through a Django cache, by all processes using it.
+
+    Buckets are read and written without a lock, so concurrent requests may occasionally take the same token: the
+    limit is approximate, in exchange for a single read and write per request.
+    """
+
+    def __init__(self, rate, burst, cache, prefix=CACHE_KEY_PREFIX, clock=time.time):
+        self.rate = rate
+        self.burst = burst
+        self.cache = cache
+        self.prefix = prefix
+        self.clock = clock
+
+    def acquire(self, key):
+        """Take a token from the bucket of ``key``, see :meth:`TokenBucket.acquire`."""
+        cache_key = self._cache_key(key)
+        now = self.clock()
+        tokens, updated = self.cache.get(cache_key) or (self.burst, now)
+        tokens, wait = _take(tokens, updated, now, self.rate, self.burst)
+        # A bucket left alone until it is full again is the same as a missing one.
+        self.cache.set(cache_key, (tokens, now), math.ceil((self.burst - tokens) / self.rate) + 1)
+        return wait
+
+    def peek(self, key):
+        """Return the wait for a token in the bucket of ``key``, without taking it, see :meth:`TokenBucket.peek`."""
+        now = self.clock()
+        tokens, updated = self.cache.get(self._cache_key(key)) or (self.burst, now)
+        return _wait(_refill(tokens, updated, now, self.rate, self.burst), self.rate)
+
+    def _cache_key(self, key):
+        return f'{self.prefix}.{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def _refill(tokens, updated, now, rate, burst):
+    """Return the tokens of a bucket last updated at ``updated``, refilled until ``now``."""
+    return min(burst, tokens + max(0, now - updated) * rate)
+
+
+def _wait(tokens, rate):
+    """Return the number of seconds until a bucket holding ``tokens`` has a token to take."""
+    return 0 if tokens >= 1 else (1 - tokens) / rate
+
+
+def _take(tokens, updated, now, rate, burst):
+    """Refill a bucket, and take a token from it. Returns the remaining tokens and the wait, see ``acquire``."""
+    tokens = _refill(tokens, updated, now, rate, burst)
+    wait = _wait(tokens, rate)
+    return (tokens, wait) if wait else (tokens - 1, 0)
+
+
+class RateLimiter:
+    """Per-IP and global admission control of the steps of the login flow.
+
+    Arguments:
+        ip_rate (float): Requests per second allowed from each client IP, per step. ``None`` disables the limit.
+        ip_burst (int): Requests allowed at once from each client IP, per step. Defaults to one second of requests.
+        global_rate (float): Requests per second allowed from all clients, per step. ``None`` disables the limit.
+        global_burst (int): Requests allowed at once from all clients, per step. Defaults to one second of requests.
+        cache_alias (str): Alias of the Django cache sharing the buckets between processes. ``None`` keeps them in
+            process.
+    """
+
+    def __init__(self, ip_rate=None, ip_burst=None, global_rate=None, global_burst=None, cache_alias=None):
+        self.cache_alias = cache_alias
+        self.buckets = {}
+        for scope, rate, burst in ((SCOPE_IP, ip_rate, ip_burst), (SCOPE_GLOBAL, global_rate, global_burst)):
+            if rate:
+                burst = burst or max(1, math.ceil(rate))
+                if cache_alias is None:
+                    self.buckets[scope] = TokenBucket(rate, burst)
+                else:
+                    self.buckets[scope] = CacheTokenBucket(
+                        rate, burst, caches[cache_alias], prefix=f'{CACHE_KEY_PREFIX}.{scope}'
+                    )
+        self.counts = {'allowed': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def check(self, step, ip):
+        """Admit a request of the given step of the login flow from ``ip``.
+
+        Returns:
+            HttpResponse: A 429 response if the request is rejected, otherwise ``None``.
+        """
+        keys = {scope: f'{step}.{ip}' if scope == SCOPE_IP else step for scope in self.buckets}
+        # Every bucket is checked before any token is taken, so that a request rejected by one bucket does not use up
+        # the tokens of the others. A token taken concurrently between the check and the take may still reject the
+        # request while taking it, as the limit is approximate anyway.
+        wait = 0
+        for take in (False, True):
+            for scope, bucket in self.buckets.items():
+                wait = bucket.acquire(keys[scope]) if take else bucket.peek(keys[scope])
+                if wait:
+                    # .. custom_attribute_name: rate_limit.scope
+                    # .. custom_attribute_description: Scope ('ip' or 'global') of the rate limit that rejected a
+                    #      request of the login flow.
+                    set_custom_attribute('rate_limit.scope', scope)
+                    break
+            if wait:
+                break
+
+        with self._lock:
+            self.counts['rejected' if wait else 'allowed'] += 1
+            allowed, rejected = self.counts['allowed'], self.counts['rejected']
+        # .. custom_attribute_name: rate_limit.step
+        # .. custom_attribute_description: Step of the login flow ('login', 'begin' or 'complete') admitted or
+        #      rejected by rate limiting.
+        set_custom_attribute('rate_limit.step', step)
+        # .. custom_attribute_name: rate_limit.rejected
+        # .. custom_attribute_description: True if the request was rejected, with a 429, by rate limiting.
+        set_custom_attribute('rate_limit.rejected', bool(wait))
+        # .. custom_attribute_name: rate_limit.allowed_count
+        # .. custom_attribute_description: Number of requests of the login flow admitted by the rate limiter of the
+        #      process so far.
+        set_custom_attribute('rate_limit.allowed_count', allowed)
+        # .. custom_attribute_name: rate_limit.rejected_count
+        # .. custom_attribute_description: Number of requests of the login flow rejected by the rate limiter of the
+        #      process so far.
+        set_custom_attribute('rate_limit.rejected_count', rejected)
+
+        if not wait:
+            return None
+        response = HttpResponse('Too many login attempts, please try again later.', status=429,
+                                content_type='text/plain')
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+
+    async def acheck(self, step, ip):
+        """Async counterpart of :meth:`check`. Buckets kept in process are checked without leaving the event loop."""
+        if self.cache_alias is None:
+            return self.check(step, ip)
+        return await sync_to_async(self.check)(step, ip)
+
+
+def client_ip(request):
+    """Return the IP address of the client making ``request``.
+
+    Services behind a proxy or load balancer must set ``REMOTE_ADDR`` to the client's address (e.g. with a middleware
+    trusting their ``X-Forwarded-For`` header), otherwise all requests share the per-IP limit of the proxy.
+    """
+    return request.META.get('REMOTE_ADDR', '')
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(ip_rate=None, ip_burst=None, global_rate=None, global_burst=None, cache_alias=None):
+    """Return the process-wide rate limiter with the given configuration, or ``None`` if both limits are disabled."""
+    if not ip_rate and not global_rate:
+        return None
+    key = (ip_rate, ip_burst, global_rate, global_burst, cache_alias)
+    limiter = _rate_limiters.get(key)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(key)
+            if limiter is None:
+                limiter = _rate_limiters[key] = RateLimiter(*key)
+    return limiter
+
+
+def reset_rate_limiters():
+    """Forget all process-wide rate limiters, and their buckets."""
+    with _rate_limiters_lock:
+        _rate_limiters.clear()
@@ -0,0 +1,128 @@
+"""Index of the sessions of each user, used by back-channel logout.
+
+When back-channel logout is enabled (see ``SOCIAL_AUTH_EDX_OAUTH2_BACKCHANNEL_LOGOUT``), the key of each session logged
+in through the provider is recorded in the Django cache, under the user's uid at the provider, and under the ``sub`` and
+``sid`` claims of the access token it was logged in with. A logout token received from the provider (see
+``EdxOAuth2BackchannelLogoutView``) then deletes the sessions of its ``sid``, or all sessions of the user at once,
+without scanning the session table.
+
+Sessions are indexed when the user is logged in (``user_logged_in``) rather than when the login completes
+(``auth_complete_signal``), because logging in rotates the session key. Entries are dropped once their session expires.
+"""
+import hashlib
+import time
+from importlib import import_module
+
+import jwt
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from auth_backends.claims import decode_jwt_payload
+
+CACHE_KEY_PREFIX = 'auth_backends.sessions'
+LOGOUT_TOKEN_CACHE_KEY_PREFIX = 'auth_backends.logout_tokens'
+
+# Claims of the access token a session is indexed under, in addition to the user's uid.
+INDEXED_CLAIMS = ('sub', 'sid')
+
+
+def is_enabled():
+    """Return whether back-channel logout, and thus the indexing of sessions, is enabled."""
+    return getattr(settings, 'SOCIAL_AUTH_EDX_OAUTH2_BACKCHANNEL_LOGOUT', False)
+
+
+def _get_cache():
+    """Return the Django cache holding the index."""
+    return caches[getattr(settings, 'SOCIAL_AUTH_EDX_OAUTH2_SESSION_INDEX_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(provider, uid, claim=None):
+    """Return the cache key of the sessions of a user, or of the sessions with the value ``uid`` of ``claim``."""
+    name = f'{provider}.{uid}' if claim is None else f'{provider}.{claim}.{uid}'
+    return f"{CACHE_KEY_PREFIX}.{hashlib.sha256(name.encode()).hexdigest()}"
+
+
+def get_sessions(provider, uid, claim=None):
+    """Return the keys of the indexed, unexpired sessions of the user, mapped to their expiry timestamps.
+
+    With ``claim`` (one of ``INDEXED_CLAIMS``), return the sessions indexed under that claim's value ``uid`` instead.
+    """
+    now = time.time()
+    sessions = _get_cache().get(_cache_key(provider, uid, claim)) or {}
+    return {session_key: expiry for session_key, expiry in sessions.items() if expiry > now}
+
+
+def add_session(provider, uid, session_key, expiry, claim=None):
+    """Index a session of the user, expiring at the ``expiry`` timestamp.
+
+    The index of a user is read and written without a lock: a session logged in concurrently with another session of
+    the same user may be missing from the index.
+    """
+    sessions = get_sessions(provider, uid, claim)
+    sessions[session_key] = expiry
+    timeout = max(1, int(max(sessions.values()) - time.time()) + 1)
+    _get_cache().set(_cache_key(provider, uid, claim), sessions, timeout)
+
+
+def delete_sessions(provider, uid, claim=None):
+    """Delete all indexed sessions of the user, or of the value ``uid`` of ``claim``, and return their number.
+
+    The entries of the deleted sessions under the user's other uid or claims are left to expire.
+    """
+    cache_key = _cache_key(provider, uid, claim)
+    session_keys = list(get_sessions(provider, uid, claim))
+    if session_keys:
+        _delete_session_keys(session_keys)
+    _get_cache().delete(cache_key)
+    return len(session_keys)
+
+
+def record_logout_token(provider, jti, timeout):
+    """Record the ``jti`` of a logout token for ``timeout`` seconds, and return whether it was not already recorded."""
+    cache_key = f"{LOGOUT_TOKEN_CACHE_KEY_PREFIX}.{hashlib.sha256(f'{provider}.{jti}'.encode()).hexdigest()}"
+    return _get_cache().add(cache_key, True, timeout)
+
+
+def _delete_session_keys(session_keys):
+    """Delete the sessions with the given keys from the session store, with a bulk operation where possible."""
+    store_class = import_module(settings.SESSION_ENGINE).SessionStore
+    bulk = False
+    if hasattr(store_class, 'get_model_class'):
+        # Database backed sessions (db and cached_db engines).
+        store_class.get_model_class().objects.filter(session_key__in=session_keys).delete()
+        bulk = True
+    if hasattr(store_class, 'cache_key_prefix'):
+        # Cache backed sessions (cache and cached_db engines).
+        caches[settings.SESSION_CACHE_ALIAS].delete_many([store_class.cache_key_prefix + key for key in session_keys])
+        bulk = True
+    if not bulk:
+        for session_key in session_keys:
+            store_class(session_key).delete()
+
+
+@receiver(user_logged_in)
+def index_logged_in_session(sender, request, user, **kwargs):  # pylint: disable=unused-argument
+    """Index the session of a user logged in through the provider."""
+    social = getattr(user, 'social_user', None)
+    session = getattr(request, 'session', None)
+    if social is None or session is None or session.session_key is None or not is_enabled():
+        return
+    expiry = session.get_expiry_date().timestamp()
+    add_session(social.provider, social.uid, session.session_key, expiry)
+    for claim, value in _access_token_claims(social).items():
+        add_session(social.provider, value, session.session_key, expiry, claim=claim)
+
+
+def _access_token_claims(social):
+    """Return the ``INDEXED_CLAIMS`` of the access token stored for the user's social auth, if any."""
+    access_token = (social.extra_data or {}).get('access_token')
+    if not access_token:
+        return {}
+    try:
+        payload = decode_jwt_payload(access_token)
+    except jwt.DecodeError:
+        # Not a JWT: the session is only indexed under the user's uid.
+        return {}
+    return {claim: str(payload[claim]) for claim in INDEXED_CLAIMS if payload.get(claim)}
@@ -0,0 +1,19 @@
+"""Signals sent by auth_backends."""
+from django.contrib.auth import get_user_model
+from django.dispatch import Signal
+
+# Sent with the ``user_id`` of a user that was changed or deleted, so that the copies of the user cached by
+# auth_backends (see ``user_cache`` and ``middleware.JwtUserResolver``) are invalidated. It is sent whenever a user is
+# saved or deleted; code updating users without ``save()`` (e.g. with ``QuerySet.update()`` or ``bulk_update()``)
+# should send it for each updated user with ``send_user_changed``.
+user_changed = Signal()
+
+
+def send_user_changed(user_id):
+    """Send ``user_changed`` for the user with the given id."""
+    user_changed.send(sender=get_user_model(), user_id=user_id)
+
+
+def send_saved_user_changed(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Send ``user_changed`` when a user is saved or deleted, connected to the user model in ``AuthBackendsConfig``."""
+    send_user_changed(instance.pk)
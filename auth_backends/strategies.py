@@ -4,8 +4,44 @@ Python Social Auth strategies.
 See http://python-social-auth.readthedocs.io/en/latest/strategies.html for more information.
 """
 
+from django.core import signing
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from social_core.utils import setting_name
 from social_django.strategy import DjangoStrategy
 
+from auth_backends.instrumentation import instrument_pipeline_step
+
+_MISSING = object()
+_UNDEFINED = object()
+
+STATELESS_STATE_SALT = 'auth_backends.strategies.stateless_state'
+
+
+class SettingsSnapshot:
+    """Per-process snapshot of resolved setting values, keyed by (strategy class, setting name, backend name).
+
+    The snapshot is only invalidated when Django reports a settings change (e.g. override_settings in tests). Its
+    ``version`` changes on every invalidation, so values derived from settings can be cached alongside it.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.version = 0
+
+    def invalidate(self):
+        self.values = {}
+        self.version += 1
+
+
+settings_snapshot = SettingsSnapshot()
+
+
+@receiver(setting_changed)
+def clear_resolved_settings(**kwargs):  # pylint: disable=unused-argument
+    """Invalidate the resolved settings snapshot."""
+    settings_snapshot.invalidate()
+
 
 class EdxDjangoStrategy(DjangoStrategy):
     """
@@ -55,8 +91,107 @@ class EdxDjangoStrategy(DjangoStrategy):
 
         # Allow callers to not specify a value for this URL
         'LOGOUT_REDIRECT_URL': None,
+
+        # Use OPTIMIZED_PIPELINE instead of SOCIAL_AUTH_PIPELINE
+        'SOCIAL_AUTH_OPTIMIZED_PIPELINE': False,
+
+        # Keep the OAuth state (and redirect URL) in a signed cookie, rather than the session, between the begin and
+        # complete requests. See session_get/session_set.
+        'SOCIAL_AUTH_STATELESS_STATE': False,
+        'SOCIAL_AUTH_STATELESS_STATE_COOKIE_NAME': 'auth_backends_state',
+        'SOCIAL_AUTH_STATELESS_STATE_MAX_AGE': 60 * 10,
+
+        # Record the wall time, query count and outcome of each pipeline step. See wrap_pipeline_step.
+        'SOCIAL_AUTH_INSTRUMENT_PIPELINE': False,
     }
 
+    # Equivalent to the default pipeline, but resolves the social association and user with a single query, and
+    # coalesces all changes to the user into (at most) one write at the end of the pipeline. A returning user's login
+    # only reads one row and updates the association's extra data.
+    OPTIMIZED_PIPELINE = (
+        'social_core.pipeline.social_auth.social_details',
+        'social_core.pipeline.social_auth.social_uid',
+        'social_core.pipeline.social_auth.auth_allowed',
+        'auth_backends.pipeline.get_social_and_user',
+        'social_core.pipeline.user.create_user',
+        'social_core.pipeline.social_auth.associate_user',
+        'social_core.pipeline.social_auth.load_extra_data',
+        'auth_backends.pipeline.user_details',
+        'auth_backends.pipeline.update_email',
+        'auth_backends.pipeline.save_user_changes',
+    )
+
+    # Whether setting() memoizes resolved values in the settings snapshot. Disabled for subclasses overriding
+    # get_setting, whose values may depend on more than the setting name (e.g. the site of the request), unless they
+    # explicitly enable it.
+    memoize_settings = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'memoize_settings' not in cls.__dict__ and cls.get_setting is not EdxDjangoStrategy.get_setting:
+            cls.memoize_settings = False
+
+    def __init__(self, storage, request=None, tpl=None):
+        super().__init__(storage, request, tpl)
+        self._stateless_state = None
+        self._stateless_state_changed = False
+        self._stateless_state_discarded = False
+
+    def get_pipeline(self, backend=None):
+        if self.setting('OPTIMIZED_PIPELINE', backend=backend):
+            return self.OPTIMIZED_PIPELINE
+        return super().get_pipeline(backend)
+
+    def wrap_pipeline_step(self, name, func, backend=None):
+        """Return the function to call for the pipeline step ``name``, given its implementation ``func``.
+
+        If ``SOCIAL_AUTH_INSTRUMENT_PIPELINE`` is enabled, the step is instrumented with custom attributes (see
+        ``auth_backends.instrumentation``). Otherwise, ``func`` is returned as is.
+        """
+        if self.setting('INSTRUMENT_PIPELINE', backend=backend):
+            return instrument_pipeline_step(name, func)
+        return func
+
+    @property
+    def settings_version(self):
+        """Version of the settings snapshot used by this strategy, or ``None`` if its settings are not memoized.
+
+        Values derived from settings (e.g. the provider URLs) are only cached alongside a version: without one, the
+        settings may depend on the request (e.g. its site).
+        """
+        return settings_snapshot.version if self.memoize_settings else None
+
+    def setting(self, name, default=None, backend=None):
+        """Return the value of the setting, resolving it only once per process.
+
+        Resolution follows ``BaseStrategy.setting`` (the backend-prefixed name, then the ``SOCIAL_AUTH_``-prefixed
+        name, then the bare name, then ``DEFAULT_SETTINGS``), but its result, including the absence of the setting,
+        is memoized so the exception-driven fallbacks are not repeated on every lookup. Values are memoized per
+        strategy class, and not at all if ``memoize_settings`` is disabled.
+        """
+        if not self.memoize_settings:
+            value = self._resolve_setting(name, backend)
+            return default if value is _UNDEFINED else value
+
+        key = (type(self), name, backend.name if backend else None)
+        values = settings_snapshot.values
+        value = values.get(key, _MISSING)
+        if value is _MISSING:
+            value = values[key] = self._resolve_setting(name, backend)
+        return default if value is _UNDEFINED else value
+
+    def _resolve_setting(self, name, backend=None):
+        """Return the value of the first defined setting name for ``name``, or ``_UNDEFINED``."""
+        names = [setting_name(name), name]
+        if backend:
+            names.insert(0, setting_name(backend.name, name))
+        for value_name in names:
+            try:
+                return self.get_setting(value_name)
+            except (AttributeError, KeyError):
+                pass
+        return _UNDEFINED
+
     def get_setting(self, name):
         try:
             return super().get_setting(name)
@@ -67,3 +202,80 @@ class EdxDjangoStrategy(DjangoStrategy):
         # framework is not so flexible.
         except (AttributeError, TypeError):
             return self.DEFAULT_SETTINGS[name]
+
+    def is_stateless_key(self, name):
+        """Return whether the session value ``name`` is kept in the stateless state cookie.
+
+        When ``SOCIAL_AUTH_STATELESS_STATE`` is enabled, the values stored when a login begins (the OAuth state, the
+        redirect URL and ``FIELDS_STORED_IN_SESSION``) are carried to the complete request in a signed, expiring
+        cookie. Beginning a login then requires no session, and so no session store I/O.
+        """
+        return self.setting('STATELESS_STATE') and (
+            name.endswith('_state') or name == 'next' or name in self.setting('FIELDS_STORED_IN_SESSION', [])
+        )
+
+    def session_get(self, name, default=None):
+        if self.is_stateless_key(name):
+            return self._get_stateless_state().get(name, default)
+        return super().session_get(name, default)
+
+    def session_set(self, name, value):
+        if self.is_stateless_key(name):
+            self._get_stateless_state()[name] = value
+            self._stateless_state_changed = True
+        else:
+            super().session_set(name, value)
+
+    def session_pop(self, name):
+        if self.is_stateless_key(name):
+            self._stateless_state_changed = True
+            return self._get_stateless_state().pop(name, None)
+        return super().session_pop(name)
+
+    def discard_stateless_state(self):
+        """Delete the stateless state cookie with the next redirect.
+
+        The values remain available for the rest of the request.
+        """
+        if self.setting('STATELESS_STATE'):
+            self._stateless_state_discarded = True
+            self._stateless_state_changed = True
+
+    def redirect(self, url):
+        response = super().redirect(url)
+        if self._stateless_state_changed:
+            self._set_stateless_state_cookie(response)
+        return response
+
+    def _get_stateless_state(self):
+        """Return the values loaded from the stateless state cookie, if it is present, correctly signed and fresh."""
+        if self._stateless_state is None:
+            self._stateless_state = {}
+            cookie = self.request.COOKIES.get(self.setting('STATELESS_STATE_COOKIE_NAME')) if self.request else None
+            if cookie:
+                try:
+                    self._stateless_state = signing.loads(
+                        cookie, salt=STATELESS_STATE_SALT, max_age=self.setting('STATELESS_STATE_MAX_AGE')
+                    )
+                except signing.BadSignature:
+                    pass
+        return self._stateless_state
+
+    def _set_stateless_state_cookie(self, response):
+        """Store (or delete) the stateless state cookie on the response."""
+        cookie_name = self.setting('STATELESS_STATE_COOKIE_NAME')
+        state = self._stateless_state
+        if not state or self._stateless_state_discarded:
+            if cookie_name in self.request.COOKIES:
+                response.delete_cookie(cookie_name, samesite='Lax')
+            return
+
+        response.set_cookie(
+            cookie_name,
+            signing.dumps(state, salt=STATELESS_STATE_SALT, compress=True),
+            max_age=self.setting('STATELESS_STATE_MAX_AGE'),
+            secure=self.request_is_secure() or self.setting('REDIRECT_IS_HTTPS'),
+            httponly=True,
+            # Lax, so that the cookie is sent when the provider redirects the browser back to the complete URL.
+            samesite='Lax',
+        )
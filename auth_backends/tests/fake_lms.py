@@ -0,0 +1,228 @@
+"""An in-process stand-in for the LMS OAuth2 provider, used by the tests and benchmarks.
+
+:class:`FakeLMS` implements the provider endpoints called by ``EdXOAuth2`` (the token exchange and the JWKS), and
+issues JWT access tokens signed with its own RSA key. It is installed on the process-wide pooled session (see
+``auth_backends.http``) as a ``requests`` transport adapter, so logins run the backend's real request path without any
+network access::
+
+    lms = FakeLMS()
+    lms.add_user('jsmith', email='jsmith@example.com')
+    with override_settings(**lms.settings()), lms.installed():
+        response = login(Client(), lms, 'jsmith')
+
+:func:`login` drives a browser through the login flow of ``oauth2_urlpatterns``: the login view, the
+``social:begin`` view, the provider's authorization page and the ``social:complete`` view.
+"""
+import io
+import json
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import jwt
+import requests
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.urls import reverse
+from jwt.algorithms import RSAAlgorithm
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from auth_backends import http
+
+DEFAULT_URL_ROOT = 'https://lms.example.com'
+
+
+class FakeLMS:
+    """In-process stand-in for the LMS OAuth2 provider.
+
+    Arguments:
+        url_root (str): Root URL of the provider.
+        client_id (str): OAuth2 client id accepted by the provider.
+        client_secret (str): OAuth2 client secret accepted by the provider.
+        latency (float): Seconds each request to the provider takes, to simulate network and provider latency.
+        expires_in (int): Lifetime, in seconds, of the issued access tokens.
+    """
+
+    def __init__(self, url_root=DEFAULT_URL_ROOT, client_id='fake-client-id', client_secret='fake-client-secret',
+                 latency=0, expires_in=3600):
+        self.url_root = url_root
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.latency = latency
+        self.expires_in = expires_in
+        self.kid = uuid.uuid4().hex
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.users = {}
+        self.request_count = 0
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def settings(self, **overrides):
+        """Return the Django settings configuring ``EdXOAuth2`` to use this provider."""
+        settings = {
+            'SOCIAL_AUTH_EDX_OAUTH2_KEY': self.client_id,
+            'SOCIAL_AUTH_EDX_OAUTH2_SECRET': self.client_secret,
+            'SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT': self.url_root,
+            'SOCIAL_AUTH_EDX_OAUTH2_JWT_ISSUER': self.url_root,
+            'SOCIAL_AUTH_EDX_OAUTH2_JWT_AUDIENCE': self.client_id,
+        }
+        settings.update(overrides)
+        return settings
+
+    def add_user(self, username, **claims):
+        """Register (or update) a user of the provider, and return its claims."""
+        with self._lock:
+            user_claims = self.users.setdefault(username, {
+                'preferred_username': username,
+                'email': f'{username}@example.com',
+                'given_name': username.capitalize(),
+                'family_name': 'Learner',
+                'name': f'{username.capitalize()} Learner',
+                'user_id': len(self.users) + 1,
+                'administrator': False,
+                'superuser': False,
+            })
+            user_claims.update(claims)
+            return dict(user_claims)
+
+    def authorize(self, authorization_url, username):
+        """Log ``username`` in at the provider's authorization page, and return the URL the browser is sent back to."""
+        query = parse_qs(urlsplit(authorization_url).query)
+        if query.get('client_id') != [self.client_id]:
+            raise ValueError('Unknown client')
+        if username not in self.users:
+            self.add_user(username)
+        code = secrets.token_urlsafe()
+        with self._lock:
+            self._codes[code] = username
+        params = {'code': code}
+        if 'state' in query:
+            params['state'] = query['state'][0]
+        separator = '&' if '?' in query['redirect_uri'][0] else '?'
+        return f"{query['redirect_uri'][0]}{separator}{urlencode(params)}"
+
+    def create_access_token(self, username):
+        """Return a signed JWT access token for the user."""
+        now = int(time.time())
+        payload = {
+            **self.users[username],
+            'iss': self.url_root,
+            'aud': self.client_id,
+            'iat': now,
+            'exp': now + self.expires_in,
+            'sub': uuid.uuid5(uuid.NAMESPACE_URL, username).hex,
+            'scopes': ['user_id', 'profile', 'email'],
+        }
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+    def create_logout_token(self, username, **claims):
+        """Return a signed back-channel logout token for the user."""
+        payload = {
+            'iss': self.url_root,
+            'aud': self.client_id,
+            'iat': int(time.time()),
+            'jti': uuid.uuid4().hex,
+            'sub': uuid.uuid5(uuid.NAMESPACE_URL, username).hex,
+            'preferred_username': username,
+            'events': {'http://schemas.openid.net/event/backchannel-logout': {}},
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+    def jwks(self):
+        """Return the provider's JSON Web Key Set."""
+        key = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        key.update({'kid': self.kid, 'use': 'sig', 'alg': 'RS256'})
+        return {'keys': [key]}
+
+    def handle(self, method, url, body):
+        """Handle a request to the provider, and return its status code and JSON body."""
+        with self._lock:
+            self.request_count += 1
+        path = urlsplit(url).path
+        if method == 'GET' and path == '/oauth2/jwks.json':
+            return 200, self.jwks()
+        if method == 'POST' and path == '/oauth2/access_token':
+            form = parse_qs(body or '')
+            if form.get('grant_type') != ['authorization_code'] or form.get('client_id') != [self.client_id]:
+                return 400, {'error': 'invalid_request'}
+            with self._lock:
+                username = self._codes.pop(form.get('code', [''])[0], None)
+            if username is None:
+                return 400, {'error': 'invalid_grant'}
+            return 200, {
+                'access_token': self.create_access_token(username),
+                'token_type': 'JWT',
+                'expires_in': self.expires_in,
+                'refresh_token': secrets.token_urlsafe(),
+                'scope': 'user_id profile email',
+            }
+        return 404, {'error': 'not_found'}
+
+    @contextmanager
+    def installed(self, **pool):
+        """Route the requests made to the provider through the pooled session (see ``http.get_session``) to this one.
+
+        The keyword arguments are the pool options of the session the backend uses, if they are not the defaults.
+        """
+        session = http.get_session(**pool)
+        previous = session.adapters.get(self.url_root)
+        session.mount(self.url_root, FakeLMSAdapter(self))
+        try:
+            yield self
+        finally:
+            if previous is None:
+                del session.adapters[self.url_root]
+            else:
+                session.mount(self.url_root, previous)
+
+
+class FakeLMSAdapter(BaseAdapter):
+    """``requests`` transport adapter answering requests with a :class:`FakeLMS`."""
+
+    def __init__(self, lms):
+        super().__init__()
+        self.lms = lms
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint: disable=too-many-positional-arguments
+        if self.lms.latency:
+            time.sleep(self.lms.latency)
+        body = request.body.decode() if isinstance(request.body, bytes) else request.body
+        status, content = self.lms.handle(request.method, request.url, body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response.encoding = 'utf-8'
+        response.raw = io.BytesIO(json.dumps(content).encode())
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def login(client, lms, username, next_url='/', steps=None):
+    """Log ``username`` in through the login flow of ``oauth2_urlpatterns`` with a Django test client.
+
+    Arguments:
+        client (django.test.Client): Client acting as the browser.
+        lms (FakeLMS): Provider, installed on the pooled session.
+        username (str): Username of the user logging in at the provider.
+        next_url (str): URL the user is sent to after logging in.
+        steps (dict): Optional dict, updated with the response of each step (``login``, ``begin``, ``complete``).
+
+    Returns:
+        HttpResponse: The response of the ``social:complete`` view.
+    """
+    steps = {} if steps is None else steps
+    steps['login'] = client.get(reverse('login'), {'next': next_url})
+    steps['begin'] = client.get(steps['login']['Location'])
+    callback_url = lms.authorize(steps['begin']['Location'], username)
+    steps['complete'] = client.get(callback_url)
+    return steps['complete']
@@ -0,0 +1,189 @@
+"""Load testing of complete logins, against an in-process stand-in for the LMS.
+
+:func:`run_load_test` runs concurrent simulated users, in threads and optionally in several processes, through the
+login flow of ``oauth2_urlpatterns`` (see :func:`auth_backends.tests.fake_lms.login`), using the service's own settings,
+strategy, pipeline, session engine and database. Only the provider is replaced, by a :class:`FakeLMS` answering with
+the configured latency, so no request reaches the real LMS.
+
+Database contention is tracked with an execute wrapper on every worker's connection: errors raised because of locks
+(lock timeouts, deadlocks, busy databases) and integrity errors (e.g. concurrent creations of the same user) are
+counted, along with the time spent in queries.
+
+The simulated users are real users of the database. Only the users created by a run are recorded (and deleted with
+``cleanup=True``): users that already existed under the simulated usernames are logged in, but never deleted.
+"""
+import multiprocessing
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from auth_backends.tests.fake_lms import FakeLMS, login
+
+LOCK_ERROR_MARKERS = ('lock', 'deadlock', 'busy', 'could not serialize')
+
+
+class ContentionCounter:
+    """Thread-safe execute wrapper counting queries, the time spent in them, and the errors caused by contention."""
+
+    def __init__(self):
+        self.counts = {'queries': 0, 'query_seconds': 0.0, 'lock_errors': 0, 'integrity_errors': 0}
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        error_type = None
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if any(marker in str(error).lower() for marker in LOCK_ERROR_MARKERS):
+                error_type = 'lock_errors'
+            raise
+        except IntegrityError:
+            error_type = 'integrity_errors'
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.counts['queries'] += 1
+                self.counts['query_seconds'] += elapsed
+                if error_type:
+                    self.counts[error_type] += 1
+
+
+class LoadTestResult:
+    """Measurements of a load test.
+
+    Attributes:
+        latencies (list): Duration, in seconds, of each login (successful or not).
+        failures (int): Number of logins that did not log the user in.
+        elapsed (float): Wall time, in seconds, of the load test.
+        counters (dict): Database counters, see :class:`ContentionCounter`.
+        created_user_ids (list): IDs of the simulated users created by the load test.
+    """
+
+    def __init__(self, latencies=None, failures=0, elapsed=0.0, counters=None, created_user_ids=None):
+        self.latencies = latencies or []
+        self.failures = failures
+        self.elapsed = elapsed
+        self.counters = counters or {}
+        self.created_user_ids = created_user_ids or []
+
+    @property
+    def throughput(self):
+        """Number of successful logins per second."""
+        return (len(self.latencies) - self.failures) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, percent):
+        """Return the given percentile of the login latencies, in seconds."""
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100, method='inclusive')[percent - 1]
+
+    def merge(self, other):
+        """Add the measurements of a load test run concurrently (e.g. by another process) to this one."""
+        self.latencies.extend(other.latencies)
+        self.failures += other.failures
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.created_user_ids.extend(other.created_user_ids)
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+def _simulate_user(lms, username, logins, counter):
+    """Log ``username`` in ``logins`` times, each time with a new browser, and return the latencies and failures."""
+    latencies = []
+    failures = 0
+    try:
+        with connection.execute_wrapper(counter):
+            for _ in range(logins):
+                client = Client(secure=True)
+                start = time.perf_counter()
+                try:
+                    response = login(client, lms, username)
+                    succeeded = response.status_code == 302 and '_auth_user_id' in client.session
+                except Exception:
+                    succeeded = False
+                latencies.append(time.perf_counter() - start)
+                failures += not succeeded
+    finally:
+        # Each worker thread has its own database connection.
+        connection.close()
+    return latencies, failures
+
+
+def _run_threads(users, logins, latency, prefix, offset=0):
+    """Run ``users`` simulated users in threads of the current process, and return a :class:`LoadTestResult`."""
+    lms = FakeLMS(latency=latency)
+    counter = ContentionCounter()
+    result = LoadTestResult()
+    usernames = [f'{prefix}{offset + index}' for index in range(users)]
+    users_by_username = get_user_model().objects.filter(username__in=usernames)
+    existing_user_ids = set(users_by_username.values_list('pk', flat=True))
+    # The test client's requests are made to the testserver host.
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **lms.settings()), lms.installed():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as executor:
+            futures = [
+                executor.submit(_simulate_user, lms, username, logins, counter) for username in usernames
+            ]
+            for future in futures:
+                latencies, failures = future.result()
+                result.latencies.extend(latencies)
+                result.failures += failures
+        result.elapsed = time.perf_counter() - start
+    result.counters = dict(counter.counts)
+    result.created_user_ids = [
+        user_id for user_id in users_by_username.values_list('pk', flat=True) if user_id not in existing_user_ids
+    ]
+    return result
+
+
+def _run_process(args):
+    """Entry point of the worker processes."""
+    django.setup()
+    return _run_threads(*args)
+
+
+def run_load_test(users=10, logins=5, processes=1, latency=0.0, prefix='loadtest-', *, cleanup=False):
+    """Run concurrent simulated users through complete logins, and return a :class:`LoadTestResult`.
+
+    Arguments:
+        users (int): Number of concurrent simulated users (threads) per process.
+        logins (int): Number of logins of each simulated user. The first creates the user, the others are logins of
+            a returning user.
+        processes (int): Number of processes. With more than one, the simulated users run in worker processes, which
+            must be able to reach the database (e.g. not an in-memory SQLite database).
+        latency (float): Seconds each request to the provider takes.
+        prefix (str): Prefix of the usernames of the simulated users, which must not be blank.
+        cleanup (bool): Whether to delete the users created by the load test afterwards.
+
+    Raises:
+        ValueError: if the prefix is blank.
+    """
+    if not prefix.strip():
+        raise ValueError('The prefix of the simulated usernames must not be blank.')
+
+    if processes <= 1:
+        result = _run_threads(users, logins, latency, prefix)
+    else:
+        # Forked processes must not share the parent's database connections.
+        connections.close_all()
+        result = LoadTestResult()
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            args = [(users, logins, latency, prefix, index * users) for index in range(processes)]
+            for process_result in pool.map(_run_process, args):
+                result.merge(process_result)
+        result.elapsed = time.perf_counter() - start
+
+    if cleanup and result.created_user_ids:
+        get_user_model().objects.filter(pk__in=result.created_user_ids).delete()
+    return result
@@ -0,0 +1,116 @@
+""" Tests for the async views. """
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+import responses
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from social_core.exceptions import AuthTokenError
+
+from auth_backends.backends import EdXOAuth2
+from auth_backends.tests.mixins import LogoutViewTestMixin, PASSWORD
+from auth_backends.urls import async_oauth2_urlpatterns
+
+URL_ROOT = 'https://example.com'
+LOGOUT_REDIRECT_URL = URL_ROOT + '/logout'
+
+# Django magic to determine which URL patterns are in effect for the tests
+urlpatterns = async_oauth2_urlpatterns
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncEdxOAuth2LoginViewTests(TestCase):
+    """ Tests for AsyncEdxOAuth2LoginView. """
+
+    async def test_redirect(self):
+        """ Verify the view redirects to the edX OAuth2 login page. """
+        qs = 'next=/test/'
+        response = await self.async_client.get(f"{reverse('login')}?{qs}")
+        expected = f"{reverse('social:begin', args=['edx-oauth2'])}?{qs}"
+        self.assertRedirects(response, expected, fetch_redirect_response=False)
+
+
+@override_settings(ROOT_URLCONF=__name__, URL_ROOT=URL_ROOT)
+class AsyncEdxOAuth2LogoutViewTests(LogoutViewTestMixin, TestCase):
+    """ Tests for AsyncEdxOAuth2LogoutView. """
+
+    def get_redirect_url(self):
+        return LOGOUT_REDIRECT_URL
+
+    async def test_async_logout(self):
+        """ Verify the user is logged out when the view is served asynchronously. """
+        user = await sync_to_async(self.create_user)()
+        await self.async_client.alogin(username=user.username, password=PASSWORD)
+
+        response = await self.async_client.get(self.get_logout_url())
+
+        self.assertRedirects(response, LOGOUT_REDIRECT_URL, fetch_redirect_response=False)
+        self.assertFalse(await self.async_client.session.ahas_key('_auth_user_id'))
+
+    def test_anonymous_logout(self):
+        """ Verify logging out without a session does not touch the database. """
+        with self.assertNumQueries(0):
+            response = self.client.get(self.get_logout_url(), {'no_redirect': 1})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    SOCIAL_AUTH_EDX_OAUTH2_KEY='a-key',
+    SOCIAL_AUTH_EDX_OAUTH2_SECRET='a-secret-key',
+    SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT=URL_ROOT,
+)
+@patch('auth_backends.http.httpx', None)
+class AsyncCompleteViewTests(TestCase):
+    """ Tests for the async complete view. """
+
+    def begin(self):
+        """ Begins a login and returns the state sent to the provider. """
+        response = self.client.get(reverse('social:begin', args=['edx-oauth2']), {'next': '/courses/'})
+        return parse_qs(urlparse(response['Location']).query)['state'][0]
+
+    def complete(self, state):
+        """ Completes a login with the given state. """
+        return self.client.get(reverse('social:complete', args=['edx-oauth2']), {'code': 'a-code', 'state': state})
+
+    @responses.activate
+    def test_login(self):
+        """ Verify the login is completed, with the token exchange made by the async view. """
+        token = jwt.encode(
+            {
+                'preferred_username': 'jsmith',
+                'email': 'jsmith@example.com',
+                'given_name': 'Joe',
+                'family_name': 'Smith',
+            },
+            'a-secret-key-that-is-long-enough-for-hs256',
+            algorithm='HS256',
+        )
+        responses.add(responses.POST, f'{URL_ROOT}/oauth2/access_token', json={'access_token': token})
+
+        with patch.object(EdXOAuth2, 'arequest', autospec=True, side_effect=EdXOAuth2.arequest) as mock_arequest:
+            response = self.complete(self.begin())
+
+        mock_arequest.assert_called_once()
+        self.assertEqual(len(responses.calls), 1)
+        self.assertRedirects(response, '/courses/', fetch_redirect_response=False)
+        self.assertEqual(get_user(self.client).username, 'jsmith')
+
+        # The async logout view loads the user through EdXOAuth2.aget_user.
+        self.client.get(reverse('logout'), {'no_redirect': 1})
+        self.assertFalse(get_user(self.client).is_authenticated)
+
+    @responses.activate
+    def test_token_error(self):
+        """ Verify errors of the token exchange are handled as for synchronous logins. """
+        responses.add(responses.POST, f'{URL_ROOT}/oauth2/access_token', status=401)
+        with self.assertRaises(AuthTokenError):
+            self.complete(self.begin())
+
+    def test_missing_backend(self):
+        """ Verify unknown backends are not found. """
+        response = self.client.get(reverse('social:complete', args=['unknown']))
+        self.assertEqual(response.status_code, 404)
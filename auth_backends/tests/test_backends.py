@@ -1,4 +1,5 @@
 """ Tests for the backends. """
+import asyncio
 import datetime
 import json
 from calendar import timegm
@@ -7,15 +8,24 @@ from unittest.mock import patch
 import ddt
 import jwt
 import pytest
+import requests
 import responses
 import six
 from Cryptodome.PublicKey import RSA
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.core.cache import cache
+from django.db import connection
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from jwt.algorithms import RSAAlgorithm
+from social_core.exceptions import AuthConnectionError, AuthTokenError
 from social_core.tests.backends.oauth import OAuth2Test
 
+from auth_backends import http
+from auth_backends.backends import EdXOAuth2, ProviderUnavailable
+from auth_backends.jwks import clear_key_stores
+
 User = get_user_model()
 
 
@@ -33,6 +43,8 @@ class EdXOAuth2Tests(OAuth2Test):
 
     def setUp(self):
         cache.clear()
+        clear_key_stores()
+        http.reset_circuit_breakers()
         super().setUp()
         self.key = RSA.generate(2048).export_key('PEM')
 
@@ -125,6 +137,23 @@ class EdXOAuth2Tests(OAuth2Test):
     def test_login(self):
         self.do_login()
 
+    @patch('auth_backends.instrumentation.set_custom_attribute')
+    def test_login_records_access_token_request_duration(self, mock_set_attr):
+        """ Verify the duration of the token exchange is recorded. """
+        self.do_login()
+        name, duration = mock_set_attr.call_args[0]
+        self.assertEqual(name, 'auth_complete.access_token_request_ms')
+        self.assertGreaterEqual(duration, 0)
+
+    @patch('auth_backends.dispatch.DeferredSignalDispatcher.dispatch')
+    def test_login_with_deferred_signal(self, mock_dispatch):
+        """ Verify auth_complete_signal is handed to the dispatcher, rather than sent, when deferred. """
+        self.set_social_auth_setting('DEFER_AUTH_COMPLETE_SIGNAL', True)
+        with patch.object(EdXOAuth2.auth_complete_signal, 'send') as mock_send:
+            user = self.do_login()
+        mock_send.assert_not_called()
+        mock_dispatch.assert_called_once_with(EdXOAuth2, user)
+
     @pytest.mark.django_db
     @ddt.data(True, False)  # Test with and without authenticated user
     @patch('auth_backends.backends.set_custom_attribute')
@@ -159,6 +188,162 @@ class EdXOAuth2Tests(OAuth2Test):
         else:
             mock_logger.info.assert_not_called()
 
+    def test_request_uses_pooled_session(self):
+        """ Verify provider requests reuse the process-wide session, with separate connect and read timeouts. """
+        url = f'{self.url_root}/oauth2/ping'
+        responses.add(responses.GET, url, body='pong')
+        session = http.get_session()
+
+        with patch.object(session, 'request', wraps=session.request) as mock_request:
+            self.assertEqual(self.backend.request(url).text, 'pong')
+            self.assertEqual(self.backend.request(url).text, 'pong')
+
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(
+            mock_request.call_args.kwargs['timeout'],
+            (http.DEFAULT_CONNECT_TIMEOUT, http.DEFAULT_READ_TIMEOUT)
+        )
+
+        self.set_social_auth_setting('REQUESTS_TIMEOUT', 3)
+        with patch.object(session, 'request', wraps=session.request) as mock_request:
+            self.backend.request(url)
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], 3)
+
+    def test_request_pool_settings(self):
+        """ Verify the pool configuration settings select the session used for provider requests. """
+        self.set_social_auth_setting('POOL_MAXSIZE', 50)
+        with patch('auth_backends.backends.http.get_session', wraps=http.get_session) as mock_get_session:
+            with patch('requests.Session.request') as mock_request:
+                mock_request.return_value.status_code = 200
+                self.backend.request(self.url_root)
+
+        mock_get_session.assert_called_once_with(
+            pool_connections=http.DEFAULT_POOL_CONNECTIONS, pool_maxsize=50, pool_block=False
+        )
+        mock_request.return_value.raise_for_status.assert_called_once_with()
+
+    def test_request_connection_error(self):
+        """ Verify connection errors are raised as social-auth connection errors. """
+        responses.add(responses.GET, self.url_root, body=requests.ConnectionError('refused'))
+        with self.assertRaises(AuthConnectionError):
+            self.backend.request(self.url_root)
+
+    @patch('auth_backends.backends.time.sleep')
+    @patch('auth_backends.backends.set_custom_attribute')
+    def test_request_retries(self, mock_set_attr, mock_sleep):
+        """ Verify idempotent requests are retried after gateway errors, up to the configured number of retries. """
+        url = f'{self.url_root}/oauth2/jwks.json'
+        responses.add(responses.GET, url, status=503)
+        with self.assertRaises(requests.HTTPError):
+            self.backend.request(url)
+        mock_sleep.assert_not_called()
+
+        self.set_social_auth_setting('RETRIES', 2)
+        responses.add(responses.GET, url, status=503)
+        responses.add(responses.GET, url, status=502)
+        responses.add(responses.GET, url, body='keys')
+        self.assertEqual(self.backend.request(url).text, 'keys')
+        self.assertEqual(mock_sleep.call_count, 2)
+        mock_set_attr.assert_called_with('provider_request.retries', 2)
+
+    @patch('auth_backends.backends.time.sleep')
+    def test_request_retries_non_idempotent(self, mock_sleep):
+        """ Verify non-idempotent requests are only retried if they were never sent. """
+        self.set_social_auth_setting('RETRIES', 2)
+        url = f'{self.url_root}/oauth2/access_token'
+        responses.add(responses.POST, url, body=requests.ReadTimeout('timed out'))
+        with self.assertRaises(requests.ReadTimeout):
+            self.backend.request(url, method='POST')
+        mock_sleep.assert_not_called()
+
+        responses.replace(responses.POST, url, body=requests.ConnectTimeout('timed out'))
+        with self.assertRaises(AuthConnectionError):
+            self.backend.request(url, method='POST')
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('auth_backends.backends.time.sleep')
+    @patch('auth_backends.backends.set_custom_attribute')
+    def test_request_circuit_breaker(self, mock_set_attr, mock_sleep):  # pylint: disable=unused-argument
+        """ Verify requests fail fast once the provider has failed repeatedly, if circuit breaking is enabled. """
+        responses.add(responses.GET, self.url_root, status=500)
+        for _ in range(10):
+            with self.assertRaises(requests.HTTPError):
+                self.backend.request(self.url_root)
+
+        self.set_social_auth_setting('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 2)
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self.backend.request(self.url_root)
+
+        with self.assertRaises(ProviderUnavailable) as context:
+            self.backend.request(self.url_root)
+        self.assertEqual(str(context.exception), 'The authentication provider is unavailable')
+        self.assertEqual(len(responses.calls), 12)
+        mock_set_attr.assert_called_once_with('provider_request.circuit_open', True)
+
+        self.set_social_auth_setting('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 0)
+        with self.assertRaises(requests.HTTPError):
+            self.backend.request(self.url_root)
+
+    def open_circuit_for_trial(self):
+        """ Open the provider's circuit breaker, so that the next request is its trial request. """
+        self.set_social_auth_setting('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 1)
+        self.set_social_auth_setting('CIRCUIT_BREAKER_RESET_TIMEOUT', 0)
+        responses.add(responses.GET, self.url_root, status=500)
+        with self.assertRaises(requests.HTTPError):
+            self.backend.request(self.url_root)
+
+    def test_request_circuit_breaker_trial_error(self):
+        """ Verify a trial request failing with any other error does not leave the circuit half-open forever. """
+        self.open_circuit_for_trial()
+        responses.replace(responses.GET, self.url_root, body=requests.exceptions.ChunkedEncodingError('broken'))
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.backend.request(self.url_root)
+
+        responses.replace(responses.GET, self.url_root, body='ok')
+        self.assertEqual(self.backend.request(self.url_root).text, 'ok')
+
+    def test_arequest_circuit_breaker_trial_cancelled(self):
+        """ Verify a cancelled async trial request does not leave the circuit half-open forever. """
+        self.open_circuit_for_trial()
+        with patch('auth_backends.http.async_request', side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(self.backend.arequest(self.url_root))
+
+        responses.replace(responses.GET, self.url_root, body='ok')
+        self.assertEqual(self.backend.request(self.url_root).text, 'ok')
+
+    @pytest.mark.django_db
+    @patch('auth_backends.backends.set_custom_attribute')
+    def test_start_with_session_rotation(self, mock_set_attr):
+        """ Verify the rotate cleanup mode logs the user out with a single session write. """
+        self.set_social_auth_setting('SESSION_CLEANUP_MODE', 'rotate')
+        request = RequestFactory().get('/auth/login/edx-oauth2/')
+        request.user = User.objects.create_user(username='existing_user', email='existing@example.com')
+        SessionMiddleware(lambda req: None).process_request(request)
+        request.session['_auth_user_id'] = str(request.user.pk)
+        request.session['cart'] = 'items'
+        request.session.save()
+        initial_session_key = request.session.session_key
+        self.backend.strategy.request = request
+
+        with patch('auth_backends.backends.user_logged_out') as mock_user_logged_out:
+            self.do_start()
+
+        mock_set_attr.assert_called_once_with('session_cleanup.logout_required', True)
+        mock_user_logged_out.send.assert_called_once()
+        self.assertTrue(request.user.is_anonymous)
+        self.assertEqual(request.session.session_key, initial_session_key)
+        self.assertNotIn('_auth_user_id', request.session)
+        self.assertNotIn('cart', request.session)
+
+        with CaptureQueriesContext(connection) as queries:
+            request.session['edx-oauth2_state'] = 'state'
+            request.session.save()
+        statements = [q['sql'].split()[0] for q in queries.captured_queries]
+        writes = [statement for statement in statements if statement in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, ['UPDATE'])
+
     def test_partial_pipeline(self):
         self.do_partial_pipeline()
 
@@ -216,6 +401,113 @@ class EdXOAuth2Tests(OAuth2Test):
             'administrator': False
         })
 
+    def get_jwks(self, key=None):
+        """ Returns a JWK set containing the public part of the given (or default) signing key. """
+        public_key = RSAAlgorithm(RSAAlgorithm.SHA512).prepare_key(key or self.key).public_key()
+        return {'keys': [RSAAlgorithm.to_jwk(public_key, as_dict=True)]}
+
+    def test_login_with_signature_verification(self):
+        """ Verify the access token can be verified locally against the provider's JWKS. """
+        self.set_social_auth_setting('VERIFY_SIGNATURE', True)
+        self.set_social_auth_setting('JWKS', self.get_jwks())
+        self.set_social_auth_setting('JWT_ISSUER', self.url_root)
+        self.do_login()
+
+    def test_user_data_with_invalid_signature(self):
+        """ Verify tokens that are not signed by the provider's keys are rejected. """
+        self.set_social_auth_setting('VERIFY_SIGNATURE', True)
+        self.set_social_auth_setting('JWKS', self.get_jwks(RSA.generate(2048).export_key('PEM')))
+        with self.assertRaises(AuthTokenError):
+            self.backend.user_data(self.create_jwt_access_token())
+
+    def test_user_data_with_unknown_kid(self):
+        """ Verify tokens signed with a key missing from the provider's JWKS (e.g. forged or rotated) are rejected. """
+        self.set_social_auth_setting('VERIFY_SIGNATURE', True)
+        self.set_social_auth_setting('JWKS', self.get_jwks())
+        token = jwt.encode(jwt.decode(self.create_jwt_access_token(), options={'verify_signature': False}), self.key,
+                           algorithm='RS512', headers={'kid': 'unknown'})
+        with self.assertRaises(AuthTokenError):
+            self.backend.user_data(token)
+
+    def test_user_data_with_invalid_issuer(self):
+        """ Verify tokens issued by a different issuer are rejected. """
+        self.set_social_auth_setting('VERIFY_SIGNATURE', True)
+        self.set_social_auth_setting('JWKS', self.get_jwks())
+        self.set_social_auth_setting('JWT_ISSUER', self.url_root)
+        with self.assertRaises(AuthTokenError):
+            self.backend.user_data(self.create_jwt_access_token(issuer='https://evil.example.com'))
+
+    def test_jwks_fetched_from_provider(self):
+        """ Verify the provider's JWKS endpoint is used, and cached, when no static key set is configured. """
+        self.set_social_auth_setting('VERIFY_SIGNATURE', True)
+        responses.add(responses.GET, f'{self.url_root}/oauth2/jwks.json', json=self.get_jwks())
+
+        self.assertEqual(self.backend.user_data(self.create_jwt_access_token())['preferred_username'], 'jsmith')
+        self.assertEqual(self.backend.user_data(self.create_jwt_access_token())['preferred_username'], 'jsmith')
+        self.assertEqual(len([c for c in responses.calls if c.request.url.endswith('jwks.json')]), 1)
+
+    def test_get_user_details(self):
+        """ Verify claims are mapped to user details, converting the locale and defaulting the role flags. """
+        response = {
+            'preferred_username': 'jsmith',
+            'email': 'jsmith@example.com',
+            'name': 'Joe Smith',
+            'given_name': 'Joe',
+            'family_name': None,
+            'locale': 'en_US',
+            'user_id': '1',
+            'superuser': True,
+            'scopes': ['read'],
+        }
+        self.assertDictEqual(self.backend.get_user_details(response), {
+            'username': 'jsmith',
+            'email': 'jsmith@example.com',
+            'full_name': 'Joe Smith',
+            'first_name': 'Joe',
+            'language': 'en-us',
+            'user_id': '1',
+            'is_staff': False,
+            'is_superuser': True,
+        })
+
+    def test_claims_mapping_subclass(self):
+        """ Verify subclasses can extend the claims mapping declaratively, and that it is compiled per class. """
+        class CustomEdXOAuth2(EdXOAuth2):
+            CLAIMS_TO_DETAILS_KEY_MAP = {**EdXOAuth2.CLAIMS_TO_DETAILS_KEY_MAP, 'nickname': 'nickname'}
+            CLAIM_TRANSFORMS = {**EdXOAuth2.CLAIM_TRANSFORMS, 'nickname': str.title}
+            CLAIM_DEFAULTS = {**EdXOAuth2.CLAIM_DEFAULTS, 'nickname': 'Anonymous'}
+
+        backend = CustomEdXOAuth2(self.strategy)
+        self.assertEqual(backend.get_user_details({'nickname': 'joe'})['nickname'], 'Joe')
+        self.assertEqual(backend.get_user_details({})['nickname'], 'Anonymous')
+        self.assertIs(CustomEdXOAuth2.get_claims_mapping(), CustomEdXOAuth2.get_claims_mapping())
+        self.assertNotIn('nickname', self.backend.get_user_details({'nickname': 'joe'}))
+
+        token = jwt.encode({'nickname': 'joe', 'unmapped': True}, self.key, algorithm='RS512')
+        self.assertDictEqual(backend.user_data(token), {'nickname': 'joe'})
+
+    def test_claims_mapping_changes(self):
+        """ Verify the compiled mapping follows changes of the class attributes, in place or not. """
+        class CustomEdXOAuth2(EdXOAuth2):
+            CLAIMS_TO_DETAILS_KEY_MAP = dict(EdXOAuth2.CLAIMS_TO_DETAILS_KEY_MAP)
+
+        backend = CustomEdXOAuth2(self.strategy)
+        self.assertNotIn('nickname', backend.get_user_details({'nickname': 'joe'}))
+
+        CustomEdXOAuth2.CLAIMS_TO_DETAILS_KEY_MAP['nickname'] = 'nickname'
+        self.assertEqual(backend.get_user_details({'nickname': 'joe'})['nickname'], 'joe')
+
+        CustomEdXOAuth2.CLAIM_DEFAULTS = {'nickname': 'Anonymous'}
+        self.assertEqual(backend.get_user_details({})['nickname'], 'Anonymous')
+
+    def test_map_user_details(self):
+        """ Verify the deprecated _map_user_details only renames the profile claims present in the response. """
+        response = {'preferred_username': 'jsmith', 'family_name': None, 'locale': 'en_US', 'superuser': True}
+        self.assertDictEqual(
+            self.backend._map_user_details(response),  # pylint: disable=protected-access
+            {'username': 'jsmith', 'language': 'en_US'},
+        )
+
     def test_extra_data(self):
         """
         Ensure that `user_id` and `refresh_token` stay in EXTRA_DATA.
@@ -0,0 +1,66 @@
+""" Tests for the claims module. """
+import ddt
+import jwt
+from django.test import SimpleTestCase
+
+from auth_backends.claims import ClaimsMapping, decode_jwt_payload
+
+SECRET = 'test-secret-that-is-long-enough-for-hs256'
+
+
+@ddt.ddt
+class DecodeJwtPayloadTests(SimpleTestCase):
+    """ Tests for decode_jwt_payload. """
+
+    @ddt.data(
+        {'preferred_username': 'jsmith'},
+        {'preferred_username': 'jsmith', 'name': 'Jöe Smïth', 'scopes': ['read', 'write']},
+        # Payloads of every length modulo 3, to exercise base64 padding.
+        {'a': 'x'},
+        {'a': 'xy'},
+        {'a': 'xyz'},
+    )
+    def test_matches_jwt_decode(self, payload):
+        """ Verify the payload matches the one returned by PyJWT. """
+        token = jwt.encode(payload, SECRET, algorithm='HS256')
+        self.assertEqual(decode_jwt_payload(token), jwt.decode(token, SECRET, algorithms=['HS256']))
+        self.assertEqual(decode_jwt_payload(token.encode('ascii')), payload)
+
+    @ddt.data(
+        'not-a-jwt',
+        'a.b',
+        'a.b.c.d',
+        'header.!!!.signature',
+        'header.bm90IGpzb24.signature',
+        'header.WzEsIDJd.signature',
+    )
+    def test_malformed_token(self, token):
+        """ Verify malformed tokens raise the same error as PyJWT. """
+        with self.assertRaises(jwt.DecodeError):
+            decode_jwt_payload(token)
+
+
+class ClaimsMappingTests(SimpleTestCase):
+    """ Tests for ClaimsMapping. """
+
+    def setUp(self):
+        super().setUp()
+        self.claims_map = {'preferred_username': 'username', 'locale': 'language', 'administrator': 'is_staff'}
+        self.transforms = {'locale': str.lower}
+        self.defaults = {'administrator': False}
+
+    def test_mapping(self):
+        """ Verify claims are renamed and transformed, and that missing claims are discarded or defaulted. """
+        mapping = ClaimsMapping(self.claims_map, transforms=self.transforms, defaults=self.defaults)
+        self.assertEqual(mapping.claims, ('preferred_username', 'locale', 'administrator'))
+        self.assertDictEqual(mapping({'preferred_username': 'jsmith', 'locale': 'EN', 'other': 1}), {
+            'username': 'jsmith',
+            'language': 'en',
+            'is_staff': False,
+        })
+        self.assertDictEqual(mapping({'administrator': True, 'locale': None}), {'is_staff': True})
+
+    def test_keep_missing_values(self):
+        """ Verify missing claims are mapped to None when they are not discarded. """
+        mapping = ClaimsMapping(self.claims_map, defaults=self.defaults, discard_missing_values=False)
+        self.assertDictEqual(mapping({}), {'username': None, 'language': None, 'is_staff': False})
@@ -0,0 +1,136 @@
+""" Tests for the coalescing module. """
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from auth_backends.coalescing import LoginCoalescer
+from auth_backends.tests.fake_lms import FakeLMS, login
+from auth_backends.urls import oauth2_urlpatterns
+
+User = get_user_model()
+
+urlpatterns = oauth2_urlpatterns
+
+
+class LoginCoalescerTests(TestCase):
+    """ Tests for LoginCoalescer. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.coalescer = LoginCoalescer('edx-oauth2', lock_timeout=1)
+        self.user = Mock(social_user=Mock(pk=42))
+        self.coalesced_user = Mock()
+
+    def run_login(self, result=None):
+        """ Runs a login, and returns its user and whether its pipeline ran. """
+        run_pipeline = Mock(return_value=result or self.user)
+        load_user = Mock(return_value=self.coalesced_user)
+        user = self.coalescer.run('jsmith', run_pipeline, load_user)
+        if load_user.called:
+            load_user.assert_called_once_with(42)
+        return user, run_pipeline.called
+
+    def hold_lock(self, run_id='leader'):
+        """ Simulates a concurrent login running the pipeline, and returns the cache key of its result. """
+        cache.add(self.coalescer._lock_cache_key('jsmith'), run_id)  # pylint: disable=protected-access
+        return self.coalescer._result_cache_key('jsmith')  # pylint: disable=protected-access
+
+    @patch('auth_backends.coalescing.set_custom_attribute')
+    def test_wait_for_leader(self, mock_set_attr):
+        """ Verify logins wait for, and reuse the result of, the pipeline of a concurrent login of the same user. """
+        result_key = self.hold_lock()
+
+        with patch('auth_backends.coalescing.time.sleep', side_effect=lambda _: cache.set(result_key, ('leader', 42))):
+            self.assertEqual(self.run_login(), (self.coalesced_user, False))
+        mock_set_attr.assert_called_once_with('auth_complete.coalesced', True)
+
+    @patch('auth_backends.coalescing.set_custom_attribute')
+    def test_later_login(self, mock_set_attr):
+        """ Verify a login starting after the pipeline of another login ended runs its own pipeline. """
+        self.assertEqual(self.run_login(), (self.user, True))
+        self.assertEqual(self.run_login(), (self.user, True))
+        mock_set_attr.assert_not_called()
+
+    def test_previous_result(self):
+        """ Verify logins waiting for a pipeline do not reuse the result of an earlier pipeline. """
+        self.run_login()
+        self.hold_lock()
+        self.coalescer.lock_timeout = 0
+        self.assertEqual(self.run_login(), (self.user, True))
+
+    def test_partial_pipeline(self):
+        """ Verify responses of partial pipelines are not reused. """
+        response = HttpResponse()
+        self.assertEqual(self.run_login(result=response), (response, True))
+        self.assertIsNone(cache.get(self.coalescer._result_cache_key('jsmith')))  # pylint: disable=protected-access
+
+    def test_leader_failed(self):
+        """ Verify logins run the pipeline themselves once a pipeline they waited for ended without a result. """
+        lock_key = self.coalescer._lock_cache_key('jsmith')  # pylint: disable=protected-access
+        self.hold_lock()
+
+        with patch('auth_backends.coalescing.time.sleep', side_effect=lambda _: cache.delete(lock_key)) as sleep:
+            self.assertEqual(self.run_login(), (self.user, True))
+        sleep.assert_called_once_with(self.coalescer.poll_interval)
+
+    def test_lock_timeout(self):
+        """ Verify logins run the pipeline themselves if the lock is not released in time. """
+        self.hold_lock()
+        self.coalescer.lock_timeout = 0
+        self.assertEqual(self.run_login(), (self.user, True))
+
+    def test_stale_result(self):
+        """ Verify the pipeline runs if the association of the awaited result can no longer be loaded. """
+        result_key = self.hold_lock()
+        cache.set(result_key, ('leader', 42))
+        self.coalesced_user = None
+        self.coalescer.lock_timeout = 0
+        self.assertEqual(self.run_login(), (self.user, True))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class CoalescedLoginTests(TestCase):
+    """ Tests for the coalescing of logins by EdXOAuth2. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.lms = FakeLMS()
+        self.enterContext(self.lms.installed())
+
+    @patch('auth_backends.coalescing.set_custom_attribute')
+    def test_login(self, mock_set_attr):
+        """ Verify a login completed right after another login of the same user runs the whole pipeline. """
+        with override_settings(**self.lms.settings(SOCIAL_AUTH_EDX_OAUTH2_COALESCE_LOGINS=True)):
+            login(self.client, self.lms, 'jsmith')
+            self.lms.add_user('jsmith', email='changed@example.com')
+            self.client.logout()
+            response = login(self.client, self.lms, 'jsmith')
+
+        self.assertEqual(response.status_code, 302)
+        user = User.objects.get(username='jsmith')
+        self.assertEqual(self.client.session['_auth_user_id'], str(user.pk))
+        self.assertEqual(user.email, 'changed@example.com')
+        mock_set_attr.assert_not_called()
+
+    @patch('auth_backends.coalescing.set_custom_attribute')
+    def test_concurrent_login(self, mock_set_attr):
+        """ Verify a login waiting for the pipeline of a concurrent login of the same user logs its user in. """
+        with override_settings(**self.lms.settings(SOCIAL_AUTH_EDX_OAUTH2_COALESCE_LOGINS=True)):
+            login(self.client, self.lms, 'jsmith')
+            self.client.logout()
+            coalescer = LoginCoalescer('edx-oauth2')
+            cache.add(coalescer._lock_cache_key('jsmith'), 'leader')  # pylint: disable=protected-access
+            social_id = User.objects.get(username='jsmith').social_auth.get().pk
+            result = ('leader', social_id)
+            result_key = coalescer._result_cache_key('jsmith')  # pylint: disable=protected-access
+            with patch('auth_backends.coalescing.time.sleep', side_effect=lambda _: cache.set(result_key, result)):
+                response = login(self.client, self.lms, 'jsmith')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.session['_auth_user_id'], str(User.objects.get(username='jsmith').pk))
+        mock_set_attr.assert_called_once_with('auth_complete.coalesced', True)
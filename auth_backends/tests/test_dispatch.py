@@ -0,0 +1,131 @@
+""" Tests for the dispatch module. """
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from django.dispatch import Signal
+from django.test import TestCase
+
+from auth_backends.dispatch import DeferredSignalDispatcher, get_dispatcher
+
+
+class DeferredSignalDispatcherTests(TestCase):
+    """ Tests for DeferredSignalDispatcher. """
+
+    def setUp(self):
+        super().setUp()
+        self.signal = Signal()
+        self.batch_signal = Signal()
+        self.received = []
+        self.batches = []
+
+    def receiver(self, sender, user, **kwargs):  # pylint: disable=unused-argument
+        """ Records the users received with the signal. """
+        self.received.append((user, threading.current_thread()))
+
+    def batch_receiver(self, sender, users, **kwargs):  # pylint: disable=unused-argument
+        """ Records the batches of users received with the batch signal. """
+        self.batches.append(users)
+
+    def test_dispatch(self):
+        """ Verify payloads are delivered by worker threads once the transaction commits. """
+        self.signal.connect(self.receiver, weak=False)
+        dispatcher = DeferredSignalDispatcher(self.signal)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            dispatcher.dispatch(object, 'jsmith')
+        self.assertEqual(dispatcher.queue.qsize(), 0)
+
+        callbacks[0]()
+        dispatcher.flush()
+        self.assertEqual(len(self.received), 1)
+        user, thread = self.received[0]
+        self.assertEqual(user, 'jsmith')
+        self.assertNotEqual(thread, threading.current_thread())
+
+    def test_batches(self):
+        """ Verify the payloads queued while a worker is busy are delivered to batch receivers together. """
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking_receiver(sender, user, **kwargs):  # pylint: disable=unused-argument
+            if user == 'user0':
+                started.set()
+                release.wait(5)
+
+        self.signal.connect(blocking_receiver, weak=False)
+        self.batch_signal.connect(self.batch_receiver, weak=False)
+        dispatcher = DeferredSignalDispatcher(self.signal, self.batch_signal, workers=1, batch_size=2)
+
+        dispatcher.enqueue(object, 'user0')
+        started.wait(5)
+        for index in range(1, 4):
+            dispatcher.enqueue(object, f'user{index}')
+        release.set()
+        dispatcher.flush()
+
+        self.assertEqual(self.batches, [['user0'], ['user1', 'user2'], ['user3']])
+
+    @patch('auth_backends.dispatch.set_custom_attribute')
+    def test_backpressure(self, mock_set_attr):
+        """ Verify payloads are dropped, and counted, when the queue is full. """
+        dispatcher = DeferredSignalDispatcher(self.signal, workers=0, queue_size=1)
+
+        self.assertTrue(dispatcher.enqueue(object, 'user0'))
+        with self.assertLogs('auth_backends.dispatch', 'WARNING'):
+            self.assertFalse(dispatcher.enqueue(object, 'user1'))
+
+        self.assertEqual(dispatcher.dropped, 1)
+        mock_set_attr.assert_any_call('auth_complete_signal.queue_depth', 1)
+        mock_set_attr.assert_any_call('auth_complete_signal.dropped', 1)
+
+    def test_failing_receiver(self):
+        """ Verify a failing receiver is logged, without preventing delivery to the other receivers. """
+        def failing_receiver(sender, user, **kwargs):
+            raise ValueError
+
+        self.signal.connect(failing_receiver, weak=False)
+        self.signal.connect(self.receiver, weak=False)
+        dispatcher = DeferredSignalDispatcher(self.signal)
+
+        with self.assertLogs('auth_backends.dispatch', 'ERROR'):
+            dispatcher.enqueue(object, 'jsmith')
+            dispatcher.flush()
+        self.assertEqual(len(self.received), 1)
+
+    def test_get_dispatcher(self):
+        """ Verify dispatchers are shared per signal and configuration. """
+        self.assertIs(get_dispatcher(self.signal), get_dispatcher(self.signal))
+        self.assertIsNot(get_dispatcher(self.signal), get_dispatcher(self.signal, batch_size=1))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'os.fork is not available')
+    def test_fork(self):
+        """ Verify a forked process starts its own workers, rather than queueing payloads for the parent's. """
+        read_fd, write_fd = os.pipe()
+        delivered = threading.Event()
+
+        def receiver(sender, user, **kwargs):  # pylint: disable=unused-argument
+            os.write(write_fd, user.encode())
+            delivered.set()
+
+        self.signal.connect(receiver, weak=False)
+        dispatcher = DeferredSignalDispatcher(self.signal, workers=1)
+        dispatcher.enqueue(object, 'parent')
+        dispatcher.flush()
+
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            status = 1
+            try:
+                delivered.clear()
+                dispatcher.enqueue(object, 'child')
+                status = 0 if delivered.wait(5) else 1
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as pipe:
+            self.assertEqual(pipe.read(), b'parentchild')
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
@@ -0,0 +1,55 @@
+""" Tests for the fake_lms module. """
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from social_django.models import UserSocialAuth
+
+from auth_backends.tests.fake_lms import FakeLMS, login
+from auth_backends.urls import oauth2_urlpatterns
+
+User = get_user_model()
+
+urlpatterns = oauth2_urlpatterns
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class FakeLMSTests(TestCase):
+    """ Tests for FakeLMS and login. """
+
+    def setUp(self):
+        super().setUp()
+        self.lms = FakeLMS()
+        self.lms.add_user('jsmith', email='jsmith@example.com', administrator=True)
+        self.enterContext(self.lms.installed())
+
+    def assert_logged_in(self, response, username):
+        """ Verify the response logs the user in, and redirects to the next URL. """
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/next/')
+        self.assertEqual(
+            self.client.session['_auth_user_id'], str(User.objects.get(username=username).pk)
+        )
+
+    def test_login(self):
+        """ Verify users are logged in, and created, with the provider's claims. """
+        with override_settings(**self.lms.settings()):
+            response = login(self.client, self.lms, 'jsmith', next_url='/next/')
+
+        self.assert_logged_in(response, 'jsmith')
+        user = User.objects.get(username='jsmith')
+        self.assertEqual((user.email, user.first_name), ('jsmith@example.com', 'Jsmith'))
+        self.assertEqual(UserSocialAuth.objects.get(user=user).extra_data['user_id'], 1)
+        self.assertEqual(self.lms.request_count, 1)
+
+    def test_login_with_signature_verification(self):
+        """ Verify the issued access tokens are verified against the provider's JWKS. """
+        with override_settings(**self.lms.settings(SOCIAL_AUTH_EDX_OAUTH2_VERIFY_SIGNATURE=True)):
+            response = login(self.client, self.lms, 'jdoe', next_url='/next/')
+        self.assert_logged_in(response, 'jdoe')
+        self.assertEqual(self.lms.request_count, 2)
+
+    def test_invalid_code(self):
+        """ Verify unknown authorization codes are rejected. """
+        self.assertEqual(self.lms.handle('POST', f'{self.lms.url_root}/oauth2/access_token', (
+            f'grant_type=authorization_code&client_id={self.lms.client_id}&code=unknown'
+        )), (400, {'error': 'invalid_grant'}))
+        self.assertEqual(self.lms.handle('GET', f'{self.lms.url_root}/unknown', None)[0], 404)
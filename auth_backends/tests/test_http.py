@@ -0,0 +1,228 @@
+""" Tests for the http module. """
+import unittest
+from unittest.mock import patch
+
+import ddt
+import requests
+import responses
+from django.test import SimpleTestCase
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from auth_backends import http
+
+try:
+    import httpx
+    import respx
+except ImportError:  # pragma: no cover
+    httpx = respx = None
+
+
+class GetSessionTests(SimpleTestCase):
+    """ Tests for the pooled provider sessions. """
+
+    def tearDown(self):
+        http.close_sessions()
+        super().tearDown()
+
+    def test_session_is_shared(self):
+        """ Verify the same session is returned for the same pool configuration. """
+        self.assertIs(http.get_session(), http.get_session())
+        self.assertIsNot(http.get_session(), http.get_session(pool_maxsize=http.DEFAULT_POOL_MAXSIZE + 1))
+
+    def test_pool_configuration(self):
+        """ Verify the session's adapters are configured with the requested pool sizes. """
+        session = http.get_session(pool_connections=2, pool_maxsize=20, pool_block=True)
+        adapter = session.get_adapter('https://example.com')
+        self.assertEqual(adapter._pool_connections, 2)  # pylint: disable=protected-access
+        self.assertEqual(adapter._pool_maxsize, 20)  # pylint: disable=protected-access
+        self.assertTrue(adapter._pool_block)  # pylint: disable=protected-access
+
+    @responses.activate
+    def test_cookies_are_not_kept(self):
+        """ Verify the cookies set by a response are not sent with the next request, made for another user. """
+        responses.add(responses.POST, 'https://example.com/token', headers={'Set-Cookie': 'AWSALB=sticky; Path=/'})
+        responses.add(responses.POST, 'https://example.com/token')
+        session = http.get_session()
+
+        self.assertEqual(session.post('https://example.com/token').cookies['AWSALB'], 'sticky')
+        session.post('https://example.com/token')
+        self.assertNotIn('Cookie', responses.calls[1].request.headers)
+        self.assertEqual(len(session.cookies), 0)
+
+    def test_close_sessions(self):
+        """ Verify closed sessions are replaced by new ones. """
+        session = http.get_session()
+        http.close_sessions()
+        self.assertIsNot(session, http.get_session())
+
+
+class AsyncRequestTests(SimpleTestCase):
+    """ Tests for non-blocking provider requests. """
+
+    def tearDown(self):
+        http.close_sessions()
+        super().tearDown()
+
+    @staticmethod
+    def mock_client(handler):
+        """ Patches the async client with one that passes requests to the given handler. """
+        return patch(
+            'auth_backends.http.get_async_client',
+            return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    async def test_response_conversion(self):
+        """ Verify httpx responses are returned as requests responses. """
+        def handler(request):
+            self.assertEqual(request.url.params['a'], 'b')
+            self.assertEqual(request.content, b'code=123')
+            return httpx.Response(400, json={'error': 'invalid_grant'})
+
+        with self.mock_client(handler):
+            response = await http.async_request('POST', 'https://example.com/token', params={'a': 'b'},
+                                                data={'code': '123'}, timeout=(1, 2))
+
+        self.assertIsInstance(response, requests.Response)
+        self.assertEqual(response.json(), {'error': 'invalid_grant'})
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        with self.assertRaises(requests.HTTPError) as context:
+            response.raise_for_status()
+        self.assertEqual(context.exception.response.status_code, 400)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    async def test_transport_errors(self):
+        """ Verify httpx transport errors are raised as the equivalent requests exceptions. """
+        for error, expected in (
+            (httpx.ConnectTimeout('timeout'), requests.ConnectTimeout),
+            (httpx.ReadTimeout('timeout'), requests.ReadTimeout),
+            (httpx.ConnectError('refused'), requests.ConnectionError),
+        ):
+            def handler(request, error=error):
+                raise error
+
+            with self.subTest(error=error), self.mock_client(handler), self.assertRaises(expected):
+                await http.async_request('GET', 'https://example.com')
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    async def test_async_client_is_shared(self):
+        """ Verify the async client is shared within an event loop. """
+        client = http.get_async_client()
+        self.assertIs(client, http.get_async_client())
+        await http.close_async_clients()
+        self.assertIsNot(client, http.get_async_client())
+        await http.close_async_clients()
+
+    @unittest.skipIf(respx is None, 'respx is not installed')
+    async def test_async_client_cookies_are_not_kept(self):
+        """ Verify the async client does not send the cookies set by a response with the next request. """
+        with respx.mock:
+            route = respx.post('https://example.com/token').mock(side_effect=[
+                httpx.Response(200, headers={'Set-Cookie': 'AWSALB=sticky; Path=/'}),
+                httpx.Response(200),
+            ])
+            response = await http.async_request('POST', 'https://example.com/token')
+            await http.async_request('POST', 'https://example.com/token')
+        await http.close_async_clients()
+
+        self.assertEqual(response.headers['Set-Cookie'], 'AWSALB=sticky; Path=/')
+        self.assertNotIn('Cookie', route.calls[1].request.headers)
+
+    @responses.activate
+    async def test_without_httpx(self):
+        """ Verify the pooled session is used on a worker thread if httpx is not installed. """
+        responses.add(responses.GET, 'https://example.com', body='pong')
+        with patch('auth_backends.http.httpx', None):
+            response = await http.async_request('GET', 'https://example.com')
+        self.assertEqual(response.text, 'pong')
+
+
+@ddt.ddt
+class RetryTests(SimpleTestCase):
+    """ Tests for the retry helpers. """
+
+    @ddt.data(
+        ('POST', requests.ConnectTimeout(), True),
+        ('POST', requests.ConnectionError(MaxRetryError(None, '/', NewConnectionError(None, 'refused'))), True),
+        ('POST', requests.ConnectionError('reset'), False),
+        ('POST', requests.ReadTimeout(), False),
+        ('GET', requests.ConnectionError('reset'), True),
+        ('GET', requests.ReadTimeout(), True),
+    )
+    @ddt.unpack
+    def test_is_retryable_error(self, method, error, expected):
+        """ Verify errors are only retried for idempotent methods, unless the request was never sent. """
+        self.assertEqual(http.is_retryable(method, error=error), expected)
+
+    @ddt.data(('GET', 503, True), ('GET', 500, False), ('GET', 404, False), ('POST', 503, False))
+    @ddt.unpack
+    def test_is_retryable_response(self, method, status, expected):
+        """ Verify only gateway errors are retried, for idempotent methods. """
+        response = requests.Response()
+        response.status_code = status
+        self.assertEqual(http.is_retryable(method, response=response), expected)
+
+    def test_retry_delay(self):
+        """ Verify delays are jittered, back off exponentially and are capped. """
+        for attempt, upper_bound in ((0, 0.2), (1, 0.4), (10, 2)):
+            delays = [http.retry_delay(attempt) for _ in range(100)]
+            self.assertTrue(all(0 <= delay <= upper_bound for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """ Tests for CircuitBreaker. """
+
+    def setUp(self):
+        super().setUp()
+        self.now = 0
+        self.breaker = http.CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: self.now)
+
+    def open_circuit(self):
+        """ Records enough failures to open the circuit. """
+        self.assertFalse(self.breaker.record_failure())
+        self.assertTrue(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, http.CircuitBreaker.OPEN)
+
+    def test_closed(self):
+        """ Verify requests are allowed, and successes reset the failure count. """
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, http.CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_open(self):
+        """ Verify requests are rejected until the reset timeout has passed, and then a single trial is allowed. """
+        self.open_circuit()
+        self.assertFalse(self.breaker.allow_request())
+
+        self.now = 10
+        self.assertEqual(self.breaker.state, http.CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_trial_success(self):
+        """ Verify a successful trial request closes the circuit. """
+        self.open_circuit()
+        self.now = 10
+        self.breaker.allow_request()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, http.CircuitBreaker.CLOSED)
+
+    def test_trial_failure(self):
+        """ Verify a failed trial request opens the circuit again. """
+        self.open_circuit()
+        self.now = 10
+        self.breaker.allow_request()
+        self.assertFalse(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, http.CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_get_circuit_breaker(self):
+        """ Verify circuit breakers are shared per name and configuration. """
+        breaker = http.get_circuit_breaker('example.com')
+        self.assertIs(breaker, http.get_circuit_breaker('example.com'))
+        self.assertIsNot(breaker, http.get_circuit_breaker('example.org'))
+        http.reset_circuit_breakers()
+        self.assertIsNot(breaker, http.get_circuit_breaker('example.com'))
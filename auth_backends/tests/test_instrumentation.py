@@ -0,0 +1,95 @@
+""" Tests for the instrumentation module. """
+from unittest.mock import call, patch
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from social_django.utils import load_backend, load_strategy
+
+from auth_backends.instrumentation import instrument_pipeline_step
+
+User = get_user_model()
+
+
+def count_users(**kwargs):  # pylint: disable=unused-argument
+    """ Pipeline step running a query. """
+    return {'user_count': User.objects.count()}
+
+
+def interrupt(**kwargs):  # pylint: disable=unused-argument
+    """ Pipeline step interrupting the pipeline. """
+    return HttpResponse()
+
+
+def fail(**kwargs):
+    """ Pipeline step raising an exception. """
+    raise ValueError(kwargs['user_count'])
+
+
+@patch('auth_backends.instrumentation.set_custom_attribute')
+class InstrumentPipelineStepTests(TestCase):
+    """ Tests for instrument_pipeline_step. """
+
+    def assert_attributes(self, mock_set_attribute, step, query_count, outcome):
+        """ Verifies the custom attributes recorded for a step. """
+        name, duration = mock_set_attribute.call_args_list[0][0]
+        self.assertEqual(name, f'auth_pipeline.{step}.duration_ms')
+        self.assertGreaterEqual(duration, 0)
+        self.assertEqual(mock_set_attribute.call_args_list[1:], [
+            call(f'auth_pipeline.{step}.query_count', query_count),
+            call(f'auth_pipeline.{step}.outcome', outcome),
+        ])
+
+    def test_continue(self, mock_set_attribute):
+        """ Verify the duration, query count and outcome of a step continuing the pipeline are recorded. """
+        step = instrument_pipeline_step(f'{__name__}.count_users', count_users)
+        self.assertEqual(step(), {'user_count': 0})
+        self.assert_attributes(mock_set_attribute, 'count_users', 1, 'continue')
+
+    def test_interrupt(self, mock_set_attribute):
+        """ Verify a step returning a response is recorded as interrupting the pipeline. """
+        step = instrument_pipeline_step(f'{__name__}.interrupt', interrupt)
+        self.assertIsInstance(step(), HttpResponse)
+        self.assert_attributes(mock_set_attribute, 'interrupt', 0, 'interrupt')
+
+    def test_error(self, mock_set_attribute):
+        """ Verify a step raising an exception is recorded as an error. """
+        step = instrument_pipeline_step(f'{__name__}.fail', fail)
+        with self.assertRaises(ValueError):
+            step(user_count=1)
+        self.assert_attributes(mock_set_attribute, 'fail', 0, 'error')
+
+
+class PipelineInstrumentationTests(TestCase):
+    """ Tests for the instrumentation of the pipeline run by EdXOAuth2. """
+
+    pipeline = (f'{__name__}.count_users', f'{__name__}.fail')
+
+    def run_pipeline(self):
+        """ Runs the test pipeline with the edX backend. """
+        backend = load_backend(load_strategy(), 'edx-oauth2', None)
+        with self.assertRaises(ValueError):
+            backend.run_pipeline(self.pipeline)
+
+    @patch('auth_backends.instrumentation.set_custom_attribute')
+    def test_disabled(self, mock_set_attribute):
+        """ Verify steps are not instrumented by default, and the pipeline is run by social-core. """
+        with patch('social_core.backends.base.BaseAuth.run_pipeline') as mock_run_pipeline:
+            backend = load_backend(load_strategy(), 'edx-oauth2', None)
+            backend.run_pipeline(self.pipeline)
+        mock_run_pipeline.assert_called_once_with(self.pipeline, 0)
+
+        self.run_pipeline()
+        mock_set_attribute.assert_not_called()
+
+    @override_settings(SOCIAL_AUTH_INSTRUMENT_PIPELINE=True)
+    @patch('auth_backends.instrumentation.set_custom_attribute')
+    def test_enabled(self, mock_set_attribute):
+        """ Verify every step run is instrumented, with the results of earlier steps passed to later ones. """
+        self.run_pipeline()
+        self.assertEqual(
+            [args[0] for args, _ in mock_set_attribute.call_args_list if args[0].endswith('.outcome')],
+            ['auth_pipeline.count_users.outcome', 'auth_pipeline.fail.outcome'],
+        )
+        mock_set_attribute.assert_any_call('auth_pipeline.count_users.query_count', 1)
+        mock_set_attribute.assert_any_call('auth_pipeline.fail.outcome', 'error')
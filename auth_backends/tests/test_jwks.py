@@ -0,0 +1,167 @@
+""" Tests for the jwks module. """
+import json
+import tempfile
+from unittest.mock import Mock
+
+import jwt
+import requests
+from Cryptodome.PublicKey import RSA
+from django.test import SimpleTestCase
+from jwt.algorithms import RSAAlgorithm
+
+from auth_backends.jwks import (
+    JWKSKeyStore,
+    KeySetFetchError,
+    StaticKeySource,
+    URLKeySource,
+    clear_key_stores,
+    get_key_store,
+    verify_jwt,
+)
+
+
+def generate_jwk(kid):
+    """ Returns a (private PEM key, public JWK dict) pair. """
+    private_key = RSA.generate(2048).export_key('PEM')
+    public_key = RSAAlgorithm(RSAAlgorithm.SHA256).prepare_key(private_key).public_key()
+    jwk = RSAAlgorithm.to_jwk(public_key, as_dict=True)
+    jwk.update({'kid': kid, 'alg': 'RS512', 'use': 'sig'})
+    return private_key, jwk
+
+
+class FakeClock:
+    """ Manually advanced monotonic clock. """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class JWKSKeyStoreTests(SimpleTestCase):
+    """ Tests for JWKSKeyStore. """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key, cls.jwk = generate_jwk('key-1')
+        cls.rotated_private_key, cls.rotated_jwk = generate_jwk('key-2')
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.jwks = {'keys': [self.jwk]}
+        self.source = Mock(side_effect=lambda: self.jwks)
+        self.store = JWKSKeyStore(self.source, ttl=100, stale_ttl=50, min_refresh_interval=10, clock=self.clock)
+        # pylint: disable=protected-access
+        self.store._refresh_in_background = Mock(wraps=self.store._refresh_in_background)
+
+    def test_keys_are_cached(self):
+        """ Verify the source is only loaded once while the keys are fresh. """
+        self.assertEqual(self.store.get_key('key-1').key_id, 'key-1')
+        self.clock.now += 99
+        self.assertEqual(self.store.get_key('key-1').key_id, 'key-1')
+        self.assertEqual(self.source.call_count, 1)
+
+    def test_single_key_without_kid(self):
+        """ Verify a token without a kid can be verified when the key set holds a single key. """
+        self.assertEqual(self.store.get_key(None).key_id, 'key-1')
+
+    def test_stale_keys_are_served_while_refreshing(self):
+        """ Verify stale keys are returned immediately while a background refresh runs. """
+        self.store.get_key('key-1')
+        self.clock.now += 120
+        self.assertEqual(self.store.get_key('key-1').key_id, 'key-1')
+        self.store._refresh_in_background.assert_called_once_with()  # pylint: disable=protected-access
+
+    def test_background_refresh_failure(self):
+        """ Verify a failed background refresh keeps the previous keys. """
+        self.store.get_key('key-1')
+        self.source.side_effect = ValueError('provider down')
+        self.store._background_refresh()  # pylint: disable=protected-access
+        self.assertEqual(self.store.get_key('key-1').key_id, 'key-1')
+
+    def test_fetch_error(self):
+        """ Verify failures to load the key set are raised as PyJWTError, so that tokens are rejected. """
+        for error in (requests.ConnectionError('provider down'), json.JSONDecodeError('Expecting value', '', 0)):
+            self.source.side_effect = error
+            with self.assertRaises(KeySetFetchError) as context:
+                self.store.get_key('key-1')
+            self.assertIsInstance(context.exception, jwt.PyJWTError)
+            self.assertIs(context.exception.__cause__, error)
+
+    def test_expired_keys_are_refreshed_synchronously(self):
+        """ Verify keys past the stale window are reloaded before being used. """
+        self.store.get_key('key-1')
+        self.clock.now += 150
+        self.jwks = {'keys': [self.rotated_jwk]}
+        with self.assertRaises(KeyError):
+            self.store.get_key('key-1')
+        self.assertEqual(self.source.call_count, 2)
+
+    def test_unknown_kid(self):
+        """ Verify an unknown kid triggers a (rate limited) refresh. """
+        self.store.get_key('key-1')
+        self.jwks = {'keys': [self.jwk, self.rotated_jwk]}
+
+        with self.assertRaises(KeyError):
+            self.store.get_key('key-2')
+        self.assertEqual(self.source.call_count, 1)
+
+        self.clock.now += 10
+        self.assertEqual(self.store.get_key('key-2').key_id, 'key-2')
+        self.assertEqual(self.source.call_count, 2)
+
+    def test_unknown_kid_after_failed_refresh(self):
+        """ Verify failed refreshes also rate limit the refreshes for unknown kid values. """
+        self.store.get_key('key-1')
+        self.clock.now += 10
+        self.source.side_effect = requests.ConnectionError('provider down')
+
+        with self.assertRaises(KeySetFetchError):
+            self.store.get_key('key-2')
+        for _ in range(3):
+            with self.assertRaises(KeyError):
+                self.store.get_key('key-2')
+        self.assertEqual(self.source.call_count, 2)
+
+    def test_verify_jwt(self):
+        """ Verify tokens are verified with the key matching their kid. """
+        token = jwt.encode({'sub': 'jsmith'}, self.private_key, algorithm='RS512', headers={'kid': 'key-1'})
+        self.assertEqual(verify_jwt(token, self.store), {'sub': 'jsmith'})
+
+        forged = jwt.encode({'sub': 'jsmith'}, self.rotated_private_key, algorithm='RS512', headers={'kid': 'key-1'})
+        with self.assertRaises(jwt.InvalidSignatureError):
+            verify_jwt(forged, self.store)
+
+        unknown = jwt.encode({'sub': 'jsmith'}, self.private_key, algorithm='RS512', headers={'kid': 'other'})
+        with self.assertRaises(jwt.InvalidKeyError):
+            verify_jwt(unknown, self.store)
+
+
+class KeySourceTests(SimpleTestCase):
+    """ Tests for the key sources. """
+
+    def test_static_file_source(self):
+        """ Verify key sets can be loaded from a JSON file. """
+        _, jwk = generate_jwk('key-1')
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'keys': [jwk]}, f)
+            f.flush()
+            self.assertEqual(StaticKeySource(f.name)(), {'keys': [jwk]})
+
+    def test_url_source(self):
+        """ Verify key sets are fetched with the given session. """
+        session = Mock()
+        session.get.return_value.json.return_value = {'keys': []}
+        self.assertEqual(URLKeySource('https://example.com/jwks', session, timeout=3)(), {'keys': []})
+        session.get.assert_called_once_with('https://example.com/jwks', timeout=3)
+
+    def test_get_key_store(self):
+        """ Verify key stores are shared per cache key. """
+        self.addCleanup(clear_key_stores)
+        store = get_key_store('a', lambda: StaticKeySource({}), ttl=5)
+        self.assertIs(store, get_key_store('a', lambda: StaticKeySource({})))
+        self.assertEqual(store.ttl, 5)
+        self.assertIsNot(store, get_key_store('b', lambda: StaticKeySource({})))
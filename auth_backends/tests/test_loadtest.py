@@ -0,0 +1,70 @@
+""" Tests for the loadtest module. """
+from unittest.mock import Mock
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, OperationalError
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from auth_backends.tests.loadtest import ContentionCounter, LoadTestResult, run_load_test
+from auth_backends.urls import oauth2_urlpatterns
+
+User = get_user_model()
+
+urlpatterns = oauth2_urlpatterns
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class LoadTestTests(TransactionTestCase):
+    """ Tests for run_load_test. """
+
+    def test_run_load_test(self):
+        """ Verify the simulated users log in the given number of times. """
+        result = run_load_test(users=1, logins=3, prefix='load-')
+        self.assertEqual(len(result.latencies), 3)
+        self.assertEqual(result.failures, 0)
+        self.assertGreater(result.throughput, 0)
+        self.assertGreater(result.counters['queries'], 0)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['load-0'])
+        self.assertEqual(result.created_user_ids, [User.objects.get().pk])
+
+    def test_cleanup(self):
+        """ Verify only the users created by the load test are deleted, even if others share the prefix. """
+        existing = User.objects.create(username='load-0')
+        other = User.objects.create(username='load-other')
+        result = run_load_test(users=1, logins=1, prefix='load-', cleanup=True)
+        self.assertEqual((result.failures, result.created_user_ids), (0, []))
+
+        result = run_load_test(users=1, logins=1, prefix='load-new-', cleanup=True)
+        self.assertEqual((result.failures, len(result.created_user_ids)), (0, 1))
+        self.assertEqual(list(User.objects.order_by('pk')), [existing, other])
+
+    def test_blank_prefix(self):
+        """ Verify blank prefixes, which would simulate users with the usernames of real users, are rejected. """
+        for prefix in ('', ' '):
+            with self.assertRaises(ValueError):
+                run_load_test(users=1, logins=1, prefix=prefix)
+        self.assertFalse(User.objects.exists())
+
+
+class LoadTestResultTests(SimpleTestCase):
+    """ Tests for LoadTestResult and ContentionCounter. """
+
+    def test_merge(self):
+        """ Verify the results of concurrent runs are combined. """
+        result = LoadTestResult([0.1, 0.2], failures=1, elapsed=2, counters={'queries': 3}, created_user_ids=[1])
+        result.merge(LoadTestResult([0.3], elapsed=1, counters={'queries': 2}, created_user_ids=[2]))
+        self.assertEqual(result.created_user_ids, [1, 2])
+        self.assertEqual(result.latencies, [0.1, 0.2, 0.3])
+        self.assertEqual((result.failures, result.elapsed, result.counters), (1, 2, {'queries': 5}))
+        self.assertEqual(result.throughput, 1)
+        self.assertAlmostEqual(result.percentile(50), 0.2)
+
+    def test_contention_counter(self):
+        """ Verify lock and integrity errors are counted. """
+        counter = ContentionCounter()
+        for error in (OperationalError('database is locked'), OperationalError('no such table'), IntegrityError()):
+            with self.assertRaises(type(error)):
+                counter(Mock(side_effect=error), 'SELECT 1', (), False, {})
+        counter(Mock(), 'SELECT 1', (), False, {})
+        self.assertEqual(counter.counts['queries'], 4)
+        self.assertEqual((counter.counts['lock_errors'], counter.counts['integrity_errors']), (1, 1))
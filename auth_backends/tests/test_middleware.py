@@ -0,0 +1,222 @@
+""" Tests for the middleware module. """
+import time
+from unittest.mock import patch
+
+import jwt
+from Cryptodome.PublicKey import RSA
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from jwt.algorithms import RSAAlgorithm
+from social_core.exceptions import AuthTokenError
+from social_django.utils import load_backend, load_strategy
+
+from auth_backends.jwks import clear_key_stores
+from auth_backends.middleware import ExpiringLRUCache, JwtAuthenticationMiddleware, JwtUserResolver
+
+User = get_user_model()
+KEY = RSA.generate(2048).export_key('PEM')
+URL_ROOT = 'https://lms.example.com'
+CLIENT_ID = 'client-id'
+JWKS = {'keys': [RSAAlgorithm.to_jwk(RSAAlgorithm(RSAAlgorithm.SHA512).prepare_key(KEY).public_key(), as_dict=True)]}
+
+
+def create_token(key=KEY, headers=None, **claims):
+    """ Returns a signed JWT access token with the given claims. """
+    payload = {
+        'exp': int(time.time()) + 3600,
+        'iss': f'{URL_ROOT}/oauth2',
+        'aud': CLIENT_ID,
+        'preferred_username': 'jsmith',
+        'email': 'jsmith@example.com',
+        'given_name': 'Joe',
+        'family_name': 'Smith',
+        'administrator': False,
+        **claims,
+    }
+    return jwt.encode(payload, key, algorithm='RS512', headers=headers)
+
+
+class ExpiringLRUCacheTests(TestCase):
+    """ Tests for ExpiringLRUCache. """
+
+    def test_eviction(self):
+        """ Verify the least recently used entry is evicted. """
+        lru = ExpiringLRUCache(maxsize=2)
+        expires_at = time.time() + 60
+        lru.set('a', 1, expires_at)
+        lru.set('b', 2, expires_at)
+        lru.get('a')
+        lru.set('c', 3, expires_at)
+        self.assertEqual([lru.get(key) for key in 'abc'], [1, None, 3])
+
+        lru.clear()
+        self.assertIsNone(lru.get('a'))
+
+    def test_expiry(self):
+        """ Verify expired entries are not returned. """
+        now = [0]
+        lru = ExpiringLRUCache(clock=lambda: now[0])
+        lru.set('a', 1, 10)
+        self.assertEqual(lru.get('a'), 1)
+        now[0] = 10
+        self.assertIsNone(lru.get('a'))
+
+
+@override_settings(
+    SOCIAL_AUTH_EDX_OAUTH2_JWKS=JWKS, SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT=URL_ROOT,
+    SOCIAL_AUTH_EDX_OAUTH2_KEY='service-client-id', SOCIAL_AUTH_EDX_OAUTH2_JWT_AUDIENCE=CLIENT_ID,
+)
+class JwtAuthenticationMiddlewareTests(TestCase):
+    """ Tests for JwtAuthenticationMiddleware. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        clear_key_stores()
+        self.middleware = JwtAuthenticationMiddleware(lambda request: HttpResponse())
+
+    def call_middleware(self, authorization=None):
+        """ Passes a request with the given Authorization header through the middleware. """
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        request = RequestFactory().get('/api/', **headers)
+        request.user = AnonymousUser()
+        response = self.middleware(request)
+        return request, response
+
+    def test_without_token(self):
+        """ Verify requests without a JWT are left untouched. """
+        for authorization in (None, 'Bearer abc', 'JWT '):
+            request, response = self.call_middleware(authorization)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(request.user.is_anonymous)
+
+    def test_invalid_token(self):
+        """ Verify requests with an invalid JWT are rejected. """
+        other_key = RSA.generate(2048).export_key('PEM')
+        for token in (
+                create_token(key=other_key),
+                create_token(preferred_username=None),
+                create_token(aud='other-client-id'),
+                create_token(iss='https://other.example.com/oauth2'),
+                create_token(is_restricted=True),
+                create_token(headers={'kid': 'unknown'}),
+        ):
+            _, response = self.call_middleware(f'JWT {token}')
+            self.assertEqual(response.status_code, 401)
+
+    def test_unreachable_jwks(self):
+        """ Verify tokens are rejected when the provider's keys cannot be fetched. """
+        with patch('auth_backends.jwks.StaticKeySource.__call__', side_effect=OSError('unreachable')):
+            _, response = self.call_middleware(f'JWT {create_token()}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_inactive_user(self):
+        """ Verify requests made for inactive users are rejected. """
+        User.objects.create(username='jsmith', is_active=False)
+        _, response = self.call_middleware(f'JWT {create_token()}')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(SOCIAL_AUTH_EDX_OAUTH2_JWT_AUDIENCE='lms-key', SOCIAL_AUTH_EDX_OAUTH2_JWT_ISSUER=URL_ROOT)
+    def test_issuer_and_audience_settings(self):
+        """ Verify the expected issuer and audience can be configured. """
+        _, response = self.call_middleware(f'JWT {create_token()}')
+        self.assertEqual(response.status_code, 401)
+        request, _ = self.call_middleware(f'JWT {create_token(aud="lms-key", iss=URL_ROOT)}')
+        self.assertTrue(request.user.is_authenticated)
+
+    def test_audience_required(self):
+        """ Verify the middleware fails to load without an expected audience, rather than accepting the client id. """
+        with override_settings(SOCIAL_AUTH_EDX_OAUTH2_JWT_AUDIENCE=None):
+            with self.assertRaises(ImproperlyConfigured):
+                JwtAuthenticationMiddleware(lambda request: HttpResponse())
+
+    def test_concurrently_created_user(self):
+        """ Verify a user created by a concurrent request is used, rather than failing the request. """
+        user = User.objects.create(username='jsmith', email='jsmith@example.com')
+        with patch('django.db.models.query.QuerySet.get_or_create', side_effect=IntegrityError):
+            request, _ = self.call_middleware(f'JWT {create_token()}')
+        self.assertEqual(request.user, user)
+
+    def test_new_user(self):
+        """ Verify the token's user is created, without the roles of the token. """
+        request, _ = self.call_middleware(f'JWT {create_token(administrator=True, superuser=True)}')
+        user = User.objects.get(username='jsmith')
+        self.assertEqual(request.user, user)
+        self.assertEqual((user.email, user.first_name, user.last_name), ('jsmith@example.com', 'Joe', 'Smith'))
+        self.assertFalse(user.is_staff)
+        self.assertFalse(user.is_superuser)
+
+    def test_roles_unchanged(self):
+        """ Verify the roles of existing users are not changed by the claims of their tokens. """
+        User.objects.create(username='jsmith', is_staff=True)
+        self.call_middleware(f'JWT {create_token(administrator=False)}')
+        self.assertTrue(User.objects.get(username='jsmith').is_staff)
+
+    def test_cached_user(self):
+        """ Verify the user is resolved once per token, and only changed fields are written. """
+        User.objects.create(username='jsmith', email='old@example.com', first_name='Joe', last_name='Smith')
+        token = create_token()
+
+        with self.assertNumQueries(2):
+            request, _ = self.call_middleware(f'JWT {token}')
+        self.assertEqual(User.objects.get(username='jsmith').email, 'jsmith@example.com')
+
+        with self.assertNumQueries(0):
+            cached_request, _ = self.call_middleware(f'JWT {token}')
+        self.assertEqual(cached_request.user, request.user)
+        self.assertIsNot(cached_request.user, request.user)
+
+        with self.assertNumQueries(1):
+            self.call_middleware(f'JWT {create_token(iat=1)}')
+
+    @override_settings(SOCIAL_AUTH_EDX_OAUTH2_JWT_USER_SHARED_CACHE='default')
+    def test_shared_cache(self):
+        """ Verify users are shared with other processes through the shared cache. """
+        token = create_token()
+        request, _ = self.call_middleware(f'JWT {token}')
+
+        self.middleware.resolver.local_cache.clear()
+        with self.assertNumQueries(0), patch('auth_backends.backends.EdXOAuth2.verify_access_token') as mock_verify:
+            cached_request, _ = self.call_middleware(f'JWT {token}')
+        mock_verify.assert_not_called()
+        self.assertEqual(cached_request.user, request.user)
+
+    def test_invalidated_user(self):
+        """ Verify cached users are invalidated when the user is saved, e.g. deactivated. """
+        token = create_token()
+        request, _ = self.call_middleware(f'JWT {token}')
+        user = User.objects.get(pk=request.user.pk)
+        user.is_active = False
+        user.save()
+
+        _, response = self.call_middleware(f'JWT {token}')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(SOCIAL_AUTH_EDX_OAUTH2_JWT_USER_SHARED_CACHE='default')
+    def test_invalidated_shared_user(self):
+        """ Verify users cached in the shared cache are invalidated when the user is deleted. """
+        token = create_token()
+        request, _ = self.call_middleware(f'JWT {token}')
+        User.objects.filter(pk=request.user.pk).delete()
+
+        self.middleware.resolver.local_cache.clear()
+        with patch('auth_backends.backends.EdXOAuth2.verify_access_token', side_effect=AuthTokenError(None)):
+            _, response = self.call_middleware(f'JWT {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_local_ttl(self):
+        """ Verify users are kept in the in-process cache for a limited time, to see the changes of other processes. """
+        now = [time.time()]
+        resolver = JwtUserResolver(load_backend(load_strategy(), 'edx-oauth2', None), clock=lambda: now[0])
+        token = create_token()
+        resolver.resolve(token)
+
+        now[0] += 61
+        with patch('auth_backends.backends.EdXOAuth2.verify_access_token', side_effect=AuthTokenError(None)):
+            with self.assertRaises(AuthTokenError):
+                resolver.resolve(token)
@@ -1,11 +1,22 @@
 """ Tests for pipelines. """
 
 from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from social_django.utils import load_strategy
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from social_core.exceptions import AuthAlreadyAssociated
+from social_django.models import UserSocialAuth
+from social_django.utils import load_backend, load_strategy
 
-from auth_backends.pipeline import get_user_if_exists, update_email
+from auth_backends.pipeline import (
+    get_social_and_user,
+    get_user_if_exists,
+    save_user_changes,
+    update_email,
+    user_details,
+)
 
 User = get_user_model()
 
@@ -36,6 +47,169 @@ class GetUserIfExistsPipelineTests(TestCase):
         self.assertDictEqual(actual, {'is_new': False})
 
 
+class GetSocialAndUserPipelineTests(TestCase):
+    """ Tests for the get_social_and_user pipeline function. """
+
+    def setUp(self):
+        super().setUp()
+        self.username = 'edx'
+        self.details = {'username': self.username}
+        self.backend = load_backend(load_strategy(), 'edx-oauth2', None)
+
+    def test_new_user(self):
+        """ Verify nothing is resolved for a new user. """
+        actual = get_social_and_user(self.backend, self.username, self.details)
+        self.assertDictEqual(actual, {'social': None, 'user': None, 'is_new': True, 'new_association': True})
+
+    def test_existing_user_without_association(self):
+        """ Verify an existing user is resolved by username if they have no association yet. """
+        user = User.objects.create(username=self.username)
+        with self.assertNumQueries(2):
+            actual = get_social_and_user(self.backend, self.username, self.details)
+        self.assertDictEqual(actual, {'social': None, 'user': user, 'is_new': False, 'new_association': True})
+
+    def test_existing_association(self):
+        """ Verify the association and its user are resolved with a single query. """
+        user = User.objects.create(username=self.username)
+        social = UserSocialAuth.objects.create(user=user, provider='edx-oauth2', uid=self.username)
+        with self.assertNumQueries(1):
+            actual = get_social_and_user(self.backend, self.username, self.details)
+            self.assertEqual(actual['user'], user)
+        self.assertDictEqual(actual, {'social': social, 'user': user, 'is_new': False, 'new_association': False})
+
+    def test_association_with_another_user(self):
+        """ Verify an error is raised if the association belongs to a different user than the one logged in. """
+        user = User.objects.create(username=self.username)
+        UserSocialAuth.objects.create(user=user, provider='edx-oauth2', uid=self.username)
+        other_user = User.objects.create(username='other')
+        with self.assertRaises(AuthAlreadyAssociated):
+            get_social_and_user(self.backend, self.username, self.details, user=other_user)
+
+
+@override_settings(SOCIAL_AUTH_OPTIMIZED_PIPELINE=True)
+class OptimizedPipelineTests(TestCase):
+    """ Tests for the optimized login pipeline. """
+
+    def setUp(self):
+        super().setUp()
+        self.strategy = load_strategy()
+        self.backend = load_backend(self.strategy, 'edx-oauth2', None)
+        self.response = {
+            'preferred_username': 'jsmith',
+            'email': 'jsmith@example.com',
+            'given_name': 'Joe',
+            'family_name': 'Smith',
+            'user_id': '1',
+            'access_token': 'access-token',
+        }
+
+    def run_pipeline(self):
+        """ Runs the login pipeline and returns its output. """
+        return self.backend.run_pipeline(self.strategy.get_pipeline(self.backend), response=self.response)
+
+    def test_new_user(self):
+        """ Verify the user and association are created for a new user. """
+        out = self.run_pipeline()
+        self.assertTrue(out['is_new'])
+        self.assertEqual(out['user'].username, 'jsmith')
+        self.assertEqual(out['social'].user, out['user'])
+        self.assertEqual(out['social'].extra_data['user_id'], '1')
+
+    def test_returning_user_query_count(self):
+        """ Verify a returning user's login reads the association and user once, and only updates the extra data. """
+        self.run_pipeline()
+        self.response['access_token'] = 'new-access-token'
+
+        with self.assertNumQueries(2):
+            out = self.run_pipeline()
+
+        self.assertFalse(out['is_new'])
+        self.assertEqual(UserSocialAuth.objects.get().extra_data['access_token'], 'new-access-token')
+
+    def test_returning_user_with_changes(self):
+        """ Verify all changes to a returning user are saved with a single write. """
+        self.run_pipeline()
+        self.response.update({'email': 'joe@example.com', 'given_name': 'Joseph', 'access_token': 'new-access-token'})
+
+        with CaptureQueriesContext(connection) as queries:
+            out = self.run_pipeline()
+
+        user_writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "auth_user"')]
+        self.assertEqual(len(user_writes), 1)
+        self.assertEqual(len(queries.captured_queries), 3)
+        self.assertEqual(out['user_changed_fields'], [])
+
+        user = User.objects.get()
+        self.assertEqual((user.email, user.first_name), ('joe@example.com', 'Joseph'))
+
+    def test_default_pipeline(self):
+        """ Verify the default pipeline is used unless the optimized one is enabled. """
+        with override_settings(SOCIAL_AUTH_OPTIMIZED_PIPELINE=False):
+            self.assertIn('auth_backends.pipeline.get_user_if_exists', self.strategy.get_pipeline(self.backend))
+        self.assertIn('auth_backends.pipeline.get_social_and_user', self.strategy.get_pipeline(self.backend))
+
+
+class UserDetailsPipelineTests(TestCase):
+    """ Tests for the user_details and save_user_changes pipeline functions. """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='test_user', first_name='Joe', email='joe@example.com')
+        self.strategy = load_strategy()
+        self.backend = load_backend(self.strategy, 'edx-oauth2', None)
+
+    def test_changed_fields_are_recorded(self):
+        """ Verify changed fields are set and recorded, but not saved, and that protected fields are not changed. """
+        details = {'first_name': 'Joseph', 'last_name': 'Smith', 'email': 'new@example.com', 'is_staff': True}
+        with self.assertNumQueries(0):
+            out = user_details(self.strategy, details, self.backend, user=self.user, user_changed_fields=['email'])
+
+        self.assertEqual(out, {'user_changed_fields': ['email', 'first_name', 'last_name']})
+        self.assertEqual((self.user.first_name, self.user.last_name), ('Joseph', 'Smith'))
+        self.assertFalse(self.user.is_staff)
+        self.assertEqual(User.objects.get().first_name, 'Joe')
+
+    def test_unchanged_fields(self):
+        """ Verify nothing is recorded if the details match the user. """
+        out = user_details(self.strategy, {'first_name': 'Joe', 'last_name': None}, self.backend, user=self.user)
+        self.assertEqual(out, {'user_changed_fields': []})
+
+    def test_save_user_changes(self):
+        """ Verify the changed fields are saved with a single query. """
+        self.user.first_name = 'Joseph'
+        self.user.email = 'new@example.com'
+        with self.assertNumQueries(1):
+            out = save_user_changes(self.strategy, user=self.user, user_changed_fields=['email', 'first_name', 'email'])
+        self.assertEqual(out, {'user_changed_fields': []})
+        self.assertEqual(User.objects.get().first_name, 'Joseph')
+
+    def test_save_non_concrete_changes(self):
+        """ Verify the whole user is saved if attributes other than concrete fields changed. """
+        self.user.nickname = 'Joe'
+        details = {'first_name': 'Joseph', 'nickname': 'Joey'}
+        out = user_details(self.strategy, details, self.backend, user=self.user)
+        self.assertEqual(out, {'user_changed_fields': ['first_name', 'nickname']})
+
+        with self.assertNumQueries(1):
+            save_user_changes(self.strategy, user=self.user, **out)
+        self.assertEqual(User.objects.get().first_name, 'Joseph')
+
+    def test_save_without_changes(self):
+        """ Verify nothing is written if no field changed. """
+        with self.assertNumQueries(0):
+            save_user_changes(self.strategy, user=self.user, user_changed_fields=[])
+
+    @patch('auth_backends.pipeline.set_custom_attribute')
+    def test_update_email_records_change(self, mock_set_attribute):
+        """ Verify update_email records the change rather than saving it when changes are being tracked. """
+        details = {'email': 'new@example.com', 'username': 'test_user'}
+        with self.assertNumQueries(0):
+            out = update_email(self.strategy, details, user=self.user, user_changed_fields=['first_name'])
+        self.assertEqual(out, {'user_changed_fields': ['first_name', 'email']})
+        self.assertEqual(self.user.email, 'new@example.com')
+        mock_set_attribute.assert_called_once_with('update_email.email_updated', True)
+
+
 class UpdateEmailPipelineTests(TestCase):
     """ Tests for the update_email pipeline function. """
 
@@ -0,0 +1,117 @@
+""" Tests for the provision_users management command. """
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db.models import QuerySet
+from django.test import TestCase
+from social_django.models import UserSocialAuth
+
+User = get_user_model()
+
+RECORDS = [
+    {
+        'preferred_username': 'jsmith', 'email': 'jsmith@example.com', 'given_name': 'John', 'family_name': 'Smith',
+        'administrator': True, 'user_id': 1,
+    },
+    {'preferred_username': 'jdoe', 'email': 'jdoe@example.com', 'user_id': 2},
+    {'preferred_username': 'existing', 'email': 'new@example.com', 'user_id': 3},
+    {'email': 'anonymous@example.com'},
+]
+
+
+class ProvisionUsersTests(TestCase):
+    """ Tests for the provision_users management command. """
+
+    def setUp(self):
+        super().setUp()
+        self.existing = User.objects.create(username='existing', email='existing@example.com')
+
+    def write_export(self, content, suffix):
+        """ Writes an export to a temporary file, and returns its path. """
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as export:
+            export.write(content)
+        self.addCleanup(os.remove, export.name)
+        return export.name
+
+    def call_command(self, path, *args):
+        """ Runs the command, and returns its output. """
+        out = StringIO()
+        call_command('provision_users', path, '--batch-size=2', *args, stdout=out)
+        return out.getvalue()
+
+    def assert_provisioned(self):
+        """ Verify the users and associations of RECORDS exist. """
+        jsmith = User.objects.get(username='jsmith')
+        self.assertEqual(
+            (jsmith.email, jsmith.first_name, jsmith.last_name, jsmith.is_staff),
+            ('jsmith@example.com', 'John', 'Smith', False),
+        )
+        self.assertFalse(jsmith.has_usable_password())
+        self.assertEqual(UserSocialAuth.objects.get(uid='jsmith').user, jsmith)
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.email, 'existing@example.com')
+        self.assertEqual(UserSocialAuth.objects.get(uid='existing').user, self.existing)
+
+    def test_jsonl(self):
+        """ Verify users and associations are created from a JSON Lines export, only once. """
+        path = self.write_export('\n'.join(json.dumps(record) for record in RECORDS) + '\n', '.jsonl')
+
+        output = self.call_command(path)
+        self.assertIn('Created 2 users and 3 associations (1 records skipped, 0 unresolved users)', output)
+        self.assert_provisioned()
+        self.assertEqual(UserSocialAuth.objects.get(uid='jsmith').extra_data, {'user_id': 1})
+
+        with self.assertNumQueries(4):
+            output = self.call_command(path)
+        self.assertIn('Created 0 users and 0 associations (1 records skipped, 0 unresolved users)', output)
+
+    def test_csv(self):
+        """ Verify users and associations are created from a CSV export. """
+        path = self.write_export(
+            'preferred_username,email,given_name,family_name,administrator,user_id\n'
+            'jsmith,jsmith@example.com,John,Smith,true,1\n'
+            'jdoe,jdoe@example.com,,,false,2\n'
+            'existing,new@example.com,,,,3\n',
+            '.csv',
+        )
+        self.call_command(path)
+        self.assert_provisioned()
+        self.assertEqual(UserSocialAuth.objects.get(uid='jsmith').extra_data, {'user_id': '1'})
+
+    def test_dry_run(self):
+        """ Verify nothing is written in a dry run. """
+        path = self.write_export('\n'.join(json.dumps(record) for record in RECORDS), '.jsonl')
+        output = self.call_command(path, '--dry-run')
+        self.assertIn('Would create 2 users and 3 associations (1 records skipped, 0 unresolved users)', output)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertFalse(UserSocialAuth.objects.exists())
+
+    def test_conflicting_users(self):
+        """ Verify users skipped because of conflicts are neither counted nor associated. """
+        bulk_create = QuerySet.bulk_create
+
+        def conflicting_bulk_create(queryset, objs, *args, **kwargs):
+            # Simulates a conflict on another unique field of the user model, which skips the insertion of jdoe.
+            return bulk_create(queryset, [obj for obj in objs if getattr(obj, 'username', None) != 'jdoe'], *args,
+                               **kwargs)
+
+        path = self.write_export('\n'.join(json.dumps(record) for record in RECORDS), '.jsonl')
+        with patch.object(QuerySet, 'bulk_create', autospec=True, side_effect=conflicting_bulk_create), \
+                self.assertLogs('auth_backends.management.commands.provision_users') as logs:
+            output = self.call_command(path)
+
+        self.assertIn('Created 1 users and 2 associations (1 records skipped, 1 unresolved users)', output)
+        self.assertIn('could not be created: jdoe', logs.output[0])
+        self.assertFalse(User.objects.filter(username='jdoe').exists())
+        self.assert_provisioned()
+
+    def test_invalid_export(self):
+        """ Verify unreadable exports are reported. """
+        with self.assertRaisesMessage(CommandError, 'Could not read the export'):
+            self.call_command(self.write_export('not json\n', '.jsonl'))
@@ -0,0 +1,232 @@
+""" Tests for the ratelimit module. """
+from unittest.mock import call, patch
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from auth_backends import ratelimit
+from auth_backends.ratelimit import CacheTokenBucket, RateLimiter, TokenBucket
+from auth_backends.tests.fake_lms import FakeLMS, login
+from auth_backends.urls import oauth2_urlpatterns
+
+urlpatterns = oauth2_urlpatterns
+
+
+class FakeClock:
+    """ Clock advanced manually by the tests. """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(SimpleTestCase):
+    """ Tests for TokenBucket and CacheTokenBucket. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.clock = FakeClock()
+
+    def assert_bucket(self, bucket):
+        """ Verify the bucket allows a burst, and is then refilled at its rate. """
+        self.assertEqual([bucket.acquire('a') for _ in range(3)], [0, 0, 0.5])
+        # Other keys have their own bucket.
+        self.assertEqual(bucket.acquire('b'), 0)
+
+        self.clock.now += 0.25
+        self.assertEqual(bucket.acquire('a'), 0.25)
+        self.clock.now += 0.25
+        self.assertEqual(bucket.acquire('a'), 0)
+        self.assertEqual(bucket.acquire('a'), 0.5)
+
+        # The bucket never holds more than the burst.
+        self.clock.now += 60
+        self.assertEqual([bucket.acquire('a') for _ in range(3)], [0, 0, 0.5])
+
+    def test_token_bucket(self):
+        self.assert_bucket(TokenBucket(2, 2, clock=self.clock))
+
+    def test_cache_token_bucket(self):
+        self.assert_bucket(CacheTokenBucket(2, 2, cache, clock=self.clock))
+
+    def test_shared_cache_token_bucket(self):
+        """ Verify the buckets kept in a cache are shared by all instances using it. """
+        first = CacheTokenBucket(1, 1, cache, clock=self.clock)
+        second = CacheTokenBucket(1, 1, cache, clock=self.clock)
+        self.assertEqual(first.acquire('a'), 0)
+        self.assertEqual(second.acquire('a'), 1)
+
+    def test_max_keys(self):
+        """ Verify the least recently used buckets are forgotten. """
+        bucket = TokenBucket(1, 1, max_keys=2, clock=self.clock)
+        for key in ('a', 'b', 'c'):
+            self.assertEqual(bucket.acquire(key), 0)
+        self.assertEqual(bucket.acquire('a'), 0)
+        self.assertEqual(bucket.acquire('c'), 1)
+
+
+class RateLimiterTests(SimpleTestCase):
+    """ Tests for RateLimiter. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @patch('auth_backends.ratelimit.set_custom_attribute')
+    def test_ip_limit(self, mock_set_attr):
+        """ Verify each client IP is limited separately, for each step of the login flow. """
+        limiter = RateLimiter(ip_rate=0.5)
+        self.assertIsNone(limiter.check('login', '10.0.0.1'))
+        self.assertIsNone(limiter.check('login', '10.0.0.2'))
+        self.assertIsNone(limiter.check('begin', '10.0.0.1'))
+
+        mock_set_attr.reset_mock()
+        response = limiter.check('login', '10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(limiter.counts, {'allowed': 3, 'rejected': 1})
+        mock_set_attr.assert_has_calls([
+            call('rate_limit.scope', 'ip'),
+            call('rate_limit.step', 'login'),
+            call('rate_limit.rejected', True),
+            call('rate_limit.allowed_count', 3),
+            call('rate_limit.rejected_count', 1),
+        ])
+
+    @patch('auth_backends.ratelimit.set_custom_attribute')
+    def test_global_limit(self, mock_set_attr):
+        """ Verify the global limit is shared by all clients. """
+        limiter = RateLimiter(ip_rate=10, global_rate=2, cache_alias='default')
+        self.assertIsNone(limiter.check('complete', '10.0.0.1'))
+        self.assertIsNone(limiter.check('complete', '10.0.0.2'))
+        self.assertEqual(limiter.check('complete', '10.0.0.3').status_code, 429)
+        mock_set_attr.assert_any_call('rate_limit.scope', 'global')
+
+    def test_rejected_requests_take_no_token(self):
+        """ Verify a request rejected by one bucket does not take a token from the others. """
+        for cache_alias in (None, 'default'):
+            cache.clear()
+            clock = FakeClock()
+            limiter = RateLimiter(ip_rate=0.1, global_rate=1, cache_alias=cache_alias)
+            for bucket in limiter.buckets.values():
+                bucket.clock = clock
+            self.assertIsNone(limiter.check('login', '10.0.0.1'))
+            self.assertEqual(limiter.check('login', '10.0.0.2').status_code, 429)
+
+            # The global bucket is refilled, and the IP bucket of the rejected client was left full.
+            clock.now += 1
+            self.assertIsNone(limiter.check('login', '10.0.0.2'))
+
+    async def test_acheck(self):
+        """ Verify the async check shares the buckets of the sync check. """
+        for cache_alias in (None, 'default'):
+            limiter = RateLimiter(ip_rate=1, cache_alias=cache_alias)
+            self.assertIsNone(await limiter.acheck('login', '10.0.0.1'))
+            self.assertEqual(limiter.check('login', '10.0.0.1').status_code, 429)
+
+    def test_get_rate_limiter(self):
+        """ Verify rate limiters are shared by the process, and disabled without a rate. """
+        self.assertIsNone(ratelimit.get_rate_limiter())
+        limiter = ratelimit.get_rate_limiter(ip_rate=1)
+        self.assertIs(ratelimit.get_rate_limiter(ip_rate=1), limiter)
+        self.assertIsNot(ratelimit.get_rate_limiter(ip_rate=2), limiter)
+
+        ratelimit.reset_rate_limiters()
+        self.assertIsNot(ratelimit.get_rate_limiter(ip_rate=1), limiter)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class RateLimitedLoginTests(TestCase):
+    """ Tests for the rate limiting of the login flow. """
+
+    def setUp(self):
+        super().setUp()
+        ratelimit.reset_rate_limiters()
+        self.addCleanup(ratelimit.reset_rate_limiters)
+        self.lms = FakeLMS()
+        self.enterContext(self.lms.installed())
+        self.enterContext(override_settings(**self.lms.settings(SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_IP_RATE=0.01)))
+
+    def exhaust(self, step):
+        """ Take the only token of the step's bucket for the test client's IP. """
+        limiter = ratelimit.get_rate_limiter(ip_rate=0.01)
+        self.assertIsNone(limiter.check(step, '127.0.0.1'))
+
+    def test_login(self):
+        """ Verify a login is allowed, and a second one rejected by the login view. """
+        login(self.client, self.lms, 'jsmith')
+        self.assertIn('_auth_user_id', self.client.session)
+
+        self.client.logout()
+        response = self.client.get(reverse('login'))
+        self.assertEqual(response.status_code, 429)
+
+    def test_begin(self):
+        """ Verify rejected begin requests neither read nor write the session, even to store the next URL. """
+        self.exhaust('begin')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('social:begin', args=['edx-oauth2']), {'next': '/dashboard'})
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_complete(self):
+        """ Verify rejected callbacks do not exchange the authorization code. """
+        self.exhaust('complete')
+        steps = {}
+        response = login(self.client, self.lms, 'jsmith', steps=steps)
+        self.assertEqual(steps['begin'].status_code, 302)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.lms.request_count, 0)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_complete_with_session(self):
+        """ Verify rejected callbacks neither load the session nor the user. """
+        # The login took the only token of the complete step.
+        login(self.client, self.lms, 'jsmith')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('social:complete', args=['edx-oauth2']), {'code': 'code'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_disabled(self):
+        """ Verify logins are not rate limited by default. """
+        with override_settings(SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_IP_RATE=None):
+            for _ in range(3):
+                self.assertEqual(login(self.client, self.lms, 'jsmith').status_code, 302)
+
+
+@override_settings(
+    ROOT_URLCONF='auth_backends.tests.test_async_views',
+    SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_IP_RATE=0.01,
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'database': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'rate_limit_cache'},
+    },
+)
+class AsyncRateLimitedLoginTests(TestCase):
+    """ Tests for the rate limiting of the async views. """
+
+    def setUp(self):
+        super().setUp()
+        ratelimit.reset_rate_limiters()
+        self.addCleanup(ratelimit.reset_rate_limiters)
+        call_command('createcachetable', verbosity=0)
+
+    async def test_login(self):
+        self.assertEqual((await self.async_client.get(reverse('login'))).status_code, 302)
+        self.assertEqual((await self.async_client.get(reverse('login'))).status_code, 429)
+
+    @override_settings(SOCIAL_AUTH_EDX_OAUTH2_RATE_LIMIT_CACHE_ALIAS='database')
+    async def test_complete_with_database_cache(self):
+        """ Verify buckets kept in a database cache are checked from async views without blocking the event loop. """
+        limiter = ratelimit.get_rate_limiter(ip_rate=0.01, cache_alias='database')
+        self.assertIsNone(await limiter.acheck('complete', '127.0.0.1'))
+
+        response = await self.async_client.get(reverse('social:complete', args=['edx-oauth2']), {'code': 'code'})
+        self.assertEqual(response.status_code, 429)
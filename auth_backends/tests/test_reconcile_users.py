@@ -0,0 +1,98 @@
+""" Tests for the reconcile_users management command. """
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from social_django.models import UserSocialAuth
+from social_django.utils import load_backend, load_strategy
+
+from auth_backends.middleware import JwtUserResolver
+
+User = get_user_model()
+
+RECORDS = [
+    {'preferred_username': 'jsmith', 'email': 'john@example.com', 'administrator': True},
+    {'preferred_username': 'jdoe', 'email': 'jdoe@example.com'},
+    {'preferred_username': 'renamed', 'email': 'renamed@example.com'},
+    {'preferred_username': 'unknown', 'email': 'unknown@example.com'},
+]
+
+
+class ReconcileUsersTests(TestCase):
+    """ Tests for the reconcile_users management command. """
+
+    def setUp(self):
+        super().setUp()
+        for username, email in (('jsmith', 'jsmith@example.com'), ('jdoe', 'jdoe@example.com'),
+                                ('original', 'original@example.com')):
+            user = User.objects.create(username=username, email=email)
+            uid = 'renamed' if username == 'original' else username
+            UserSocialAuth.objects.create(user=user, provider='edx-oauth2', uid=uid)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as export:
+            export.write('\n'.join(json.dumps(record) for record in RECORDS))
+        self.addCleanup(os.remove, export.name)
+        self.path = export.name
+
+    def call_command(self, *args):
+        """ Runs the command, and returns its output. """
+        out = StringIO()
+        call_command('reconcile_users', self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_reconcile(self):
+        """ Verify only the changed users are updated, with one bulk update per batch. """
+        with self.assertNumQueries(2), self.assertLogs('auth_backends.management.commands.reconcile_users'):
+            output = self.call_command()
+        self.assertIn('Updated 1 of 4 users (1 username mismatches, 1 unknown)', output)
+
+        jsmith = User.objects.get(username='jsmith')
+        self.assertEqual((jsmith.email, jsmith.is_staff, jsmith.is_superuser), ('john@example.com', True, False))
+        self.assertEqual(User.objects.get(username='original').email, 'original@example.com')
+
+    def test_fields(self):
+        """ Verify only the given fields are reconciled. """
+        self.call_command('--fields=email')
+        jsmith = User.objects.get(username='jsmith')
+        self.assertEqual((jsmith.email, jsmith.is_staff), ('john@example.com', False))
+
+    def test_missing_role_claims(self):
+        """ Verify records without role claims neither revoke nor grant roles. """
+        User.objects.filter(username='jdoe').update(is_staff=True, is_superuser=True)
+        with self.assertLogs('auth_backends.management.commands.reconcile_users'):
+            output = self.call_command()
+        self.assertIn('Updated 1 of 4 users', output)
+        jdoe = User.objects.get(username='jdoe')
+        self.assertEqual((jdoe.is_staff, jdoe.is_superuser), (True, True))
+
+    def test_unknown_fields(self):
+        """ Verify unknown fields are rejected. """
+        with self.assertRaisesMessage(CommandError, 'Unknown user fields: nickname'):
+            self.call_command('--fields=email,nickname')
+
+    def test_dry_run(self):
+        """ Verify nothing is written in a dry run. """
+        output = self.call_command('--dry-run')
+        self.assertIn('Would update 1 of 4 users', output)
+        self.assertEqual(User.objects.get(username='jsmith').email, 'jsmith@example.com')
+
+    @patch('auth_backends.user_cache.invalidate_user')
+    def test_invalidates_cached_users(self, mock_invalidate):
+        """ Verify the cached snapshots of updated users are invalidated. """
+        self.call_command()
+        mock_invalidate.assert_called_once_with(User.objects.get(username='jsmith').pk)
+
+    def test_invalidates_resolved_users(self):
+        """ Verify the users cached by the JWT middleware's resolvers are invalidated. """
+        jsmith = User.objects.get(username='jsmith')
+        resolver = JwtUserResolver(load_backend(load_strategy(), 'edx-oauth2', None), audience='client-id')
+        resolver.local_cache.set('token', jsmith, time.time() + 60)
+
+        self.call_command()
+        self.assertIsNone(resolver.local_cache.get('token'))
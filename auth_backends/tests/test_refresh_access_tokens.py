@@ -0,0 +1,84 @@
+""" Tests for the refresh_access_tokens management command. """
+from io import StringIO
+
+import responses
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from social_django.models import UserSocialAuth
+
+from auth_backends.tests.test_tokens import ACCESS_TOKEN_URL, URL_ROOT, create_access_token
+from auth_backends.tokens import TokenManager
+
+User = get_user_model()
+
+
+TOKEN_SETTINGS = {
+    'SOCIAL_AUTH_EDX_OAUTH2_KEY': 'a-key',
+    'SOCIAL_AUTH_EDX_OAUTH2_SECRET': 'a-secret-key',
+    'SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT': URL_ROOT,
+}
+
+
+class RefreshAccessTokensTestMixin:
+    """ Tests for the refresh_access_tokens management command. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for index, expires_in in enumerate((60, 120, 7200, 60)):
+            user = User.objects.create(username=f'user{index}')
+            extra_data = {'access_token': create_access_token(expires_in), 'refresh_token': f'refresh{index}'}
+            if index == 3:
+                del extra_data['refresh_token']
+            UserSocialAuth.objects.create(user=user, provider='edx-oauth2', uid=user.username, extra_data=extra_data)
+
+    def call_command(self, *args):
+        """ Runs the command, and returns its output. """
+        out = StringIO()
+        call_command('refresh_access_tokens', '--batch-size=1', *args, stdout=out)
+        return out.getvalue()
+
+    @responses.activate
+    def test_refresh(self):
+        """ Verify only the tokens with a refresh token that expire within the margin are refreshed. """
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'access_token': create_access_token(3600)})
+        responses.add(responses.POST, ACCESS_TOKEN_URL, status=400)
+
+        output = self.call_command(*self.command_args)
+
+        self.assertIn('Refreshed 1 access tokens (1 not due, 1 failed)', output)
+        self.assertEqual(len(responses.calls), 2)
+
+
+@override_settings(**TOKEN_SETTINGS)
+class RefreshAccessTokensTests(RefreshAccessTokensTestMixin, TestCase):
+    """ Tests for the refresh_access_tokens management command, refreshing tokens sequentially. """
+
+    command_args = ()
+
+    @responses.activate
+    def test_cached_tokens(self):
+        """ Verify tokens due within the margin are refreshed even while they are cached for the services. """
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'access_token': create_access_token(3600)})
+        TokenManager().get_access_token(User.objects.get(username='user2'))
+
+        output = self.call_command('--margin=10000')
+
+        self.assertIn('Refreshed 3 access tokens (0 not due, 0 failed)', output)
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_dry_run(self):
+        """ Verify no token is refreshed in a dry run. """
+        output = self.call_command('--dry-run')
+        self.assertIn('Would refresh 2 access tokens (1 not due, 0 failed)', output)
+        self.assertEqual(len(responses.calls), 0)
+
+
+@override_settings(**TOKEN_SETTINGS)
+class ConcurrentRefreshAccessTokensTests(RefreshAccessTokensTestMixin, TransactionTestCase):
+    """ Tests for the refresh_access_tokens management command, refreshing tokens concurrently. """
+
+    command_args = ('--workers=2',)
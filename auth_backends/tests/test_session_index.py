@@ -0,0 +1,108 @@
+""" Tests for the session_index module. """
+import time
+from unittest.mock import patch
+
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from auth_backends import session_index
+from auth_backends.claims import decode_jwt_payload
+from auth_backends.tests.fake_lms import FakeLMS, login
+from auth_backends.urls import oauth2_urlpatterns
+
+urlpatterns = oauth2_urlpatterns
+
+
+class SessionIndexTests(TestCase):
+    """ Tests for the session index. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_add_session(self):
+        """ Verify sessions are indexed per user until they expire. """
+        now = time.time()
+        session_index.add_session('edx-oauth2', 'jsmith', 'a', now + 60)
+        session_index.add_session('edx-oauth2', 'jsmith', 'b', now + 120)
+        session_index.add_session('edx-oauth2', 'other', 'c', now + 60)
+        self.assertEqual(session_index.get_sessions('edx-oauth2', 'jsmith'), {'a': now + 60, 'b': now + 120})
+
+        with patch('auth_backends.session_index.time.time', return_value=now + 90):
+            self.assertEqual(session_index.get_sessions('edx-oauth2', 'jsmith'), {'b': now + 120})
+            session_index.add_session('edx-oauth2', 'jsmith', 'd', now + 150)
+        self.assertEqual(session_index.get_sessions('edx-oauth2', 'jsmith'), {'b': now + 120, 'd': now + 150})
+
+    def test_delete_sessions(self):
+        """ Verify the indexed database sessions of the user are deleted, and the index emptied. """
+        sessions = [DatabaseSessionStore() for _ in range(3)]
+        for session in sessions:
+            session.save()
+        for session in sessions[:2]:
+            session_index.add_session('edx-oauth2', 'jsmith', session.session_key, time.time() + 60)
+
+        self.assertEqual(session_index.delete_sessions('edx-oauth2', 'jsmith'), 2)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [sessions[2].session_key])
+        self.assertEqual(session_index.get_sessions('edx-oauth2', 'jsmith'), {})
+        self.assertEqual(session_index.delete_sessions('edx-oauth2', 'jsmith'), 0)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_delete_cache_sessions(self):
+        """ Verify the indexed sessions kept in the cache are deleted. """
+        session = CacheSessionStore()
+        session['key'] = 'value'
+        session.save()
+        session_index.add_session('edx-oauth2', 'jsmith', session.session_key, time.time() + 60)
+
+        session_index.delete_sessions('edx-oauth2', 'jsmith')
+        self.assertFalse(CacheSessionStore().exists(session.session_key))
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.file')
+    def test_delete_file_sessions(self):
+        """ Verify sessions of engines without bulk deletion are deleted one by one. """
+        with patch('django.contrib.sessions.backends.file.SessionStore.delete') as mock_delete:
+            session_index.add_session('edx-oauth2', 'jsmith', 'a', time.time() + 60)
+            session_index.delete_sessions('edx-oauth2', 'jsmith')
+        mock_delete.assert_called_once_with()
+
+    def test_claim_index(self):
+        """ Verify sessions indexed under a claim are kept apart from the sessions of the user's uid. """
+        session_index.add_session('edx-oauth2', 'jsmith', 'a', time.time() + 60)
+        session_index.add_session('edx-oauth2', 'jsmith', 'b', time.time() + 60, claim='sub')
+        self.assertEqual(list(session_index.get_sessions('edx-oauth2', 'jsmith')), ['a'])
+        self.assertEqual(list(session_index.get_sessions('edx-oauth2', 'jsmith', claim='sub')), ['b'])
+
+    def test_record_logout_token(self):
+        """ Verify the jti of a logout token is only recorded once. """
+        self.assertTrue(session_index.record_logout_token('edx-oauth2', 'jti', 60))
+        self.assertFalse(session_index.record_logout_token('edx-oauth2', 'jti', 60))
+        self.assertTrue(session_index.record_logout_token('other', 'jti', 60))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class SessionIndexingTests(TestCase):
+    """ Tests for the indexing of the sessions of logged in users. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.lms = FakeLMS()
+        self.enterContext(self.lms.installed())
+
+    def test_login(self):
+        """ Verify the session of a user logged in through the provider is indexed, under its final key. """
+        with override_settings(**self.lms.settings(SOCIAL_AUTH_EDX_OAUTH2_BACKCHANNEL_LOGOUT=True)):
+            login(self.client, self.lms, 'jsmith')
+        session_key = self.client.session.session_key
+        self.assertEqual(list(session_index.get_sessions('edx-oauth2', 'jsmith')), [session_key])
+        sub = decode_jwt_payload(self.lms.create_access_token('jsmith'))['sub']
+        self.assertEqual(list(session_index.get_sessions('edx-oauth2', sub, claim='sub')), [session_key])
+
+    def test_disabled(self):
+        """ Verify sessions are not indexed unless back-channel logout is enabled. """
+        with override_settings(**self.lms.settings()):
+            login(self.client, self.lms, 'jsmith')
+        self.assertEqual(session_index.get_sessions('edx-oauth2', 'jsmith'), {})
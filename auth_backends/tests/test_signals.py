@@ -0,0 +1,32 @@
+""" Tests for the signals module. """
+from unittest.mock import Mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TestCase
+
+from auth_backends.signals import user_changed
+
+User = get_user_model()
+
+
+class UserChangedTests(TestCase):
+    """ Tests for the user_changed signal. """
+
+    def setUp(self):
+        super().setUp()
+        self.receiver = Mock()
+        user_changed.connect(self.receiver)
+        self.addCleanup(user_changed.disconnect, self.receiver)
+
+    def test_saved_user(self):
+        """ Verify the signal is sent when a user is saved or deleted. """
+        user = User.objects.create(username='jsmith')
+        user_id = user.pk
+        user.delete()
+        self.assertEqual([call.kwargs['user_id'] for call in self.receiver.call_args_list], [user_id, user_id])
+
+    def test_other_models(self):
+        """ Verify the signal is not sent when other models are saved. """
+        SessionStore().save()
+        self.receiver.assert_not_called()
@@ -1,8 +1,17 @@
 """ Tests for the strategies. """
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+import responses
 from django.conf import settings
+from django.contrib.auth import get_user
+from django.core import signing
 from django.test import TestCase
 from django.test import override_settings
-from social_django.utils import load_strategy
+from django.urls import reverse
+from social_core.exceptions import AuthStateForbidden, AuthStateMissing
+from social_django.utils import load_backend, load_strategy
 
 from auth_backends.strategies import EdxDjangoStrategy
 
@@ -35,3 +44,131 @@ class EdxDjangoStrategyTests(TestCase):
         with override_settings(**{setting_name: expected}):
             self.assertEqual(getattr(settings, setting_name), expected)
             self.assertEqual(self.strategy.get_setting(setting_name), expected)
+
+    def test_setting_is_memoized(self):
+        """ Verify settings, including undefined ones, are only resolved once. """
+        backend = load_backend(self.strategy, 'edx-oauth2', None)
+        with override_settings(SOCIAL_AUTH_EDX_OAUTH2_KEY='a-key'):
+            with patch.object(EdxDjangoStrategy, 'get_setting', autospec=True,
+                              side_effect=EdxDjangoStrategy.get_setting) as mock_get_setting:
+                for _ in range(3):
+                    self.assertEqual(self.strategy.setting('KEY', backend=backend), 'a-key')
+                    self.assertEqual(self.strategy.setting('UNDEFINED', default='default', backend=backend), 'default')
+                    self.assertIsNone(self.strategy.setting('UNDEFINED', backend=backend))
+                    self.assertFalse(self.strategy.setting('OPTIMIZED_PIPELINE', backend=backend))
+
+        # KEY is found with its first name. UNDEFINED tries all three names, OPTIMIZED_PIPELINE falls back to the
+        # defaults on its second name.
+        self.assertEqual(mock_get_setting.call_count, 1 + 3 + 2)
+
+    def test_setting_is_memoized_per_strategy(self):
+        """ Verify subclasses with their own defaults do not share the memoized settings of other strategies. """
+        class PipelineStrategy(EdxDjangoStrategy):
+            """ Strategy enabling the optimized pipeline by default. """
+            DEFAULT_SETTINGS = {**EdxDjangoStrategy.DEFAULT_SETTINGS, 'SOCIAL_AUTH_OPTIMIZED_PIPELINE': True}
+
+        self.assertFalse(self.strategy.setting('OPTIMIZED_PIPELINE'))
+        self.assertTrue(PipelineStrategy(self.strategy.storage).setting('OPTIMIZED_PIPELINE'))
+        self.assertFalse(self.strategy.setting('OPTIMIZED_PIPELINE'))
+
+    def test_setting_is_not_memoized_with_get_setting_override(self):
+        """ Verify settings are not memoized by subclasses resolving them with their own get_setting. """
+        class SiteStrategy(EdxDjangoStrategy):
+            """ Strategy resolving settings per site. """
+            site_settings = {'SOCIAL_AUTH_URL_ROOT': 'https://site-a.example.com'}
+
+            def get_setting(self, name):
+                if name in self.site_settings:
+                    return self.site_settings[name]
+                return super().get_setting(name)
+
+        class MemoizingSiteStrategy(SiteStrategy):
+            """ Strategy opting back into memoization. """
+            memoize_settings = True
+
+        strategy = SiteStrategy(self.strategy.storage)
+        self.assertFalse(strategy.memoize_settings)
+        self.assertIsNone(strategy.settings_version)
+        self.assertEqual(strategy.setting('URL_ROOT'), 'https://site-a.example.com')
+        SiteStrategy.site_settings = {'SOCIAL_AUTH_URL_ROOT': 'https://site-b.example.com'}
+        self.assertEqual(strategy.setting('URL_ROOT'), 'https://site-b.example.com')
+        self.assertTrue(MemoizingSiteStrategy(self.strategy.storage).memoize_settings)
+
+    def test_setting_changed(self):
+        """ Verify memoized settings are invalidated when Django settings change. """
+        backend = load_backend(self.strategy, 'edx-oauth2', None)
+        self.assertIsNone(self.strategy.setting('URL_ROOT', backend=backend))
+
+        with override_settings(SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT='https://example.com'):
+            self.assertEqual(self.strategy.setting('URL_ROOT', backend=backend), 'https://example.com')
+
+        self.assertIsNone(self.strategy.setting('URL_ROOT', backend=backend))
+
+
+@override_settings(
+    ROOT_URLCONF='auth_backends.tests.test_views',
+    SOCIAL_AUTH_STATELESS_STATE=True,
+    SOCIAL_AUTH_EDX_OAUTH2_KEY='a-key',
+    SOCIAL_AUTH_EDX_OAUTH2_SECRET='a-secret-key',
+    SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT='https://example.com',
+    LOGIN_REDIRECT_URL='/dashboard/',
+)
+class StatelessStateTests(TestCase):
+    """ Tests for the stateless (signed cookie) OAuth state. """
+
+    cookie_name = 'auth_backends_state'
+
+    def begin(self):
+        """ Begins a login and returns the state sent to the provider. """
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('social:begin', args=['edx-oauth2']), {'next': '/courses/'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertTrue(response.cookies[self.cookie_name]['httponly'])
+        return parse_qs(urlparse(response['Location']).query)['state'][0]
+
+    @responses.activate
+    def complete(self, state):
+        """ Completes a login with the given state. """
+        token = jwt.encode(
+            {
+                'preferred_username': 'jsmith',
+                'email': 'jsmith@example.com',
+                'given_name': 'Joe',
+                'family_name': 'Smith',
+            },
+            'a-secret-key-that-is-long-enough-for-hs256',
+            algorithm='HS256',
+        )
+        responses.add(responses.POST, 'https://example.com/oauth2/access_token', json={'access_token': token})
+        return self.client.get(reverse('social:complete', args=['edx-oauth2']), {'code': 'a-code', 'state': state})
+
+    def test_login(self):
+        """ Verify the state is carried in a signed cookie rather than the session. """
+        state = self.begin()
+        response = self.complete(state)
+
+        self.assertRedirects(response, '/courses/', fetch_redirect_response=False)
+        self.assertEqual(get_user(self.client).username, 'jsmith')
+        self.assertEqual(response.cookies[self.cookie_name].value, '')
+
+    def test_invalid_state(self):
+        """ Verify the complete step fails if the state does not match the cookie. """
+        self.begin()
+        with self.assertRaises(AuthStateForbidden):
+            self.complete('forged-state')
+
+    def test_tampered_cookie(self):
+        """ Verify a cookie that is not correctly signed is ignored. """
+        state = self.begin()
+        self.client.cookies[self.cookie_name] = signing.dumps({'edx-oauth2_state': state}, salt='other')
+        with self.assertRaises(AuthStateMissing):
+            self.complete(state)
+
+    def test_expired_cookie(self):
+        """ Verify an expired cookie is ignored. """
+        state = self.begin()
+        with override_settings(SOCIAL_AUTH_STATELESS_STATE_MAX_AGE=-1):
+            with self.assertRaises(AuthStateMissing):
+                self.complete(state)
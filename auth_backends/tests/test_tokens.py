@@ -0,0 +1,166 @@
+""" Tests for the tokens module. """
+import threading
+import time
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+import jwt
+import responses
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from social_django.models import UserSocialAuth
+
+from auth_backends import tokens
+from auth_backends.tokens import TokenManager, get_access_token
+
+User = get_user_model()
+URL_ROOT = 'https://example.com'
+ACCESS_TOKEN_URL = f'{URL_ROOT}/oauth2/access_token'
+
+
+def create_access_token(expires_in):
+    """ Returns a JWT access token expiring in the given number of seconds. """
+    return jwt.encode({'exp': int(time.time()) + expires_in}, 'a-secret-key-that-is-long-enough-for-hs256')
+
+
+@override_settings(
+    SOCIAL_AUTH_EDX_OAUTH2_KEY='a-key',
+    SOCIAL_AUTH_EDX_OAUTH2_SECRET='a-secret-key',
+    SOCIAL_AUTH_EDX_OAUTH2_URL_ROOT=URL_ROOT,
+)
+class TokenManagerTests(TestCase):
+    """ Tests for TokenManager. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(username='jsmith')
+        self.social = UserSocialAuth.objects.create(user=self.user, provider='edx-oauth2', uid='jsmith')
+        self.manager = TokenManager()
+
+    def set_access_token(self, expires_in):
+        """ Stores an access token expiring in the given number of seconds, and returns it. """
+        access_token = create_access_token(expires_in)
+        self.social.extra_data = {'access_token': access_token, 'refresh_token': 'a-refresh-token'}
+        self.social.save()
+        return access_token
+
+    def mock_refresh(self, expires_in=3600):
+        """ Mocks the provider's token endpoint, and returns the refreshed access token. """
+        access_token = create_access_token(expires_in)
+        responses.add(
+            responses.POST,
+            ACCESS_TOKEN_URL,
+            json={'access_token': access_token, 'refresh_token': 'a-new-refresh-token'},
+        )
+        return access_token
+
+    @responses.activate
+    def test_valid_token(self):
+        """ Verify a token that does not expire soon is returned, and cached, without being refreshed. """
+        access_token = self.set_access_token(3600)
+        self.assertEqual(self.manager.get_access_token(self.user), access_token)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_access_token(self.user), access_token)
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_expiring_token(self):
+        """ Verify a token expiring within the margin is refreshed, stored and cached. """
+        self.set_access_token(60)
+        access_token = self.mock_refresh()
+
+        self.assertEqual(self.manager.get_access_token(self.user), access_token)
+        self.assertEqual(self.manager.get_access_token(self.user), access_token)
+
+        self.assertEqual(len(responses.calls), 1)
+        body = parse_qs(responses.calls[0].request.body)
+        self.assertEqual(body['grant_type'], ['refresh_token'])
+        self.assertEqual(body['refresh_token'], ['a-refresh-token'])
+        self.assertEqual(body['token_type'], ['jwt'])
+
+        self.social.refresh_from_db()
+        self.assertEqual(self.social.extra_data['access_token'], access_token)
+        self.assertEqual(self.social.extra_data['refresh_token'], 'a-new-refresh-token')
+
+    @responses.activate
+    def test_refreshed_elsewhere(self):
+        """ Verify a token refreshed by another process while waiting for the lock is not refreshed again. """
+        self.set_access_token(60)
+        stale = UserSocialAuth.objects.get(pk=self.social.pk)
+        access_token = self.set_access_token(3600)
+
+        self.assertEqual(self.manager.refresh(stale), access_token)
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_force_refresh(self):
+        """ Verify a refresh can be forced. """
+        self.set_access_token(3600)
+        access_token = self.mock_refresh()
+        self.assertEqual(self.manager.refresh(self.social, force=True), access_token)
+
+    def test_wait_for_refresh(self):
+        """ Verify callers wait for the result of a refresh made by another caller. """
+        self.set_access_token(60)
+        lock_key = self.manager._lock_cache_key(self.user.pk)  # pylint: disable=protected-access
+        token_key = self.manager._token_cache_key(self.user.pk)  # pylint: disable=protected-access
+        cache.add(lock_key, True)
+
+        with patch('auth_backends.tokens.time.sleep', side_effect=lambda _: cache.set(token_key, 'refreshed')) as sleep:
+            self.assertEqual(self.manager.get_access_token(self.user), 'refreshed')
+        sleep.assert_called_once_with(self.manager.poll_interval)
+
+    @responses.activate
+    def test_other_users_are_not_blocked(self):
+        """ Verify a refresh in progress in another thread does not block the refreshes of other users. """
+        other = User.objects.create(username='other')
+        lock_key = self.manager._lock_cache_key(other.pk)  # pylint: disable=protected-access
+        locked, release = threading.Event(), threading.Event()
+
+        def refresh_other_user():
+            with tokens._key_lock(lock_key):  # pylint: disable=protected-access
+                locked.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=refresh_other_user)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        locked.wait(5)
+
+        self.set_access_token(60)
+        access_token = self.mock_refresh()
+        self.assertEqual(self.manager.get_access_token(self.user), access_token)
+        release.set()
+        thread.join()
+        self.assertEqual(tokens._locks, {})  # pylint: disable=protected-access
+
+    @responses.activate
+    def test_lock_timeout(self):
+        """ Verify callers refresh the token themselves if the lock is not released in time. """
+        self.set_access_token(60)
+        access_token = self.mock_refresh()
+        cache.add(self.manager._lock_cache_key(self.user.pk), True)  # pylint: disable=protected-access
+        self.manager.lock_timeout = 0
+
+        self.assertEqual(self.manager.get_access_token(self.user), access_token)
+
+    def test_expiry_without_jwt(self):
+        """ Verify the stored expiry data is used for access tokens that are not JWTs. """
+        self.social.extra_data = {'access_token': 'opaque', 'auth_time': int(time.time()), 'expires': 600}
+        self.assertAlmostEqual(self.manager.get_expiry(self.social), time.time() + 600, delta=5)
+
+        self.social.extra_data = {'access_token': 'opaque'}
+        self.assertIsNone(self.manager.get_expiry(self.social))
+        self.assertFalse(self.manager.needs_refresh(self.social))
+
+    def test_invalidate(self):
+        """ Verify cached tokens can be forgotten. """
+        self.set_access_token(3600)
+        self.manager.get_access_token(self.user)
+        self.manager.invalidate(self.user)
+        with self.assertNumQueries(1):
+            self.manager.get_access_token(self.user)
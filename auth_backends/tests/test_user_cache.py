@@ -0,0 +1,91 @@
+""" Tests for the user_cache module. """
+from django.contrib.auth import get_user, get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from social_django.utils import load_strategy
+
+from auth_backends import user_cache
+from auth_backends.backends import CachedUserEdXOAuth2, EdXOAuth2
+from auth_backends.pipeline import save_user_changes, update_email
+
+User = get_user_model()
+
+
+@override_settings(AUTHENTICATION_BACKENDS=('auth_backends.backends.CachedUserEdXOAuth2',))
+class CachedUserEdXOAuth2Tests(TestCase):
+    """ Tests for CachedUserEdXOAuth2. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(username='jsmith', email='jsmith@example.com')
+        self.backend = CachedUserEdXOAuth2(load_strategy())
+
+    def assert_user_cached(self):
+        """ Verify the user is served from the cache. """
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def assert_user_not_cached(self):
+        """ Verify the user is read from the database, and cached. """
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        self.assert_user_cached()
+
+    def test_get_user(self):
+        """ Verify users are cached on first use. """
+        self.assert_user_not_cached()
+
+    def test_missing_user(self):
+        """ Verify missing users are not cached. """
+        self.assertIsNone(self.backend.get_user(self.user.pk + 1))
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.backend.get_user(self.user.pk + 1))
+
+    def test_save(self):
+        """ Verify the snapshot is invalidated when the user is saved. """
+        self.backend.get_user(self.user.pk)
+        self.user.first_name = 'John'
+        self.user.save()
+        self.assert_user_not_cached()
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, 'John')
+
+    def test_delete(self):
+        """ Verify the snapshot is invalidated when the user is deleted. """
+        self.backend.get_user(self.user.pk)
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_pipeline(self):
+        """ Verify the snapshot is invalidated when the pipeline updates the user. """
+        self.backend.get_user(self.user.pk)
+        details = {'username': 'jsmith', 'email': 'john@example.com'}
+        changes = update_email(load_strategy(), details, user=self.user, user_changed_fields=[])
+        save_user_changes(load_strategy(), user=self.user, **changes)
+        self.assertEqual(self.backend.get_user(self.user.pk).email, 'john@example.com')
+
+    def test_auth_complete_signal(self):
+        """ Verify the snapshot is invalidated when the user logs in. """
+        self.backend.get_user(self.user.pk)
+        EdXOAuth2.auth_complete_signal.send(sender=CachedUserEdXOAuth2, user=self.user)
+        self.assert_user_not_cached()
+
+    def test_session(self):
+        """ Verify the users of authenticated sessions are served from the cache. """
+        self.client.force_login(self.user, backend='auth_backends.backends.CachedUserEdXOAuth2')
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        self.assertEqual(get_user(request), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user(request), self.user)
+
+
+class InvalidationTests(TestCase):
+    """ Tests for the invalidation of snapshots when CachedUserEdXOAuth2 is not used. """
+
+    def test_disabled(self):
+        """ Verify the cache is left untouched if no backend caches users. """
+        user = User.objects.create(username='jsmith')
+        cache.set(f'{user_cache.CACHE_KEY_PREFIX}.{user.pk}', 'stale')
+        user.save()
+        self.assertEqual(cache.get(f'{user_cache.CACHE_KEY_PREFIX}.{user.pk}'), 'stale')
@@ -1,9 +1,19 @@
 """ Tests for the views module. """
+import time
+from unittest.mock import patch
 
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.test import TestCase, override_settings
+from django.test import Client, TestCase, override_settings
 
 from auth_backends.tests.mixins import LogoutViewTestMixin
+from auth_backends import views
+from auth_backends.jwks import clear_key_stores
+from auth_backends.strategies import EdxDjangoStrategy
+from auth_backends.tests.fake_lms import FakeLMS, login
 from auth_backends.urls import oauth2_urlpatterns
 
 URL_ROOT = 'https://www.example.com'
@@ -13,6 +23,15 @@ LOGOUT_REDIRECT_URL = URL_ROOT + '/logout'
 urlpatterns = oauth2_urlpatterns
 
 
+class SiteStrategy(EdxDjangoStrategy):
+    """ Strategy serving the provider's public URL of the site of the request. """
+
+    def get_setting(self, name):
+        if name == 'SOCIAL_AUTH_EDX_OAUTH2_PUBLIC_URL_ROOT':
+            return f'https://lms.{self.request.get_host()}'
+        return super().get_setting(name)
+
+
 @override_settings(ROOT_URLCONF=__name__)
 class EdxOAuth2LoginViewTests(TestCase):
     """ Tests for EdxOAuth2ConnectLoginView. """
@@ -31,3 +50,171 @@ class EdxOAuth2LogoutView(LogoutViewTestMixin, TestCase):
 
     def get_redirect_url(self):
         return LOGOUT_REDIRECT_URL
+
+    def test_logout_url_is_cached(self):
+        """ Verify the logout URL is only built once per settings snapshot. """
+        logout_urls = views._logout_urls  # pylint: disable=protected-access
+        with patch.dict(logout_urls, clear=True), \
+                patch('auth_backends.views.load_strategy', wraps=views.load_strategy) as mock_load_strategy:
+            for _ in range(3):
+                response = self.client.get(self.get_logout_url())
+                self.assertRedirects(response, LOGOUT_REDIRECT_URL, fetch_redirect_response=False)
+            self.assertEqual(mock_load_strategy.call_count, 1)
+
+            with override_settings(SOCIAL_AUTH_EDX_OAUTH2_PUBLIC_URL_ROOT='https://public.example.com'):
+                response = self.client.get(self.get_logout_url())
+                self.assertRedirects(response, 'https://public.example.com/logout', fetch_redirect_response=False)
+            self.assertEqual(mock_load_strategy.call_count, 2)
+
+    @override_settings(ALLOWED_HOSTS=['site-a.example.com', 'site-b.example.com'])
+    def test_logout_url_per_site(self):
+        """ Verify the logout URL is not cached when settings depend on the site of the request. """
+        # social_django reads SOCIAL_AUTH_STRATEGY once, when imported.
+        self.enterContext(patch('social_django.utils.STRATEGY', f'{__name__}.SiteStrategy'))
+        for site in ('site-a.example.com', 'site-b.example.com', 'site-a.example.com'):
+            response = self.client.get(self.get_logout_url(), HTTP_HOST=site)
+            self.assertRedirects(response, f'https://lms.{site}/logout', fetch_redirect_response=False)
+
+    def test_anonymous_logout_without_session(self):
+        """ Verify logging out without a session does not touch the database or create a session. """
+        # Warm the logout URL cache
+        self.client.get(self.get_logout_url())
+
+        for params in ({}, {'no_redirect': 1}):
+            with self.assertNumQueries(0):
+                response = self.client.get(self.get_logout_url(), params)
+            self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_anonymous_logout_with_session(self):
+        """ Verify logging out with an anonymous session reads the session, but neither the user nor any write. """
+        session = self.client.session
+        session['edx-oauth2_state'] = 'state'
+        session.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.get_logout_url(), {'no_redirect': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['sql'].split()[0] for q in queries.captured_queries], ['SELECT'])
+        self.assertIn('django_session', queries.captured_queries[0]['sql'])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class EdxOAuth2BackchannelLogoutViewTests(TestCase):
+    """ Tests for EdxOAuth2BackchannelLogoutView. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.lms = FakeLMS()
+        self.enterContext(self.lms.installed())
+        self.enterContext(override_settings(**self.lms.settings(
+            SOCIAL_AUTH_EDX_OAUTH2_BACKCHANNEL_LOGOUT=True,
+            SOCIAL_AUTH_EDX_OAUTH2_JWKS=self.lms.jwks(),
+        )))
+
+    def post_logout_token(self, logout_token):
+        return self.client.post(reverse('backchannel_logout'), {'logout_token': logout_token})
+
+    @patch('auth_backends.views.set_custom_attribute')
+    def test_logout(self, mock_set_attr):
+        """ Verify all sessions of the user are deleted at once. """
+        browsers = [Client(), Client(), Client()]
+        for browser, username in zip(browsers, ('jsmith', 'jsmith', 'other')):
+            login(browser, self.lms, username)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_logout_token(self.lms.create_logout_token('jsmith'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'max-age=0, no-cache, no-store, must-revalidate, private')
+        self.assertEqual([q['sql'].split()[0] for q in queries.captured_queries].count('DELETE'), 1)
+        mock_set_attr.assert_called_once_with('backchannel_logout.deleted_sessions', 2)
+        self.assertEqual([browser.get('/').wsgi_request.user.is_authenticated for browser in browsers], [
+            False, False, True
+        ])
+
+    def test_invalid_token(self):
+        """ Verify tokens that are not valid logout tokens of the provider are rejected. """
+        login(self.client, self.lms, 'jsmith')
+        for logout_token in (
+                '',
+                'not-a-jwt',
+                FakeLMS().create_logout_token('jsmith'),
+                self.lms.create_logout_token('jsmith', aud='other-client'),
+                self.lms.create_logout_token('jsmith', events={}),
+                self.lms.create_logout_token('jsmith', nonce='nonce'),
+                self.lms.create_logout_token('jsmith', iss=f'{self.lms.url_root}/oauth2'),
+                self.lms.create_logout_token('jsmith', iat=None),
+                self.lms.create_logout_token('jsmith', iat=int(time.time()) - 300),
+                self.lms.create_logout_token('jsmith', iat=int(time.time()) + 300),
+                self.lms.create_logout_token('jsmith', jti=None),
+                self.lms.create_logout_token('jsmith', sub=None, preferred_username=None),
+        ):
+            response = self.post_logout_token(logout_token)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], 'invalid_request')
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_unreachable_jwks(self):
+        """ Verify logout tokens are rejected when the provider's keys cannot be fetched. """
+        clear_key_stores()
+        with patch('auth_backends.jwks.StaticKeySource.__call__', side_effect=ValueError('invalid JSON')):
+            response = self.post_logout_token(self.lms.create_logout_token('jsmith'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_replayed_token(self):
+        """ Verify a logout token is only accepted once. """
+        login(self.client, self.lms, 'jsmith')
+        logout_token = self.lms.create_logout_token('jsmith')
+        self.assertEqual(self.post_logout_token(logout_token).status_code, 200)
+
+        login(self.client, self.lms, 'jsmith')
+        self.assertEqual(self.post_logout_token(logout_token).status_code, 400)
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_default_issuer(self):
+        """ Verify logout tokens are issued by ``<URL_ROOT>/oauth2`` unless JWT_ISSUER is set. """
+        login(self.client, self.lms, 'jsmith')
+        with override_settings(SOCIAL_AUTH_EDX_OAUTH2_JWT_ISSUER=None, SOCIAL_AUTH_EDX_OAUTH2_JWT_AUDIENCE=None):
+            self.assertEqual(self.post_logout_token(self.lms.create_logout_token('jsmith')).status_code, 400)
+            response = self.post_logout_token(
+                self.lms.create_logout_token('jsmith', iss=f'{self.lms.url_root}/oauth2')
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_logout_by_subject(self):
+        """ Verify the user is identified by the ``sub`` claim, as required by the specification. """
+        browsers = [Client(), Client()]
+        for browser, username in zip(browsers, ('jsmith', 'other')):
+            login(browser, self.lms, username)
+
+        response = self.post_logout_token(self.lms.create_logout_token('jsmith', preferred_username=None))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([browser.get('/').wsgi_request.user.is_authenticated for browser in browsers], [False, True])
+
+    def test_logout_by_session(self):
+        """ Verify a logout token with a ``sid`` claim only logs out the sessions of that provider session. """
+        browsers = [Client(), Client()]
+        for browser, sid in zip(browsers, ('first', 'second')):
+            self.lms.add_user('jsmith', sid=sid)
+            login(browser, self.lms, 'jsmith')
+
+        response = self.post_logout_token(self.lms.create_logout_token('jsmith', sid='first'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([browser.get('/').wsgi_request.user.is_authenticated for browser in browsers], [False, True])
+
+    def test_disabled(self):
+        """ Verify back-channel logout is not available unless enabled. """
+        with override_settings(SOCIAL_AUTH_EDX_OAUTH2_BACKCHANNEL_LOGOUT=False):
+            response = self.post_logout_token(self.lms.create_logout_token('jsmith'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_get(self):
+        """ Verify logout tokens are only accepted in POST requests. """
+        response = self.client.get(reverse('backchannel_logout'), {'logout_token': 'token'})
+        self.assertEqual(response.status_code, 405)
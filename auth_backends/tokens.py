@@ -0,0 +1,171 @@
+"""Access tokens for calling the provider's APIs on behalf of users.
+
+The access and refresh tokens stored in ``UserSocialAuth.extra_data`` at login are used to obtain a valid access token
+for a user at any time: tokens are cached until shortly before they expire, and are then refreshed with the stored
+refresh token. Concurrent refreshes for the same user, in any thread or process sharing the cache, are coalesced into
+a single request to the provider.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import jwt
+from django.core.cache import cache as default_cache
+from social_django.utils import load_strategy
+
+from auth_backends.claims import decode_jwt_payload
+
+DEFAULT_BACKEND_NAME = 'edx-oauth2'
+DEFAULT_REFRESH_MARGIN = 60 * 5
+DEFAULT_LOCK_TIMEOUT = 30
+DEFAULT_POLL_INTERVAL = 0.1
+CACHE_KEY_PREFIX = 'auth_backends.tokens'
+
+# Locks queueing the threads of this process that refresh the same token, so that only one of them competes for the
+# shared cache lock, keyed by cache key. Values are [lock, number of threads using it] pairs; entries are removed once
+# no thread uses them, so that memory use does not grow with the number of users.
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _key_lock(key):
+    """Hold the process-wide lock for ``key``, which does not block the threads holding the locks of other keys."""
+    with _locks_lock:
+        entry = _locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
+
+
+class TokenManager:
+    """Provides valid access tokens for users who logged in with ``backend_name``.
+
+    Arguments:
+        backend_name (str): Name of the backend whose stored tokens are used.
+        refresh_margin (int): Number of seconds before their expiry at which tokens are refreshed.
+        lock_timeout (int): Maximum number of seconds a refresh is expected to take. Callers waiting for another
+            caller's refresh for longer than this refresh the token themselves.
+        poll_interval (float): Number of seconds between checks for the result of another caller's refresh.
+        cache: Django cache holding the tokens and refresh locks. Defaults to the default cache.
+        strategy: Strategy used to load the backend. Defaults to ``social_django.utils.load_strategy()``.
+    """
+
+    def __init__(self, backend_name=DEFAULT_BACKEND_NAME, *, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL, cache=None, strategy=None,
+                 clock=time.time):
+        self.backend_name = backend_name
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.cache = default_cache if cache is None else cache
+        self.strategy = strategy
+        self.clock = clock
+
+    def get_access_token(self, user):
+        """Return an access token for ``user`` that is valid for at least ``refresh_margin`` seconds.
+
+        Raises:
+            UserSocialAuth.DoesNotExist: if the user never logged in with the backend.
+        """
+        token = self.cache.get(self._token_cache_key(user.pk))
+        if token is not None:
+            return token
+
+        social = self._get_social(user)
+        if not self.needs_refresh(social):
+            return self._cache_token(social)
+        return self.refresh(social)
+
+    def refresh(self, social, force=False):
+        """Refresh the access token of the given ``UserSocialAuth``, unless another caller already did, and return it.
+
+        Only one caller refreshes a given user's token at a time. Others wait for, and return, its result.
+        Unless ``force`` is set, the token is not refreshed if it turns out not to need it once the lock is acquired.
+        """
+        token_key = self._token_cache_key(social.user_id)
+        lock_key = self._lock_cache_key(social.user_id)
+        with _key_lock(lock_key):
+            deadline = self.clock() + self.lock_timeout
+            while True:
+                token = self.cache.get(token_key)
+                if token is not None and not force:
+                    return token
+                if self.cache.add(lock_key, True, self.lock_timeout):
+                    try:
+                        return self._refresh(social, force)
+                    finally:
+                        self.cache.delete(lock_key)
+                if self.clock() >= deadline:
+                    # The caller holding the lock is gone, or too slow: refresh without it.
+                    return self._refresh(social, force)
+                time.sleep(self.poll_interval)
+
+    def needs_refresh(self, social):
+        """Return whether the access token of the given ``UserSocialAuth`` expires within ``refresh_margin``."""
+        expires_at = self.get_expiry(social)
+        return expires_at is not None and expires_at - self.clock() <= self.refresh_margin
+
+    def get_expiry(self, social):
+        """Return the expiry time (a Unix timestamp) of the stored access token, or ``None`` if it is unknown.
+
+        The ``exp`` claim of JWT access tokens is used. Otherwise, the expiry is computed from the stored
+        ``expires``/``auth_time`` data.
+        """
+        access_token = social.extra_data.get('access_token')
+        if access_token:
+            try:
+                return decode_jwt_payload(access_token)['exp']
+            except (jwt.DecodeError, KeyError):
+                pass
+
+        expiration = social.expiration_timedelta()
+        if expiration is None:
+            return None
+        return self.clock() + expiration.total_seconds()
+
+    def invalidate(self, user):
+        """Forget the cached access token of ``user``."""
+        self.cache.delete(self._token_cache_key(user.pk))
+
+    def _refresh(self, social, force):
+        """Refresh the access token with the provider, and cache it."""
+        # The token may have been refreshed, and saved, by another process since the association was loaded.
+        social.refresh_from_db(fields=['extra_data'])
+        if force or self.needs_refresh(social):
+            social.refresh_token(self.strategy or load_strategy())
+        return self._cache_token(social)
+
+    def _cache_token(self, social):
+        """Cache the access token of the given ``UserSocialAuth`` until it needs to be refreshed, and return it."""
+        token = social.access_token
+        expires_at = self.get_expiry(social)
+        # Tokens with an unknown expiry are cached for as long as the margin, to spare the association lookup.
+        timeout = self.refresh_margin if expires_at is None else int(expires_at - self.clock() - self.refresh_margin)
+        if timeout > 0:
+            self.cache.set(self._token_cache_key(social.user_id), token, timeout)
+        return token
+
+    def _get_social(self, user):
+        """Return the ``UserSocialAuth`` of ``user`` for the backend."""
+        strategy = self.strategy or load_strategy()
+        return strategy.storage.user.objects.get(user_id=user.pk, provider=self.backend_name)
+
+    def _token_cache_key(self, user_id):
+        """Return the cache key of a user's access token."""
+        return f'{CACHE_KEY_PREFIX}.token.{self.backend_name}.{user_id}'
+
+    def _lock_cache_key(self, user_id):
+        """Return the cache key of the lock held while refreshing a user's access token."""
+        return f'{CACHE_KEY_PREFIX}.lock.{self.backend_name}.{user_id}'
+
+
+def get_access_token(user, backend_name=DEFAULT_BACKEND_NAME):
+    """Return a valid access token for ``user``, refreshing it if necessary. See :class:`TokenManager`."""
+    return TokenManager(backend_name).get_access_token(user)
@@ -4,14 +4,43 @@ Add these to your project's `urlpatterns` to avoid duplicating code.
 """
 from django.urls import path
 from django.urls import include
+from social_django import urls as social_urls
+from social_django import views as social_views
 
 from auth_backends.views import (
+    AsyncEdxOAuth2LoginView,
+    AsyncEdxOAuth2LogoutView,
+    EdxOAuth2BackchannelLogoutView,
     EdxOAuth2LoginView,
     EdxOAuth2LogoutView,
+    async_complete,
+    rate_limited,
 )
 
+# The python-social-auth URL patterns, with the begin and complete views rate limited (see `rate_limited`).
+social_urlpatterns = [
+    path(f'login/<str:backend>{social_urls.extra}', rate_limited('begin')(social_views.auth), name='begin'),
+    path(
+        f'complete/<str:backend>{social_urls.extra}', rate_limited('complete')(social_views.complete), name='complete'
+    ),
+] + [pattern for pattern in social_urls.urlpatterns if pattern.name not in ('begin', 'complete')]
+
 oauth2_urlpatterns = [
     path('login/', EdxOAuth2LoginView.as_view(), name='login'),
     path('logout/', EdxOAuth2LogoutView.as_view(), name='logout'),
-    path('', include('social_django.urls', namespace='social')),
+    path('logout/backchannel/', EdxOAuth2BackchannelLogoutView.as_view(), name='backchannel_logout'),
+    path('', include((social_urlpatterns, social_urls.app_name), namespace='social')),
+]
+
+# Equivalent of `social_urlpatterns`, with the complete view replaced by its async variant.
+async_social_urlpatterns = [
+    path(f'complete/<str:backend>{social_urls.extra}', rate_limited('complete')(async_complete), name='complete'),
+] + [pattern for pattern in social_urlpatterns if pattern.name != 'complete']
+
+# Equivalent of `oauth2_urlpatterns` for projects served via ASGI.
+async_oauth2_urlpatterns = [
+    path('login/', AsyncEdxOAuth2LoginView.as_view(), name='login'),
+    path('logout/', AsyncEdxOAuth2LogoutView.as_view(), name='logout'),
+    path('logout/backchannel/', EdxOAuth2BackchannelLogoutView.as_view(), name='backchannel_logout'),
+    path('', include((async_social_urlpatterns, social_urls.app_name), namespace='social')),
 ]
@@ -0,0 +1,69 @@
+"""Cache of user snapshots, used to authenticate session requests without querying the user table.
+
+See ``CachedUserEdXOAuth2``. Snapshots are invalidated whenever a user is saved or deleted (including by the
+``update_email`` and ``user_details`` pipeline steps) and when a user completes a login.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from auth_backends.signals import user_changed
+from auth_backends.strategies import settings_snapshot
+
+DEFAULT_USER_CACHE_TIMEOUT = 60 * 5
+CACHE_KEY_PREFIX = 'auth_backends.user'
+
+# (settings version, enabled) pair, see is_enabled().
+_enabled = (None, False)
+
+
+def is_enabled():
+    """Return whether user snapshots are in use, i.e. whether an authentication backend has ``caches_users`` set."""
+    global _enabled  # pylint: disable=global-statement
+    version = settings_snapshot.version
+    if _enabled[0] != version:
+        enabled = any(getattr(import_string(path), 'caches_users', False) for path in settings.AUTHENTICATION_BACKENDS)
+        _enabled = (version, enabled)
+    return _enabled[1]
+
+
+def _get_cache():
+    """Return the Django cache holding the snapshots."""
+    return caches[getattr(settings, 'SOCIAL_AUTH_EDX_OAUTH2_USER_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(user_id):
+    """Return the cache key of a user's snapshot."""
+    return f'{CACHE_KEY_PREFIX}.{user_id}'
+
+
+def get_user(user_id):
+    """Return the cached snapshot of the user, or ``None``."""
+    return _get_cache().get(_cache_key(user_id))
+
+
+def set_user(user):
+    """Cache a snapshot of ``user``."""
+    timeout = getattr(settings, 'SOCIAL_AUTH_EDX_OAUTH2_USER_CACHE_TIMEOUT', DEFAULT_USER_CACHE_TIMEOUT)
+    _get_cache().set(_cache_key(user.pk), user, timeout)
+
+
+def invalidate_user(user_id):
+    """Forget the snapshot of the user, if snapshots are in use."""
+    if is_enabled():
+        _get_cache().delete(_cache_key(user_id))
+
+
+@receiver(user_changed)
+def invalidate_changed_user(sender, user_id, **kwargs):  # pylint: disable=unused-argument
+    """Invalidate the snapshot of a changed user, e.g. saved or deleted."""
+    invalidate_user(user_id)
+
+
+def invalidate_logged_in_user(sender, user=None, **kwargs):  # pylint: disable=unused-argument
+    """Invalidate the snapshot of a user completing a login, connected to ``EdXOAuth2.auth_complete_signal``."""
+    # The pipeline may also return a response (e.g. a redirect to a partial pipeline step).
+    if isinstance(user, get_user_model()):
+        invalidate_user(user.pk)
@@ -1,16 +1,35 @@
 """ Authentication views. """
+import asyncio
+import functools
 import logging
 
-from django.contrib.auth import logout
+from asgiref.sync import sync_to_async
+from django.contrib.auth import REDIRECT_FIELD_NAME, SESSION_KEY, alogout, logout
+from django.contrib.auth.decorators import login_not_required
+from django.contrib.auth.models import AnonymousUser
 from django.urls import reverse
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
 from django.views.decorators.clickjacking import xframe_options_exempt
-from django.views.generic import RedirectView
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import RedirectView, View
+from edx_django_utils.monitoring import set_custom_attribute
+from social_core.actions import do_complete
+from social_core.exceptions import AuthTokenError, MissingBackend
 from social_django.utils import load_strategy, load_backend
+from social_django.views import NAMESPACE, _do_login
+
+from auth_backends import session_index
+from auth_backends.ratelimit import client_ip
+from auth_backends.strategies import settings_snapshot
 
 logger = logging.getLogger(__name__)
 
+# Logout URLs, keyed by backend name. Values are (settings version, URL) pairs. Only the URLs of strategies with a
+# settings_version, whose settings do not depend on the request (e.g. its site), are cached.
+_logout_urls = {}
+
 
 class EdxOAuth2LogoutView(RedirectView):
     """ Logout view for projects utilizing edX OAuth 2.0 for single sign-on.
@@ -33,23 +52,129 @@ class EdxOAuth2LogoutView(RedirectView):
 
     @method_decorator(xframe_options_exempt)
     def dispatch(self, request, *args, **kwargs):
-        # Keep track of the user so that child classes have access to it after logging out.
-        self.user = request.user
-        logout(request)
+        if self.has_authenticated_session(request):
+            # Keep track of the user so that child classes have access to it after logging out.
+            self.user = request.user
+            logout(request)
+        else:
+            # Most requests come from the authorization server's logout page, which loads this view for every
+            # service. Visitors without an authenticated session have nothing to log out of, so avoid loading
+            # the user and flushing the session.
+            self.user = AnonymousUser()
 
         if request.GET.get('no_redirect'):
             return HttpResponse()
 
         return super().dispatch(request, *args, **kwargs)
 
+    @staticmethod
+    def has_authenticated_session(request):
+        """Return whether the request has a session with a logged in user, without querying the user.
+
+        Requests without a session cookie are detected without reading the session store.
+        """
+        session = getattr(request, 'session', None)
+        if session is None:
+            return request.user.is_authenticated
+        return session.session_key is not None and SESSION_KEY in session
+
     @property
     # pylint: disable= missing-function-docstring
     def url(self):
         # NOTE: We use a property here so that we can take advantage of the base class'
         # get_redirect_url() with minimal effort.
+        # The URL only depends on settings, so it is cached per settings snapshot rather than loading a strategy and
+        # backend on every logout.
+        version = settings_snapshot.version
+        cached = _logout_urls.get(self.auth_backend_name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
         strategy = load_strategy(self.request)
         backend = load_backend(strategy, self.auth_backend_name, None)
-        return backend.logout_url
+        url = backend.logout_url
+        if getattr(strategy, 'settings_version', None) == version:
+            _logout_urls[self.auth_backend_name] = (version, url)
+        return url
+
+
+def get_rate_limiter(request, backend_name):
+    """ Return the rate limiter of the backend's login flow, or `None` if it is not rate limited.
+
+    Loading the strategy and backend does not read the session.
+    """
+    try:
+        backend = load_backend(load_strategy(request), backend_name, None)
+    except MissingBackend:
+        return None
+    get_backend_rate_limiter = getattr(backend, 'get_rate_limiter', None)
+    return get_backend_rate_limiter() if get_backend_rate_limiter else None
+
+
+def rate_limited(step):
+    """ Decorator rejecting the requests of a step of the login flow beyond the backend's rate limits.
+
+    The decorated view takes the backend name as `backend` argument, like the python-social-auth views. Rejected
+    requests are answered with a 429 before the view runs, so before the session is read or written.
+    See `auth_backends.ratelimit`.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, backend, *args, **kwargs):
+                limiter = get_rate_limiter(request, backend)
+                if limiter is not None:
+                    rejected = await limiter.acheck(step, client_ip(request))
+                    if rejected is not None:
+                        return rejected
+                return await view(request, backend, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, backend, *args, **kwargs):
+            limiter = get_rate_limiter(request, backend)
+            if limiter is not None:
+                rejected = limiter.check(step, client_ip(request))
+                if rejected is not None:
+                    return rejected
+            return view(request, backend, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@method_decorator([never_cache, login_not_required, csrf_exempt], name='dispatch')
+class EdxOAuth2BackchannelLogoutView(View):
+    """ OpenID Connect back-channel logout endpoint, called by the authorization server when a user logs out.
+
+    The request carries a logout token, signed by the authorization server, identifying the user. All of the user's
+    sessions recorded in the session index (see `auth_backends.session_index`) are deleted at once, so the user is
+    logged out of the service even if no browser tab loads `EdxOAuth2LogoutView`.
+
+    See https://openid.net/specs/openid-connect-backchannel-1_0.html.
+    """
+    auth_backend_name = 'edx-oauth2'
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):  # pylint: disable=unused-argument
+        """ Log out the user of the logout token posted by the authorization server. """
+        if not session_index.is_enabled():
+            raise Http404('Back-channel logout is not enabled')
+
+        logout_token = request.POST.get('logout_token')
+        if not logout_token:
+            return JsonResponse({'error': 'invalid_request'}, status=400)
+
+        backend = load_backend(load_strategy(request), self.auth_backend_name, None)
+        try:
+            deleted = backend.backchannel_logout(logout_token)
+        except AuthTokenError as error:
+            logger.warning('Rejected back-channel logout token: %s', error)
+            return JsonResponse({'error': 'invalid_request', 'error_description': str(error)}, status=400)
+
+        # .. custom_attribute_name: backchannel_logout.deleted_sessions
+        # .. custom_attribute_description: Number of sessions deleted by a back-channel logout.
+        set_custom_attribute('backchannel_logout.deleted_sessions', deleted)
+        return HttpResponse()
 
 
 class EdxOAuth2LoginView(RedirectView):
@@ -62,8 +187,113 @@ class EdxOAuth2LoginView(RedirectView):
     permanent = False
     query_string = True
 
+    def dispatch(self, request, *args, **kwargs):
+        limiter = get_rate_limiter(request, self.auth_backend_name)
+        if limiter is not None:
+            rejected = limiter.check('login', client_ip(request))
+            if rejected is not None:
+                return rejected
+        return super().dispatch(request, *args, **kwargs)
+
     @property
     def url(self):
         # NOTE: We use a property here so that we can take advantage of the base class'
         # get_redirect_url() with minimal effort.
         return reverse('social:begin', args=[self.auth_backend_name])
+
+
+class AsyncRedirectMixin:
+    """ Serves a `RedirectView` from async handlers, so that it does not occupy a worker thread under ASGI. """
+
+    async def get(self, request, *args, **kwargs):  # pylint: disable=useless-parent-delegation
+        # RedirectView.get() only builds the redirect URL, without blocking I/O.
+        return super().get(request, *args, **kwargs)
+
+    async def head(self, request, *args, **kwargs):
+        return await self.get(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.get(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await self.get(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return await self.get(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.get(request, *args, **kwargs)
+
+
+class AsyncEdxOAuth2LogoutView(AsyncRedirectMixin, EdxOAuth2LogoutView):
+    """ Async variant of `EdxOAuth2LogoutView`, for projects served via ASGI. """
+
+    @method_decorator(xframe_options_exempt)
+    async def dispatch(self, request, *args, **kwargs):  # pylint: disable=invalid-overridden-method
+        if await self.ahas_authenticated_session(request):
+            self.user = await request.auser()
+            await alogout(request)
+        else:
+            self.user = AnonymousUser()
+
+        if request.GET.get('no_redirect'):
+            return HttpResponse()
+
+        # Skip EdxOAuth2LogoutView.dispatch, which would log out (synchronously) again.
+        return await super(EdxOAuth2LogoutView, self).dispatch(request, *args, **kwargs)
+
+    @staticmethod
+    async def ahas_authenticated_session(request):
+        """ Async variant of `has_authenticated_session`. """
+        session = getattr(request, 'session', None)
+        if session is None:
+            return (await request.auser()).is_authenticated
+        return session.session_key is not None and await session.ahas_key(SESSION_KEY)
+
+
+class AsyncEdxOAuth2LoginView(AsyncRedirectMixin, EdxOAuth2LoginView):
+    """ Async variant of `EdxOAuth2LoginView`, for projects served via ASGI. """
+
+    async def dispatch(self, request, *args, **kwargs):  # pylint: disable=invalid-overridden-method
+        limiter = get_rate_limiter(request, self.auth_backend_name)
+        if limiter is not None:
+            rejected = await limiter.acheck('login', client_ip(request))
+            if rejected is not None:
+                return rejected
+        # Skip EdxOAuth2LoginView.dispatch, which would check the rate limit (synchronously) again.
+        return await super(EdxOAuth2LoginView, self).dispatch(request, *args, **kwargs)
+
+
+@never_cache
+@login_not_required
+@csrf_exempt
+async def async_complete(request, backend, *args, **kwargs):
+    """ Async variant of `social_django.views.complete`, for projects served via ASGI.
+
+    Backends that support it (e.g. `EdXOAuth2`) exchange the authorization code for an access token without blocking
+    a thread. The rest of the login, including the ORM-bound pipeline, runs via `sync_to_async`.
+    """
+    request.social_strategy = load_strategy(request)
+    if not hasattr(request, 'strategy'):
+        request.strategy = request.social_strategy
+
+    try:
+        request.backend = load_backend(
+            request.social_strategy, backend, redirect_uri=reverse(f'{NAMESPACE}:complete', args=(backend,))
+        )
+    except MissingBackend as error:
+        raise Http404('Backend not found') from error
+
+    if hasattr(request.backend, 'aprefetch_access_token'):
+        await request.backend.aprefetch_access_token()
+
+    user = await request.auser()
+    return await sync_to_async(do_complete)(
+        request.backend,
+        _do_login,
+        *args,
+        user=user,
+        redirect_name=REDIRECT_FIELD_NAME,
+        request=request,
+        **kwargs
+    )
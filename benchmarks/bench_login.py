@@ -0,0 +1,148 @@
+"""
+Benchmark of complete logins through ``oauth2_urlpatterns``, against an in-process fake LMS.
+
+Each iteration drives a fresh browser through the login view, ``social:begin`` and ``social:complete`` (see
+``auth_backends.tests.fake_lms``), and records the latency and database queries of each step. Allocations are
+measured with tracemalloc in a separate, shorter pass. Three flows are measured: a new user, a returning user, and a
+returning user whose email changed at the provider. No network access is needed.
+
+Run from the repository root::
+
+    $ python benchmarks/bench_login.py --iterations 200 --latency 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+django.setup()
+
+# pylint: disable=wrong-import-position
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment  # noqa: E402
+
+from auth_backends.tests.fake_lms import FakeLMS, login  # noqa: E402
+from auth_backends.urls import oauth2_urlpatterns  # noqa: E402
+
+urlpatterns = oauth2_urlpatterns
+
+STEPS = ('login', 'begin', 'complete')
+
+
+class MeasuringClient(Client):
+    """ Test client recording the latency, queries and (optionally) peak allocations of each request. """
+
+    def __init__(self, measure_allocations=False, **defaults):
+        super().__init__(**defaults)
+        self.measure_allocations = measure_allocations
+        self.measurements = []
+
+    def request(self, **request):
+        if self.measure_allocations:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = super().request(**request)
+            elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline if self.measure_allocations else None
+        self.measurements.append((elapsed, len(queries), peak))
+        return response
+
+
+def new_user(lms, iteration):  # pylint: disable=unused-argument
+    """ A user logging in for the first time. """
+    return f'new{iteration}'
+
+
+def returning_user(lms, iteration):  # pylint: disable=unused-argument
+    """ A user logging in again, with unchanged claims. """
+    return 'returning'
+
+
+def changed_email(lms, iteration):
+    """ A user logging in again, whose email changed at the provider since the last login. """
+    lms.add_user('changing', email=f'changing{iteration}@example.com')
+    return 'changing'
+
+
+FLOWS = (('new user', new_user), ('returning user', returning_user), ('changed email', changed_email))
+
+
+def run(lms, flow, iterations, offset=0, measure_allocations=False):
+    """ Runs the flow, and returns the measurements of each step, keyed by step. """
+    results = {step: [] for step in STEPS}
+    for iteration in range(offset, offset + iterations):
+        client = MeasuringClient(measure_allocations=measure_allocations)
+        response = login(client, lms, flow(lms, iteration))
+        assert response.status_code == 302 and '_auth_user_id' in client.session, 'The login failed'
+        for step, measurement in zip(STEPS, client.measurements):
+            results[step].append(measurement)
+    return results
+
+
+def percentiles(values):
+    """ Returns the 50th, 95th and 99th percentiles of the values. """
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def report(name, results, allocations):
+    """ Prints the measurements of a flow. """
+    print(f'\n{name}')
+    print(f"{'step':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>9}")
+    for step in STEPS + ('total',):
+        if step == 'total':
+            latencies = [sum(values) for values in zip(*([m[0] for m in results[s]] for s in STEPS))]
+            queries = sum(statistics.mean(m[1] for m in results[s]) for s in STEPS)
+            peak = max(statistics.mean(m[2] for m in allocations[s]) for s in STEPS)
+        else:
+            latencies = [m[0] for m in results[step]]
+            queries = statistics.mean(m[1] for m in results[step])
+            peak = statistics.mean(m[2] for m in allocations[step])
+        p50, p95, p99 = (value * 1000 for value in percentiles(latencies))
+        print(f'{step:>10} {p50:9.2f} {p95:9.2f} {p99:9.2f} {queries:8.1f} {peak / 1024:9.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200, help='Number of logins measured per flow.')
+    parser.add_argument('--allocation-iterations', type=int, default=20, help='Number of logins traced per flow.')
+    parser.add_argument('--latency', type=float, default=0, help='Latency of the provider, in milliseconds.')
+    parser.add_argument('--optimized-pipeline', action='store_true', help='Use the optimized pipeline.')
+    parser.add_argument('--verify-signature', action='store_true', help='Verify access tokens against the JWKS.')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    lms = FakeLMS(latency=args.latency / 1000)
+    settings = lms.settings(
+        SOCIAL_AUTH_OPTIMIZED_PIPELINE=args.optimized_pipeline,
+        SOCIAL_AUTH_EDX_OAUTH2_VERIFY_SIGNATURE=args.verify_signature,
+    )
+
+    print(f'{args.iterations} logins per flow, provider latency {args.latency:g} ms')
+    with override_settings(ROOT_URLCONF=__name__, **settings), lms.installed():
+        for name, flow in FLOWS:
+            # Warm up (e.g. the JWKS and the compiled URL patterns), and create the returning users.
+            run(lms, flow, 1, offset=-1)
+            results = run(lms, flow, args.iterations)
+            tracemalloc.start()
+            try:
+                allocations = run(
+                    lms, flow, args.allocation_iterations, offset=args.iterations, measure_allocations=True
+                )
+            finally:
+                tracemalloc.stop()
+            report(name, results, allocations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Microbenchmark comparing the claims extraction done by ``EdXOAuth2.user_data`` with a full PyJWT decode.
+
+Run from the repository root::
+
+    $ python benchmarks/bench_user_data.py
+"""
+import os
+import sys
+import timeit
+
+import django
+import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+django.setup()
+
+# pylint: disable=wrong-import-position
+from auth_backends.backends import EdXOAuth2  # noqa: E402
+from auth_backends.claims import decode_jwt_payload  # noqa: E402
+
+NUMBER = 20000
+
+
+def large_lms_token():
+    """ Returns a JWT resembling the access tokens issued by the LMS to a user with many roles and filters. """
+    payload = {
+        'iss': 'https://courses.example.com/oauth2',
+        'aud': 'openedx',
+        'iat': 1700000000,
+        'exp': 1700003600,
+        'sub': 'e3bfe0e4e7c6693efba9c3a93ee7f31b',
+        'preferred_username': 'jsmith',
+        'email': 'jsmith@example.com',
+        'email_verified': True,
+        'name': 'Joe Smith',
+        'given_name': 'Joe',
+        'family_name': 'Smith',
+        'locale': 'en_US',
+        'user_id': 12345,
+        'administrator': False,
+        'superuser': False,
+        'version': '1.2.0',
+        'is_restricted': False,
+        'grant_type': 'authorization_code',
+        'scopes': ['read', 'write', 'email', 'profile', 'user_id'],
+        'filters': [f'content_org:Org{i}X' for i in range(50)],
+        'roles': [f'enterprise_learner:{i:032x}' for i in range(50)],
+    }
+    return jwt.encode(payload, 'benchmark-secret-benchmark-secret', algorithm='HS256')
+
+
+def pyjwt_user_data(token):
+    """ The extraction previously done by ``EdXOAuth2.user_data``. """
+    decoded = jwt.decode(token, algorithms=['HS256'], options={'verify_signature': False})
+    keys = list(EdXOAuth2.CLAIMS_TO_DETAILS_KEY_MAP.keys()) + ['administrator', 'superuser']
+    return {key: decoded[key] for key in keys if key in decoded}
+
+
+def fast_user_data(token):
+    """ The extraction done by ``EdXOAuth2.user_data`` when signature verification is disabled. """
+    decoded = decode_jwt_payload(token)
+    return {key: decoded[key] for key in EdXOAuth2.get_claims_mapping().claims if key in decoded}
+
+
+def main():
+    token = large_lms_token()
+    assert pyjwt_user_data(token) == fast_user_data(token)
+
+    print(f'Token size: {len(token)} bytes, {NUMBER} iterations (best of 5)')
+    results = {}
+    for name, func in (('jwt.decode', pyjwt_user_data), ('decode_jwt_payload', fast_user_data)):
+        best = min(timeit.repeat(lambda func=func: func(token), number=NUMBER, repeat=5))
+        results[name] = best
+        print(f'{name:>20}: {best / NUMBER * 1e6:8.2f} us/call')
+    print(f'{"speedup":>20}: {results["jwt.decode"] / results["decode_jwt_payload"]:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
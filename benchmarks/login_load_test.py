@@ -0,0 +1,81 @@
+"""
+Load test of complete logins, measuring how many logins per second a service sustains.
+
+Concurrent simulated users, in threads and optionally in several processes, are run through complete logins against
+the in-process fake LMS (see ``auth_backends.tests.loadtest``), with the service's own settings, pipeline, session
+engine and database. Throughput, latency percentiles, and the lock and integrity errors raised by the database are
+reported.
+
+The simulated users are real users of the configured database, so run the load test against a test environment.
+``--cleanup`` deletes the users created by the run, and only those.
+
+Run from the repository root, with the settings of the service (``test_settings`` by default)::
+
+    $ DJANGO_SETTINGS_MODULE=myservice.settings python benchmarks/login_load_test.py --users 20 --processes 4 --cleanup
+"""
+import argparse
+import os
+import sys
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+django.setup()
+
+# pylint: disable=wrong-import-position
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+from auth_backends.tests.loadtest import run_load_test  # noqa: E402
+from auth_backends.urls import oauth2_urlpatterns  # noqa: E402
+
+# Used when the settings have no URLconf, e.g. test_settings.
+urlpatterns = oauth2_urlpatterns
+
+
+def main():
+    """ Runs the load test, and prints its measurements. """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10, help='Number of concurrent simulated users per process.')
+    parser.add_argument('--logins', type=int, default=5, help='Number of logins of each simulated user.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of worker processes.')
+    parser.add_argument('--latency', type=float, default=0, help='Latency of the provider, in milliseconds.')
+    parser.add_argument('--prefix', default='loadtest-', help='Prefix of the usernames of the simulated users.')
+    parser.add_argument('--cleanup', action='store_true', help='Delete the users created by the load test afterwards.')
+    parser.add_argument(
+        '--test-database', action='store_true', help='Run against a new test database, rather than the configured one.'
+    )
+    args = parser.parse_args()
+    if not args.prefix.strip():
+        parser.error('--prefix must not be blank.')
+
+    if args.test_database:
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+    with override_settings(ROOT_URLCONF=getattr(settings, 'ROOT_URLCONF', None) or __name__):
+        result = run_load_test(
+            users=args.users,
+            logins=args.logins,
+            processes=args.processes,
+            latency=args.latency / 1000,
+            prefix=args.prefix,
+            cleanup=args.cleanup,
+        )
+    counters = result.counters
+    print(
+        f"{len(result.latencies)} logins ({result.failures} failed) in {result.elapsed:.1f}s: "
+        f"{result.throughput:.1f} logins/s\n"
+        f"Latency: p50 {result.percentile(50) * 1000:.1f} ms, p95 {result.percentile(95) * 1000:.1f} ms, "
+        f"p99 {result.percentile(99) * 1000:.1f} ms, max {max(result.latencies, default=0) * 1000:.1f} ms\n"
+        f"Database: {counters['queries']} queries ({counters['query_seconds']:.1f}s), "
+        f"{counters['lock_errors']} lock errors, {counters['integrity_errors']} integrity errors"
+    )
+    if args.cleanup:
+        print(f'Deleted {len(result.created_user_ids)} simulated users.')
+
+
+if __name__ == '__main__':
+    main()
@@ -142,4 +142,7 @@ setup(
     license='AGPL',
     packages=find_packages(),
     install_requires=load_requirements('requirements/base.in'),
+    extras_require={
+        'async': load_requirements('requirements/async.in'),
+    },
 )